@@ -0,0 +1,73 @@
+# activity_buffer.py
+import threading
+
+
+class ActivityBuffer:
+    """Буфер секунд активности с подменой на время сброса (double buffer).
+
+    Сэмплер добавляет секунды через add(), сброс забирает весь накопленный
+    словарь через swap() — под блокировкой он заменяется пустым, так что
+    замеры, пришедшие во время записи в БД, попадают уже в новый словарь и
+    не теряются. Если запись не удалась, restore() возвращает снятые данные.
+
+    С журналом (ActivityJournal) каждый замер сначала дописывается в журнал, и
+    только потом попадает в словарь; swap() запоминает номер последней записи
+    журнала, вошедшей в снимок, — его и нужно сохранить как контрольную точку.
+    """
+
+    def __init__(self, journal=None):
+        self.journal = journal
+        self._lock = threading.Lock()
+        self._data = {}  # (user_id, app_name, activity_date) -> seconds
+
+    def add(self, key, seconds):
+        with self._lock:
+            if self.journal is not None:
+                self.journal.append([(key[0], key[1], key[2], seconds)])
+            self._data[key] = self._data.get(key, 0) + seconds
+
+    def swap(self):
+        """Забирает накопленное и ставит на его место пустой словарь.
+
+        Возвращает (снимок, seq журнала на момент подмены или None)
+        """
+        with self._lock:
+            snapshot, self._data = self._data, {}
+            seq = self.journal.last_seq if self.journal is not None else None
+        return snapshot, seq
+
+    def restore(self, snapshot):
+        """Возвращает в буфер данные неудавшегося сброса (складывая с новыми)"""
+        if not snapshot:
+            return
+        with self._lock:
+            for key, seconds in snapshot.items():
+                self._data[key] = self._data.get(key, 0) + seconds
+
+    def flush(self, write):
+        """Сбрасывает буфер через write(rows, journal_seq).
+
+        rows — [(user_id, app_name, date, seconds)], journal_seq — контрольная
+        точка журнала для записи в той же транзакции (None без журнала).
+        Возвращает число записанных ключей. При исключении в write данные
+        возвращаются в буфер, исключение пробрасывается дальше.
+        """
+        snapshot, seq = self.swap()
+        if not snapshot:
+            return 0
+        try:
+            write([(u, a, d, s) for (u, a, d), s in snapshot.items()], seq)
+        except Exception:
+            self.restore(snapshot)
+            raise
+        if self.journal is not None:
+            self.journal.checkpoint(seq)
+        return len(snapshot)
+
+    def total_seconds(self):
+        with self._lock:
+            return sum(self._data.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,368 @@
+# activity_ingest.py
+import io
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+# Начиная с этого числа ключей строки грузятся через COPY во временную таблицу,
+# а не передаются массивами параметров
+COPY_THRESHOLD = 20000
+APP_CACHE_SIZE = 50000     # сколько имён приложений помнит кэш интернирования
+
+# Приложение в activity_monitoring и свёртках — id из словаря apps
+UPSERT_UNNEST_SQL = """
+    INSERT INTO activity_monitoring (user_id, app_id, total_seconds, activity_date)
+    SELECT t.user_id, t.app_id, t.total_seconds, t.activity_date
+    FROM unnest(%s::int[], %s::int[], %s::int[], %s::date[])
+         AS t(user_id, app_id, total_seconds, activity_date)
+    ON CONFLICT (user_id, app_id, activity_date)
+    DO UPDATE SET total_seconds = activity_monitoring.total_seconds + EXCLUDED.total_seconds;
+"""
+
+UPSERT_ROW_SQL = """
+    INSERT INTO activity_monitoring (user_id, app_id, total_seconds, activity_date)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (user_id, app_id, activity_date)
+    DO UPDATE SET total_seconds = activity_monitoring.total_seconds + EXCLUDED.total_seconds;
+"""
+
+
+# Свёртки activity_monitoring обновляются в той же транзакции, что и сама
+# таблица: итоги пользователя по дням и по приложениям за неделю и месяц
+ROLLUP_UPSERT_SQL = """
+    INSERT INTO {table} (user_id, app_id, {period}, total_seconds)
+    SELECT * FROM unnest(%s::int[], %s::int[], %s::date[], %s::bigint[])
+    ON CONFLICT (user_id, {period}, app_id)
+    DO UPDATE SET total_seconds = {table}.total_seconds + EXCLUDED.total_seconds;
+"""
+
+DAILY_UPSERT_SQL = """
+    INSERT INTO activity_daily_totals (user_id, activity_date, total_seconds)
+    SELECT * FROM unnest(%s::int[], %s::date[], %s::bigint[])
+    ON CONFLICT (user_id, activity_date)
+    DO UPDATE SET total_seconds = activity_daily_totals.total_seconds + EXCLUDED.total_seconds;
+"""
+
+
+class AppDictionary:
+    """Кэш интернирования имён приложений: имя -> apps.id (LRU на max_size имён).
+
+    Запоминаются только id, уже закоммиченные в apps: имя, добавленное в
+    текущей транзакции, после её отката исчезнет из apps, поэтому в кэш оно
+    попадает при следующей встрече.
+    """
+
+    def __init__(self, max_size=APP_CACHE_SIZE):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, names):
+        """({имя: id} из кэша, [имена, которых в кэше нет])"""
+        found, missing = {}, []
+        with self._lock:
+            for name in names:
+                app_id = self._ids.get(name)
+                if app_id is None:
+                    missing.append(name)
+                else:
+                    self._ids.move_to_end(name)
+                    found[name] = app_id
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def remember(self, mapping):
+        with self._lock:
+            for name, app_id in mapping.items():
+                self._ids[name] = app_id
+                self._ids.move_to_end(name)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+# Свой словарь на каждую БД: id одного имени в разных базах не совпадают
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+
+def app_dictionary(conn):
+    with _dictionaries_lock:
+        apps = _dictionaries.get(conn.dsn)
+        if apps is None:
+            apps = _dictionaries[conn.dsn] = AppDictionary()
+        return apps
+
+
+def intern_apps(cur, names):
+    """{имя: apps.id} для всех names; новые имена добавляются в apps.
+
+    В обычной работе все имена уже в кэше и запросов нет вовсе.
+    """
+    apps = app_dictionary(cur.connection)
+    found, missing = apps.cached(set(names))
+    if not missing:
+        return found
+    missing.sort()
+    cur.execute("""
+        INSERT INTO apps (name)
+        SELECT unnest(%s::text[])
+        ON CONFLICT (name) DO NOTHING
+        RETURNING name, id;
+    """, (missing,))
+    inserted = dict(cur.fetchall())
+    existing = [name for name in missing if name not in inserted]
+    if existing:
+        cur.execute("SELECT name, id FROM apps WHERE name = ANY(%s)", (existing,))
+        committed = dict(cur.fetchall())
+        apps.remember(committed)
+        found.update(committed)
+    found.update(inserted)
+    return found
+
+
+def to_app_ids(merged, app_ids):
+    """Ключи (user_id, имя, дата) -> (user_id, app_id, дата)"""
+    return {(user_id, app_ids[app_name], activity_date): seconds
+            for (user_id, app_name, activity_date), seconds in merged.items()}
+
+
+def week_start(day):
+    """Понедельник недели (как date_trunc('week') в PostgreSQL)"""
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+# (таблица, столбец начала периода, функция начала периода)
+ROLLUPS = (
+    ("activity_weekly", "week_start", week_start),
+    ("activity_monthly", "month_start", month_start),
+)
+
+
+def rollup_retention(cutoff):
+    """[(таблица свёртки, столбец, первое хранимое значение)] для срока хранения.
+
+    Период свёртки удаляется, только когда он целиком старше cutoff: день —
+    раньше cutoff, неделя и месяц — начавшиеся раньше периода, в который
+    попадает cutoff. Правило одно для PostgreSQL и SQLite.
+    """
+    return [("activity_daily_totals", "activity_date", cutoff)] + [
+        (table, column, period_start(cutoff)) for table, column, period_start in ROLLUPS
+    ]
+
+
+def rollup_deltas(merged, period_start):
+    """{(user_id, app_id, начало периода): секунды} из результата to_app_ids"""
+    deltas = {}
+    for (user_id, app_id, activity_date), seconds in merged.items():
+        key = (user_id, app_id, period_start(activity_date))
+        deltas[key] = deltas.get(key, 0) + seconds
+    return deltas
+
+
+def daily_deltas(merged):
+    """{(user_id, activity_date): секунды} из результата to_app_ids"""
+    deltas = {}
+    for (user_id, _, activity_date), seconds in merged.items():
+        key = (user_id, activity_date)
+        deltas[key] = deltas.get(key, 0) + seconds
+    return deltas
+
+
+def rollup_segments(start_date, end_date):
+    """Разбивает [start_date, end_date] на целые месяцы, целые недели и отдельные дни.
+
+    Итоги периода складываются из свёрток по месяцам и неделям и сырых строк
+    только за оставшиеся дни (не больше 12), поэтому стоимость запроса не
+    растёт с длиной периода и историей. Возвращает (месяцы, недели, дни).
+    """
+    months, weeks, days = [], [], []
+    day = start_date
+    while day <= end_date:
+        next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+        if day.day == 1 and next_month - timedelta(days=1) <= end_date:
+            months.append(day)
+            day = next_month
+        elif day.weekday() == 0 and day + timedelta(days=6) <= end_date:
+            weeks.append(day)
+            day += timedelta(days=7)
+        else:
+            days.append(day)
+            day += timedelta(days=1)
+    return months, weeks, days
+
+
+def upsert_rollups(cur, merged):
+    """Добавляет секунды merged (to_app_ids) в свёртки; вызывается в транзакции upsert"""
+    if not merged:
+        return
+    for table, column, period_start in ROLLUPS:
+        deltas = rollup_deltas(merged, period_start)
+        keys = sorted(deltas)
+        cur.execute(ROLLUP_UPSERT_SQL.format(table=table, period=column), (
+            [k[0] for k in keys],
+            [k[1] for k in keys],
+            [k[2] for k in keys],
+            [deltas[k] for k in keys],
+        ))
+    deltas = daily_deltas(merged)
+    keys = sorted(deltas)
+    cur.execute(DAILY_UPSERT_SQL, ([k[0] for k in keys], [k[1] for k in keys], [deltas[k] for k in keys]))
+
+
+def coalesce_rows(rows):
+    """Складывает секунды строк с одинаковым ключом (user_id, app_name, activity_date).
+
+    rows — итерируемое из кортежей (user_id, app_name, activity_date, seconds).
+    Возвращает словарь {ключ: секунды}. Нужен потому, что один
+    INSERT ... ON CONFLICT не может обновить одну и ту же строку дважды.
+    """
+    merged = {}
+    for user_id, app_name, activity_date, seconds in rows:
+        if not seconds:
+            continue
+        key = (user_id, app_name, activity_date)
+        merged[key] = merged.get(key, 0) + int(seconds)
+    return merged
+
+
+def upsert_activity(cur, rows):
+    """Добавляет секунды активности в activity_monitoring за один проход.
+
+    Итоговые значения те же, что при построчном upsert: при конфликте
+    total_seconds увеличивается на переданное значение. Свёртки обновляются
+    тем же вызовом. Коммит — на вызывающей стороне. Возвращает число
+    записанных ключей.
+    """
+    merged = coalesce_rows(rows)
+    if not merged:
+        return 0
+    merged = to_app_ids(merged, intern_apps(cur, {key[1] for key in merged}))
+
+    # Сортировка ключей даёт одинаковый порядок блокировок у параллельных
+    # писателей и исключает взаимные блокировки
+    keys = sorted(merged)
+    if len(keys) >= COPY_THRESHOLD:
+        _upsert_via_copy(cur, keys, merged)
+    else:
+        cur.execute(UPSERT_UNNEST_SQL, (
+            [k[0] for k in keys],
+            [k[1] for k in keys],
+            [merged[k] for k in keys],
+            [k[2] for k in keys],
+        ))
+    upsert_rollups(cur, merged)
+    return len(keys)
+
+
+def upsert_activity_per_row(cur, rows):
+    """Построчный вариант (один запрос на ключ) — для сравнения в бенчмарке"""
+    merged = coalesce_rows(rows)
+    if not merged:
+        return 0
+    merged = to_app_ids(merged, intern_apps(cur, {key[1] for key in merged}))
+    for (user_id, app_id, activity_date), seconds in merged.items():
+        cur.execute(UPSERT_ROW_SQL, (user_id, app_id, seconds, activity_date))
+    upsert_rollups(cur, merged)
+    return len(merged)
+
+
+def _upsert_via_copy(cur, keys, merged):
+    """COPY во временную таблицу и один INSERT ... SELECT ... ON CONFLICT"""
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS activity_staging (
+            user_id INT NOT NULL,
+            app_id INT NOT NULL,
+            total_seconds INT NOT NULL,
+            activity_date DATE NOT NULL
+        ) ON COMMIT DELETE ROWS;
+    """)
+
+    buf = io.StringIO()
+    for user_id, app_id, activity_date in keys:
+        seconds = merged[(user_id, app_id, activity_date)]
+        buf.write(f"{user_id}\t{app_id}\t{seconds}\t{activity_date.isoformat()}\n")
+    buf.seek(0)
+    cur.copy_expert(
+        "COPY activity_staging (user_id, app_id, total_seconds, activity_date) FROM STDIN",
+        buf
+    )
+
+    cur.execute("""
+        INSERT INTO activity_monitoring (user_id, app_id, total_seconds, activity_date)
+        SELECT user_id, app_id, SUM(total_seconds), activity_date
+        FROM activity_staging
+        GROUP BY user_id, app_id, activity_date
+        ORDER BY user_id, app_id, activity_date
+        ON CONFLICT (user_id, app_id, activity_date)
+        DO UPDATE SET total_seconds = activity_monitoring.total_seconds + EXCLUDED.total_seconds;
+    """)
+    # Таблица живёт до конца сессии; при переиспользовании соединения из пула
+    # строки уже очищены ON COMMIT DELETE ROWS, но на случай autocommit чистим явно
+    cur.execute("TRUNCATE activity_staging")
+
+
+def insert_focus_intervals(cur, intervals):
+    """Пишет интервалы фокуса [(user_id, app_name, started, ended)] (unix-время) одним запросом"""
+    if not intervals:
+        return 0
+    user_ids, app_names, started, ended = (list(col) for col in zip(*intervals))
+    cur.execute("""
+        INSERT INTO focus_intervals (user_id, app_name, started_at, ended_at)
+        SELECT t.user_id, t.app_name, to_timestamp(t.started), to_timestamp(t.ended)
+        FROM unnest(%s::int[], %s::text[], %s::float8[], %s::float8[])
+             AS t(user_id, app_name, started, ended);
+    """, (user_ids, app_names, started, ended))
+    return len(intervals)
+
+
+def claim_batches(cur, batch_keys):
+    """Отмечает пакеты [(user_id, batch_id)] как принятые (ingest_batches).
+
+    Возвращает множество ключей, которых раньше не было: только их строки
+    можно записывать, остальное — повторная доставка того же пакета.
+    """
+    if not batch_keys:
+        return set()
+    user_ids, batch_ids = (list(col) for col in zip(*sorted(batch_keys)))
+    cur.execute("""
+        INSERT INTO ingest_batches (user_id, batch_id)
+        SELECT * FROM unnest(%s::int[], %s::text[])
+        ON CONFLICT DO NOTHING
+        RETURNING user_id, batch_id;
+    """, (user_ids, batch_ids))
+    return {(user_id, batch_id) for user_id, batch_id in cur.fetchall()}
+
+
+def upsert_batches(cur, batches):
+    """Пишет пакеты [(ключ пакета или None, rows)] с учётом идемпотентности.
+
+    Строки пакетов без ключа пишутся всегда, с ключом — только если пакет
+    ещё не принимался. Возвращает (число записанных ключей, число дублей).
+    """
+    rows = []
+    keyed = {}
+    for batch_key, batch_rows in batches:
+        if batch_key is None:
+            rows.extend(batch_rows)
+        else:
+            keyed.setdefault(tuple(batch_key), batch_rows)
+    fresh = claim_batches(cur, list(keyed))
+    for batch_key in fresh:
+        rows.extend(keyed[batch_key])
+    return upsert_activity(cur, rows), len(keyed) - len(fresh)
+
+
+def prune_batches(cur, max_age_days):
+    """Забывает ключи пакетов старше max_age_days (столько клиент их не повторяет)"""
+    cur.execute("DELETE FROM ingest_batches WHERE received_at < NOW() - %s * INTERVAL '1 day'", (max_age_days,))
+    return cur.rowcount
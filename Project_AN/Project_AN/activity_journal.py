@@ -0,0 +1,224 @@
+# activity_journal.py
+import json
+import os
+import threading
+import time
+from datetime import date
+
+
+# ================= НАСТРОЙКИ ЖУРНАЛА =================
+JOURNAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "journal")
+SEGMENT_MAX_BYTES = 1024 * 1024   # после этого размера начинаем новый сегмент
+FSYNC_INTERVAL = 1.0              # групповой fsync не чаще раза в секунду
+
+
+class ActivityJournal:
+    """Локальный append-only журнал замеров активности (write-ahead log).
+
+    Каждая запись получает возрастающий номер seq и дописывается строкой JSON
+    в текущий сегмент journal/<name>/<первый seq>.log. На диск записи
+    сбрасываются группой: фоновый поток делает fsync раз в FSYNC_INTERVAL,
+    поэтому append() почти ничего не стоит циклу замеров.
+
+    После успешной записи в БД вызывается checkpoint(seq) — сегменты,
+    целиком покрытые контрольной точкой, удаляются (компактация). При старте
+    read_since(seq) отдаёт всё, что не успело попасть в БД.
+    """
+
+    def __init__(self, name, directory=JOURNAL_DIR, segment_max_bytes=SEGMENT_MAX_BYTES,
+                 fsync_interval=FSYNC_INTERVAL):
+        self.name = name
+        self.directory = os.path.join(directory, name)
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_interval = fsync_interval
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._dirty = False
+        self._last_seq = self._scan_last_seq()
+        self._open_segment()
+
+        self._stop = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop, name=f"journal_{name}_fsync", daemon=True)
+        self._syncer.start()
+
+    # ---------- сегменты ----------
+    def _segments(self):
+        """[(first_seq, path)] по возрастанию"""
+        result = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".log"):
+                try:
+                    result.append((int(filename[:-4]), os.path.join(self.directory, filename)))
+                except ValueError:
+                    continue
+        return sorted(result)
+
+    def _scan_last_seq(self):
+        last_seq = 0
+        segments = self._segments()
+        if segments:
+            first_seq, path = segments[-1]
+            last_seq = first_seq - 1
+            for entry in self._read_segment(path):
+                last_seq = max(last_seq, entry["seq"])
+        return last_seq
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"{self._last_seq + 1:020d}.log")
+        self._file = open(path, "a", encoding="utf-8")
+        self._segment_path = path
+
+    def _rotate(self):
+        self._sync_locked()
+        self._file.close()
+        self._open_segment()
+
+    @staticmethod
+    def _read_segment(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Оборванная последняя строка после сбоя — пропускаем
+                    continue
+
+    # ---------- запись ----------
+    def append(self, rows, batch=None):
+        """Дописывает строки (user_id, app_name, activity_date, seconds). Возвращает seq.
+
+        batch — ключ пакета (user_id, batch_id) для идемпотентной записи.
+        """
+        with self._lock:
+            self._last_seq += 1
+            entry = {
+                "seq": self._last_seq,
+                "rows": [[u, a, d.isoformat(), s] for u, a, d, s in rows],
+            }
+            if batch is not None:
+                entry["batch"] = list(batch)
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._dirty = True
+            if self._file.tell() >= self.segment_max_bytes:
+                self._rotate()
+            return self._last_seq
+
+    @property
+    def last_seq(self):
+        with self._lock:
+            return self._last_seq
+
+    def _sync_locked(self):
+        if self._dirty and self._file and not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def sync(self):
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_loop(self):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self.sync()
+            except OSError as e:
+                print(f"❌ Ошибка fsync журнала {self.name}: {e}")
+
+    def ensure_seq_after(self, seq):
+        """Гарантирует, что новые записи получат номера > seq (журнал удалён вручную и т.п.)"""
+        with self._lock:
+            if self._last_seq < seq:
+                self._last_seq = seq
+                self._rotate()
+
+    # ---------- чтение и компактация ----------
+    def read_batches_since(self, seq, upto=None):
+        """Записи с номером в (seq, upto] как [(ключ пакета или None, rows)]. Возвращает (batches, max_seq)"""
+        self.sync()
+        batches = []
+        max_seq = seq
+        for _, path in self._segments():
+            for entry in self._read_segment(path):
+                if entry["seq"] <= seq or (upto is not None and entry["seq"] > upto):
+                    continue
+                max_seq = max(max_seq, entry["seq"])
+                rows = [(u, a, date.fromisoformat(d), s) for u, a, d, s in entry["rows"]]
+                batch = tuple(entry["batch"]) if entry.get("batch") else None
+                batches.append((batch, rows))
+        return batches, max_seq
+
+    def read_since(self, seq, upto=None):
+        """Все строки с номером в (seq, upto]. Возвращает (rows, max_seq)"""
+        batches, max_seq = self.read_batches_since(seq, upto)
+        return [row for _, rows in batches for row in rows], max_seq
+
+    def checkpoint(self, seq):
+        """Всё до seq включительно записано в БД: удаляем покрытые сегменты"""
+        with self._lock:
+            segments = self._segments()
+            for (first_seq, path), (next_first_seq, _) in zip(segments, segments[1:]):
+                if path == self._segment_path:
+                    break
+                if next_first_seq - 1 <= seq:
+                    os.remove(path)
+            # Активный сегмент целиком покрыт — начинаем новый, старый удаляем
+            if seq >= self._last_seq and self._file.tell() > 0:
+                old_path = self._segment_path
+                self._rotate()
+                os.remove(old_path)
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self._sync_locked()
+            self._file.close()
+
+
+# ================= КОНТРОЛЬНЫЕ ТОЧКИ В БД =================
+# Номер последней применённой записи журнала хранится в БД и обновляется в той
+# же транзакции, что и upsert активности, — повторное воспроизведение журнала
+# не удваивает секунды.
+
+def get_db_checkpoint(cur, journal_name):
+    cur.execute("SELECT last_seq FROM activity_journal_checkpoint WHERE journal_name = %s", (journal_name,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def set_db_checkpoint(cur, journal_name, seq):
+    cur.execute("""
+        INSERT INTO activity_journal_checkpoint (journal_name, last_seq, updated_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (journal_name)
+        DO UPDATE SET last_seq = GREATEST(activity_journal_checkpoint.last_seq, EXCLUDED.last_seq),
+                      updated_at = NOW();
+    """, (journal_name, seq))
+
+
+def replay(storage, journal, upto):
+    """Дописывает в activity_monitoring записи журнала, не дошедшие до БД.
+
+    upto — последний seq, записанный до старта процесса: более новые записи
+    ещё лежат в памяти и будут записаны обычным сбросом. Возвращает число строк.
+    """
+    checkpoint = storage.journal_checkpoint(journal.name)
+    batches, max_seq = journal.read_batches_since(checkpoint, upto)
+    rows = [row for _, batch_rows in batches for row in batch_rows]
+    if batches or max_seq > checkpoint:
+        # Пакеты с ключом, уже принятые в БД, повторно не пишутся
+        storage.write_activity(batches, checkpoint=(journal.name, max_seq) if max_seq > checkpoint else None)
+    journal.ensure_seq_after(checkpoint)
+    journal.checkpoint(max_seq)
+    return len(rows)
+
+
+def wait_for_db(storage, attempts=5, delay=2.0):
+    """Ограниченное число попыток дождаться БД (с нарастающей паузой)"""
+    for attempt in range(attempts):
+        if storage.ping():
+            return True
+        time.sleep(delay * (attempt + 1))
+    return False
@@ -0,0 +1,138 @@
+# activity_partitions.py
+# Помесячные секции activity_monitoring (PARTITION BY RANGE (activity_date)).
+# Будущие секции создаются заранее, секции старше срока хранения отсоединяются
+# и удаляются целиком — без построчного DELETE и раздувания индексов.
+# Вызывается при старте (db.init_db) и фоновой задачей main.run_activity_maintenance.
+import re
+from datetime import date
+
+import activity_ingest
+
+# ================= НАСТРОЙКИ СЕКЦИЙ =================
+PARENT_TABLE = "activity_monitoring"
+DEFAULT_PARTITION = "activity_monitoring_default"
+MONTHS_AHEAD = 2              # сколько будущих месяцев держать созданными
+RETENTION_DAYS = 31           # данные старше удаляются (детализация показывает до 30 дней)
+MAINTENANCE_INTERVAL = 6 * 3600
+LOCK_TIMEOUT = "5s"           # DDL не ждёт блокировку дольше; повтор — в следующий запуск
+
+_PARTITION_RE = re.compile(rf"^{PARENT_TABLE}_(\d{{4}})_(\d{{2}})$")
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARENT_TABLE}_{month:%Y_%m}"
+
+
+def list_partitions(cur):
+    """{первое число месяца: имя секции}; секция по умолчанию не входит"""
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (PARENT_TABLE,))
+    partitions = {}
+    for (name,) in cur.fetchall():
+        match = _PARTITION_RE.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def _create_partition(cur, month):
+    name = partition_name(month)
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    cur.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+    cur.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE activity_date >= %s AND activity_date < %s)",
+        (lower, upper))
+    if not cur.fetchone()[0]:
+        cur.execute(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+        return
+    # Строки месяца уже попали в секцию по умолчанию — переносим их в новую
+    cur.execute(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE activity_date >= %s AND activity_date < %s
+            RETURNING user_id, app_id, total_seconds, activity_date
+        )
+        INSERT INTO {name} (user_id, app_id, total_seconds, activity_date)
+        SELECT user_id, app_id, total_seconds, activity_date FROM moved
+    """, (lower, upper))
+    cur.execute(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+
+
+def ensure_partitions(conn, today=None, months_ahead=MONTHS_AHEAD):
+    """Создаёт секции текущего и months_ahead следующих месяцев. Возвращает имена созданных.
+
+    Каждая секция — отдельной транзакцией: неудача (lock_timeout) не отменяет
+    уже созданные, недостающие досоздаст следующий запуск.
+    """
+    current = (today or date.today()).replace(day=1)
+    cur = conn.cursor()
+    created = []
+    try:
+        existing = list_partitions(cur)
+        conn.commit()
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            if month in existing:
+                continue
+            try:
+                _create_partition(cur, month)
+                conn.commit()
+                created.append(partition_name(month))
+            except Exception as e:
+                conn.rollback()
+                print(f"⚠️ Не удалось создать секцию {partition_name(month)}: {e}")
+    finally:
+        cur.close()
+    return created
+
+
+def retention_cutoff(today=None, retention_days=RETENTION_DAYS):
+    """Первая хранимая дата: строки activity_date раньше неё удаляются"""
+    return date.fromordinal((today or date.today()).toordinal() - retention_days)
+
+
+def drop_expired(conn, today=None, retention_days=RETENTION_DAYS):
+    """Отсоединяет и удаляет секции, целиком старше срока хранения.
+
+    Возвращает (имена удалённых секций, строк удалено из секции по умолчанию).
+    """
+    cutoff = retention_cutoff(today, retention_days)
+    cur = conn.cursor()
+    dropped = []
+    try:
+        partitions = list_partitions(cur)
+        conn.commit()
+        for month, name in sorted(partitions.items()):
+            if add_months(month, 1) > cutoff:
+                break
+            try:
+                cur.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+                cur.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+                cur.execute(f"DROP TABLE {name}")
+                conn.commit()
+                dropped.append(name)
+            except Exception as e:
+                conn.rollback()
+                print(f"⚠️ Не удалось удалить секцию {name}: {e}")
+
+        # В секцию по умолчанию попадают только строки вне созданных месяцев
+        # (поздняя доставка старого журнала) — их немного, удаляем построчно
+        cur.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE activity_date < %s", (cutoff,))
+        deleted = cur.rowcount
+        # Свёртки — за периоды, целиком старше срока хранения
+        for table, column, keep_from in activity_ingest.rollup_retention(cutoff):
+            cur.execute(f"DELETE FROM {table} WHERE {column} < %s", (keep_from,))
+        conn.commit()
+    finally:
+        cur.close()
+    return dropped, deleted
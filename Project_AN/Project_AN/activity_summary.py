@@ -0,0 +1,92 @@
+# activity_summary.py
+# Данные страницы детализации: итоги по приложениям за период, общий итог и
+# диапазон дат с данными — одним запросом (storage.activity_summary).
+# Результат запоминается по (user_id, период) на SUMMARY_TTL секунд, поэтому
+# переключение «Сегодня / 7 дней / 30 дней» туда и обратно идёт из памяти.
+# Запись новой активности пользователя (storage.write_activity в этом процессе:
+# очередь приёма mon) сразу сбрасывает его записи.
+import datetime
+import threading
+import time
+from collections import namedtuple
+
+import storage
+
+# ================= НАСТРОЙКИ =================
+SUMMARY_TTL = 30        # секунд; данные от других процессов видны не позже
+
+# Период -> (дней до сегодняшнего, подпись)
+PERIODS = {
+    "today": (0, "сегодня"),
+    "week": (6, "за последние 7 дней"),
+    "month": (29, "за последние 30 дней"),
+}
+DEFAULT_PERIOD = "month"
+
+Summary = namedtuple("Summary", "apps total_seconds start_date end_date min_date max_date period_text")
+
+
+class SummaryService:
+    """Сводки детализации с памятью на SUMMARY_TTL.
+
+    У каждого пользователя есть номер поколения: invalidate увеличивает его.
+    Сводка, прочитанная во время записи, в память не попадает, если поколение
+    за время запроса сменилось, — иначе она пережила бы сброс.
+    """
+
+    def __init__(self, storage_backend, ttl=SUMMARY_TTL, clock=time.monotonic):
+        self.storage = storage_backend
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = {}       # (user_id, период) -> (истекает, Summary)
+        self._generations = {}   # user_id -> номер поколения
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, period, refresh=False):
+        """Summary за период ("today" | "week" | "month"); refresh — мимо памяти"""
+        if period not in PERIODS:
+            period = DEFAULT_PERIOD
+        key = (user_id, period)
+        today = datetime.date.today()
+        with self._lock:
+            entry = self._entries.get(key)
+            # После полуночи «сегодня» другое — старая сводка не годится
+            if not refresh and entry is not None and entry[0] > self._clock() and entry[1].end_date == today:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generations.get(user_id, 0)
+
+        days, period_text = PERIODS[period]
+        start_date = today - datetime.timedelta(days=days)
+        apps, total_seconds, min_date, max_date = self.storage.activity_summary(user_id, start_date, today)
+        summary = Summary(apps, total_seconds, start_date, today, min_date, max_date, period_text)
+
+        with self._lock:
+            if self._generations.get(user_id, 0) == generation:
+                self._entries[key] = (self._clock() + self.ttl, summary)
+        return summary
+
+    def invalidate(self, user_ids):
+        """Забыть сводки пользователей (после записи их активности)"""
+        with self._lock:
+            for user_id in user_ids:
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+                for period in PERIODS:
+                    self._entries.pop((user_id, period), None)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    """Общий экземпляр: подписан на запись активности в storage"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SummaryService(storage.get_storage(caller="detalization"))
+            storage.add_activity_listener(_service.invalidate)
+        return _service
@@ -0,0 +1,206 @@
+# app_canonical.py
+# Канонизация имён приложений между замером и буфером активности.
+# Заголовок окна меняется с каждым документом, чатом и вкладкой; если писать
+# его как есть, каждое окно становится отдельным «приложением» — лишние строки,
+# upsert'ы и секции на графиках. Здесь заголовок сводится к устойчивому имени
+# по имени процесса и правилам, а домены расширения — к одному виду
+# (www.youtube.com -> youtube.com). Результаты запоминаются (LRU).
+#
+# Свои правила — JSON в APP_RULES_PATH (необязателен), дополняют встроенные:
+#   {"processes": {"winword": "Microsoft Word"},
+#    "rules": [{"process": ["javaw"], "title": "^Minecraft", "app": "Minecraft"}],
+#    "domain_aliases": {"youtu.be": "youtube.com"},
+#    "domain_prefixes": ["www.", "m."]}
+# Правила проверяются раньше встроенных, "app" может ссылаться на группы (\1).
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+
+import window_probe
+
+# ================= НАСТРОЙКИ =================
+APP_RULES_PATH = os.environ.get(
+    "APP_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "app_rules.json"))
+CACHE_SIZE = 4096              # заголовков и доменов в памяти
+MAX_NAME_LENGTH = 255          # как у имён сайтов в ingest_payload
+
+# Процесс -> приложение: имя процесса устойчивее заголовка
+DEFAULT_PROCESSES = {
+    "code": "Visual Studio Code",
+    "devenv": "Visual Studio",
+    "pycharm64": "PyCharm",
+    "idea64": "IntelliJ IDEA",
+    "winword": "Microsoft Word",
+    "excel": "Microsoft Excel",
+    "powerpnt": "Microsoft PowerPoint",
+    "outlook": "Outlook",
+    "onenote": "OneNote",
+    "ms-teams": "Microsoft Teams",
+    "teams": "Microsoft Teams",
+    "notepad": "Блокнот",
+    "notepad++": "Notepad++",
+    "explorer": "Проводник",
+    "taskmgr": "Диспетчер задач",
+    "windowsterminal": "Терминал",
+    "cmd": "Командная строка",
+    "powershell": "PowerShell",
+    "gnome-terminal-server": "Терминал",
+    "nautilus": "Файлы",
+    "soffice.bin": "LibreOffice",
+    "acrord32": "Adobe Acrobat",
+    "acrobat": "Adobe Acrobat",
+    "photoshop": "Photoshop",
+    "figma": "Figma",
+    "notion": "Notion",
+    "obsidian": "Obsidian",
+    "telegram": "Telegram",
+    "discord": "Discord",
+    "slack": "Slack",
+    "zoom": "Zoom",
+    "whatsapp": "WhatsApp",
+    "spotify": "Spotify",
+    "vlc": "VLC",
+    "obs64": "OBS Studio",
+    "steam": "Steam",
+    "steamwebhelper": "Steam",
+    "epicgameslauncher": "Epic Games",
+    "dota2": "Dota 2",
+    "cs2": "Counter-Strike 2",
+    "robloxplayerbeta": "Roblox",
+}
+
+# (процессы или None — любой, регулярное выражение по заголовку, приложение)
+DEFAULT_RULES = [
+    (("javaw", "java"), r"^Minecraft", "Minecraft"),
+    # Приложения UWP живут в одном процессе-хозяине: имя — в конце заголовка
+    (("applicationframehost",), r"(?:^|[-—|]\s)([^-—|]+?)\s*$", r"\1"),
+    # Без имени процесса (X11 без _NET_WM_PID, симуляция)
+    (None, r"Visual Studio Code$", "Visual Studio Code"),
+    (None, r"^Telegram(?:\s*\(\d+\))?$", "Telegram"),
+    (None, r"(?:^|\|\s)Discord$", "Discord"),
+]
+
+DEFAULT_DOMAIN_PREFIXES = ("www.", "m.", "mobile.")
+DEFAULT_DOMAIN_ALIASES = {
+    "youtu.be": "youtube.com",
+    "music.youtube.com": "youtube.com",
+    "web.telegram.org": "telegram.org",
+    "vk.ru": "vk.com",
+}
+
+# Счётчики непрочитанного: «(3) Входящие», «Telegram (12)»
+_COUNTER_RE = re.compile(r"^\(\d+\)\s*|\s*\(\d+\)$")
+# Разделители «документ - приложение» в заголовках
+_TITLE_SEPARATOR_RE = re.compile(r"\s+[-—–|]\s+")
+
+
+def load_rules(path=APP_RULES_PATH):
+    """Пользовательские правила из JSON; нет файла или он испорчен — пустые"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Правила приложений {path} не прочитаны: {e}")
+        return {}
+    if not isinstance(config, dict):
+        print(f"⚠️ Правила приложений {path}: ожидался объект")
+        return {}
+    return config
+
+
+class Canonicalizer:
+    """Устойчивые имена приложений и сайтов.
+
+    app_name(процесс, заголовок) и domain(имя сайта) запоминают результат,
+    поэтому повторные замеры одного окна обходятся поиском в словаре.
+    """
+
+    def __init__(self, config=None, cache_size=CACHE_SIZE):
+        config = config or {}
+        self.processes = {
+            window_probe.normalize_process_name(process): app
+            for process, app in {**DEFAULT_PROCESSES, **config.get("processes", {})}.items()
+        }
+        self.rules = []
+        for rule in config.get("rules", []):
+            try:
+                self._add_rule(rule.get("process"), rule["title"], rule["app"])
+            except (AttributeError, KeyError, TypeError, re.error) as e:
+                print(f"⚠️ Правило приложения {rule!r} пропущено: {e}")
+        for processes, pattern, app in DEFAULT_RULES:
+            self._add_rule(processes, pattern, app)
+        self.domain_prefixes = tuple(config.get("domain_prefixes", DEFAULT_DOMAIN_PREFIXES))
+        self.domain_aliases = {**DEFAULT_DOMAIN_ALIASES, **config.get("domain_aliases", {})}
+
+        self.app_name = lru_cache(maxsize=cache_size)(self._app_name)
+        self.domain = lru_cache(maxsize=cache_size)(self._domain)
+
+    def _add_rule(self, processes, pattern, app):
+        if isinstance(processes, str):
+            processes = (processes,)
+        processes = frozenset(window_probe.normalize_process_name(p) for p in processes) if processes else None
+        self.rules.append((processes, re.compile(pattern, re.IGNORECASE), str(app)))
+
+    def from_window(self, info):
+        """Как window_probe.app_name_from_window, но с каноническим именем: (app_name, это_браузер)"""
+        if info is None:
+            return None, False
+        if info.process_name in window_probe.BROWSER_PROCESSES:
+            return "Browser", True
+        return self.app_name(info.process_name, info.window_title), False
+
+    def _app_name(self, process_name, window_title):
+        title = (window_title or "").strip()
+        for processes, pattern, app in self.rules:
+            if processes is not None and process_name not in processes:
+                continue
+            match = pattern.search(title)
+            if match:
+                name = match.expand(app).strip()
+                if name:
+                    return name[:MAX_NAME_LENGTH]
+        if process_name in self.processes:
+            return self.processes[process_name]
+        if process_name:
+            return process_name.title()
+        # Процесс неизвестен: приложение обычно в конце заголовка
+        title = _COUNTER_RE.sub("", title)
+        parts = [part for part in _TITLE_SEPARATOR_RE.split(title) if part]
+        return parts[-1][:MAX_NAME_LENGTH] if parts else None
+
+    def _domain(self, site):
+        """Имя сайта от расширения -> домен: без схемы, порта, www./m. и точки в конце"""
+        domain = site.strip().lower()
+        if "://" in domain:
+            domain = domain.split("://", 1)[1]
+        domain = domain.split("/", 1)[0].rsplit("@", 1)[-1]
+        if not domain.startswith("["):  # IPv6 в скобках с портом не режем
+            domain = domain.split(":", 1)[0]
+        domain = domain.rstrip(".")
+        for prefix in self.domain_prefixes:
+            # Префикс снимается, только если остаётся домен с точкой: m.ru не трогаем
+            if domain.startswith(prefix) and "." in domain[len(prefix):]:
+                domain = domain[len(prefix):]
+                break
+        domain = self.domain_aliases.get(domain, domain)
+        return domain[:MAX_NAME_LENGTH] or site.strip()[:MAX_NAME_LENGTH]
+
+    def cache_info(self):
+        return {"app_name": self.app_name.cache_info()._asdict(), "domain": self.domain.cache_info()._asdict()}
+
+
+_canonicalizer = None
+_canonicalizer_lock = threading.Lock()
+
+
+def get_canonicalizer():
+    """Общий экземпляр с правилами из APP_RULES_PATH"""
+    global _canonicalizer
+    with _canonicalizer_lock:
+        if _canonicalizer is None:
+            _canonicalizer = Canonicalizer(load_rules())
+        return _canonicalizer
@@ -0,0 +1,170 @@
+# app_categories.py
+# Категории приложений для детализации, главной и контекста AI — в одном месте.
+# Ключевые слова всех категорий собраны в одно регулярное выражение: имя
+# проходится одним поиском, а не списком any() на каждую категорию. Результат по
+# имени запоминается (LRU). Свой выбор пользователя — категория для приложения
+# целиком: точное имя (без учёта регистра), как его показывает детализация
+# после app_canonical. Он хранится в БД (storage.get_app_categories), важнее
+# встроенных правил и не задевает других приложений с похожим именем.
+import re
+import threading
+from functools import lru_cache
+
+import storage
+
+# ================= НАСТРОЙКИ =================
+CACHE_SIZE = 2048      # имён приложений в памяти у одного набора правил
+
+# Порядок — приоритет: имя с ключевыми словами нескольких категорий
+# относится к первой из них. Браузер первым, как было в детализации:
+# «YouTube — Google Chrome» — время в браузере
+CATEGORIES = ("browser", "gaming", "social", "entertainment", "productivity")
+OTHER = "other"
+
+CATEGORY_LABELS = {
+    "gaming": "Игры",
+    "social": "Соцсети",
+    "entertainment": "Медиа",
+    "productivity": "Работа",
+    "browser": "Браузер",
+    OTHER: "Другие",
+}
+
+CATEGORY_ICONS = {
+    "gaming": "🎮",
+    "social": "💬",
+    "entertainment": "🎬",
+    "productivity": "💼",
+    "browser": "🌐",
+    OTHER: "📱",
+}
+
+# Подстроки имени приложения (без учёта регистра)
+DEFAULT_KEYWORDS = {
+    "gaming": ["game", "steam", "epic", "origin", "battle.net", "dota", "cs:", "counter-strike", "fortnite",
+               "minecraft", "roblox"],
+    "social": ["facebook", "instagram", "vk", "telegram", "whatsapp", "messenger", "twitter", "x.com", "tiktok",
+               "discord"],
+    "entertainment": ["youtube", "netflix", "spotify", "twitch", "disney+", "hbo", "prime video", "kinopoisk"],
+    "productivity": ["word", "excel", "powerpoint", "notion", "todo", "calendar", "outlook", "gmail", "slack",
+                     "teams", "zoom", "figma", "photoshop", "vscode", "visual studio", "pycharm", "intellij"],
+    "browser": ["browser", "chrome", "firefox", "safari", "edge", "opera", "brave", "yandex"],
+}
+
+
+class CategoryMatcher:
+    """Категория по имени приложения: одно регулярное выражение на все правила.
+
+    rules — [(ключевое слово, категория)] в порядке приоритета. В выражении
+    слова идут от длинных к коротким, так что в каждой позиции находится самое
+    длинное совпавшее; все короткие, совпавшие там же, — его префиксы, поэтому
+    у слова заранее посчитан лучший номер правила среди его префиксов.
+    Поиск повторяется со следующей позиции, итог — правило с наименьшим номером.
+
+    names — {имя приложения в нижнем регистре: категория}: точные совпадения,
+    проверяются раньше правил.
+    """
+
+    def __init__(self, rules, cache_size=CACHE_SIZE, names=None):
+        self._names = dict(names or {})
+        self._categories = [category for _, category in rules]
+        ranks = {}
+        for rank, (keyword, _) in enumerate(rules):
+            ranks.setdefault(keyword.lower(), rank)
+        self._ranks = {
+            keyword: min(rank for prefix, rank in ranks.items() if keyword.startswith(prefix))
+            for keyword in ranks
+        }
+        keywords = sorted(ranks, key=len, reverse=True)
+        self._pattern = re.compile("|".join(re.escape(keyword) for keyword in keywords)) if keywords else None
+        self.category = lru_cache(maxsize=cache_size)(self._category)
+
+    def _category(self, app_name):
+        if not app_name:
+            return OTHER
+        name = app_name.lower()
+        if name in self._names:
+            return self._names[name]
+        if self._pattern is None:
+            return OTHER
+        best = None
+        match = self._pattern.search(name)
+        while match is not None:
+            rank = self._ranks[match.group()]
+            if best is None or rank < best:
+                best = rank
+                if best == 0:
+                    break
+            match = self._pattern.search(name, match.start() + 1)
+        return OTHER if best is None else self._categories[best]
+
+    def categorize(self, app_names):
+        """{имя: категория} для итерируемого имён"""
+        return {app_name: self.category(app_name) for app_name in app_names}
+
+
+DEFAULT_RULES = [(keyword, category) for category in CATEGORIES for keyword in DEFAULT_KEYWORDS[category]]
+DEFAULT_MATCHER = CategoryMatcher(DEFAULT_RULES)
+
+_storage = None
+_user_matchers = {}    # user_id -> CategoryMatcher со своими категориями пользователя
+_lock = threading.Lock()
+
+
+def _rules_storage():
+    global _storage
+    if _storage is None:
+        _storage = storage.get_storage(caller="categories")
+    return _storage
+
+
+def matcher_for(user_id):
+    """Выбор пользователя (из БД, один раз) поверх встроенных правил"""
+    if user_id is None:
+        return DEFAULT_MATCHER
+    with _lock:
+        matcher = _user_matchers.get(user_id)
+    if matcher is not None:
+        return matcher
+    try:
+        names = {app_name: category for app_name, category in _rules_storage().get_app_categories(user_id)
+                 if category in CATEGORY_LABELS}
+    except Exception as e:
+        # Без БД — встроенные правила; в кэш не кладём, чтобы свои подхватились позже
+        print(f"⚠️ Не удалось загрузить категории пользователя: {e}")
+        return DEFAULT_MATCHER
+    matcher = CategoryMatcher(DEFAULT_RULES, names=names) if names else DEFAULT_MATCHER
+    with _lock:
+        _user_matchers[user_id] = matcher
+    return matcher
+
+
+def categorize(app_names, user_id=None):
+    """{имя приложения: категория} с учётом правил пользователя"""
+    return matcher_for(user_id).categorize(app_names)
+
+
+def category_of(app_name, user_id=None):
+    return matcher_for(user_id).category(app_name)
+
+
+def set_user_category(user_id, app_name, category):
+    """Своя категория приложения: только для этого имени, без учёта регистра"""
+    app_name = app_name.strip().lower()
+    if not app_name:
+        raise ValueError("Пустое имя приложения")
+    if category not in CATEGORY_LABELS:
+        raise ValueError(f"Неизвестная категория: {category}")
+    _rules_storage().set_app_category(user_id, app_name, category)
+    invalidate(user_id)
+
+
+def reset_user_category(user_id, app_name):
+    """Вернуть приложению категорию по встроенным правилам"""
+    _rules_storage().delete_app_category(user_id, app_name.strip().lower())
+    invalidate(user_id)
+
+
+def invalidate(user_id):
+    with _lock:
+        _user_matchers.pop(user_id, None)
@@ -1,29 +1,16 @@
-import psycopg2
 import time
 import bcrypt
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-from db import init_db  # твой файл с init_db
+from db import init_db
+import db_pool
 
 # ================= НАСТРОЙКИ =================
-MAIN_DB_CONFIG = {
-    "dbname": "Your_db_name",
-    "user": "postgres",
-    "password": "Your_password",
-    "host": "localhost",
-    "port": "5432"
-}
-BACKUP_DB_NAME = "postgres_backup"
+BACKUP_DB_NAME = db_pool.BACKUP_DB_CONFIG["dbname"]
 BACKUP_INTERVAL = 1728000  # 20 дней
 
 # ================= СОЗДАНИЕ РЕЗЕРВНОЙ БД =================
 def create_backup_db_if_not_exists():
-    conn = psycopg2.connect(
-        dbname="postgres",
-        user=MAIN_DB_CONFIG["user"],
-        password=MAIN_DB_CONFIG["password"],
-        host=MAIN_DB_CONFIG["host"],
-        port=MAIN_DB_CONFIG["port"]
-    )
+    conn = db_pool.connect(dbname="postgres")
     conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
     cur = conn.cursor()
     cur.execute(f"SELECT 1 FROM pg_database WHERE datname='{BACKUP_DB_NAME}'")
@@ -33,12 +20,6 @@ def create_backup_db_if_not_exists():
     cur.close()
     conn.close()
 
-# ================= ПОДКЛЮЧЕНИЕ К РЕЗЕРВНОЙ БД =================
-def get_backup_conn():
-    cfg = MAIN_DB_CONFIG.copy()
-    cfg["dbname"] = BACKUP_DB_NAME
-    return psycopg2.connect(**cfg)
-
 # ================= СОЗДАНИЕ ТАБЛИЦЫ ADMINS =================
 def create_admins_table(conn):
     cur = conn.cursor()
@@ -82,6 +63,10 @@ def backup_table(conn_main, conn_backup, table_name, unique_column):
     cur_main = conn_main.cursor()
     cur_backup = conn_backup.cursor()
     try:
+        # Полная выгрузка таблицы может идти дольше общего statement_timeout
+        cur_main.execute("SET LOCAL statement_timeout = 0")
+        cur_backup.execute("SET LOCAL statement_timeout = 0")
+
         # Берём все данные из основной таблицы
         cur_main.execute(f"SELECT * FROM {table_name}")
         rows = cur_main.fetchall()
@@ -108,6 +93,8 @@ def backup_table(conn_main, conn_backup, table_name, unique_column):
         print(f"🔁 Таблица {table_name} синхронизирована")
     except Exception as e:
         print(f"⚠ Ошибка при бэкапе {table_name}: {e}")
+        conn_backup.rollback()
+        conn_main.rollback()
     finally:
         cur_main.close()
         cur_backup.close()
@@ -116,18 +103,18 @@ def backup_table(conn_main, conn_backup, table_name, unique_column):
 def main_backup_loop():
     create_backup_db_if_not_exists()
 
-    # Инициализация резервной БД (создание всех нужных таблиц)
-    cfg = MAIN_DB_CONFIG.copy()
-    cfg["dbname"] = BACKUP_DB_NAME
-    init_db(cfg["dbname"])  # init_db создаёт все таблицы кроме admins, admins создаём отдельно
+    # Схема резервной БД ведётся теми же миграциями, что и основной
+    # (schema_migrations.py); admins есть только в резервной — создаём отдельно
+    init_db(BACKUP_DB_NAME)
 
-    # Подключение
-    conn_main = psycopg2.connect(**MAIN_DB_CONFIG)
-    conn_backup = get_backup_conn()
+    # Соединения берутся из общих пулов и только на время работы
+    main_pool = db_pool.get_pool(caller="backup")
+    backup_pool = db_pool.get_pool(db_pool.BACKUP_DB_CONFIG, caller="backup")
 
     # Создаём таблицу admins и вставляем сервисного админа
-    create_admins_table(conn_backup)
-    insert_admin_if_not_exists(conn_backup)
+    with backup_pool.connection() as conn_backup:
+        create_admins_table(conn_backup)
+        insert_admin_if_not_exists(conn_backup)
 
     # Таблицы для бэкапа
     tables_to_backup = [
@@ -142,10 +129,11 @@ def main_backup_loop():
 
     print("🚀 Автобэкап запущен. Обновление каждые 20 дней...")
     while True:
-        for table, unique_col in tables_to_backup:
-            backup_table(conn_main, conn_backup, table, unique_col)
+        with main_pool.connection() as conn_main, backup_pool.connection() as conn_backup:
+            for table, unique_col in tables_to_backup:
+                backup_table(conn_main, conn_backup, table, unique_col)
         print("✅ Бэкап выполнен")
-        time.sleep(1728000)  # 20 дней
+        time.sleep(BACKUP_INTERVAL)
 
 # ================= ЗАПУСК =================
 if __name__ == "__main__":
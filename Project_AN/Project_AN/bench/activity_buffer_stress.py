@@ -0,0 +1,92 @@
+# bench/activity_buffer_stress.py
+# Стресс-проверка ActivityBuffer: несколько сэмплеров пишут с высокой частотой,
+# сброс идёт в медленную (и иногда падающую) фейковую БД. Ни одна секунда не
+# должна потеряться или задвоиться.
+# Запуск из папки проекта:  python -m bench.activity_buffer_stress
+import random
+import threading
+import time
+from datetime import date
+
+from activity_buffer import ActivityBuffer
+
+SAMPLERS = 4
+USERS = 5
+APPS = 50
+DURATION = 5.0          # сек
+DB_LATENCY = 0.05       # задержка «записи» в фейковую БД, сек
+DB_FAILURE_RATE = 0.2   # доля неудачных записей
+
+
+class SlowFakeDB:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.writes = 0
+        self.failures = 0
+
+    def write(self, rows, journal_seq=None):
+        time.sleep(DB_LATENCY)
+        if random.random() < DB_FAILURE_RATE:
+            self.failures += 1
+            raise ConnectionError("fake DB is down")
+        with self.lock:
+            for user_id, app_name, activity_date, seconds in rows:
+                key = (user_id, app_name, activity_date)
+                self.totals[key] = self.totals.get(key, 0) + seconds
+            self.writes += 1
+
+
+def main():
+    buffer = ActivityBuffer()
+    db = SlowFakeDB()
+    stop = threading.Event()
+    produced = [0] * SAMPLERS
+    today = date.today()
+
+    def sampler(idx):
+        rnd = random.Random(idx)
+        while not stop.is_set():
+            key = (rnd.randrange(USERS) + 1, f"app_{rnd.randrange(APPS)}", today)
+            buffer.add(key, 1)
+            produced[idx] += 1
+
+    def flusher():
+        while not stop.is_set():
+            try:
+                buffer.flush(db.write)
+            except ConnectionError:
+                pass
+
+    threads = [threading.Thread(target=sampler, args=(i,)) for i in range(SAMPLERS)]
+    threads.append(threading.Thread(target=flusher))
+    for t in threads:
+        t.start()
+    time.sleep(DURATION)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    # Финальный сброс без сбоев
+    buffer.flush(lambda rows, journal_seq: _final_write(db, rows))
+
+    total_produced = sum(produced)
+    total_stored = sum(db.totals.values())
+    users_seen = {k[0] for k in db.totals}
+    print(f"сэмплов: {total_produced} ({total_produced / DURATION:.0f}/сек)")
+    print(f"записей в БД: {db.writes}, сбоев: {db.failures}")
+    print(f"сохранено секунд: {total_stored}, пользователей: {len(users_seen)}/{USERS}")
+    assert total_stored == total_produced, "потеряны или задвоены замеры"
+    assert len(users_seen) == USERS, "сброшены не все пользователи"
+    print("✅ Потерь нет")
+
+
+def _final_write(db, rows):
+    with db.lock:
+        for user_id, app_name, activity_date, seconds in rows:
+            key = (user_id, app_name, activity_date)
+            db.totals[key] = db.totals.get(key, 0) + seconds
+
+
+if __name__ == "__main__":
+    main()
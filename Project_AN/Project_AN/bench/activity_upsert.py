@@ -0,0 +1,71 @@
+# bench/activity_upsert.py
+# Сравнение построчного и пакетного upsert в activity_monitoring.
+# Запуск из папки проекта:  python -m bench.activity_upsert
+import time
+from datetime import date, timedelta
+
+import db_pool
+import activity_ingest
+
+SIZES = [10, 1000, 100000]
+
+
+def make_rows(user_id, n):
+    """n уникальных ключей: n/30 приложений на 30 дней"""
+    start = date.today() - timedelta(days=29)
+    return [(user_id, f"bench_{n}_app_{i // 30}", start + timedelta(days=i % 30), 10) for i in range(n)]
+
+
+def run(pool, fn, rows):
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        started = time.perf_counter()
+        fn(cur, rows)
+        conn.commit()
+        elapsed = time.perf_counter() - started
+        cur.close()
+    return elapsed
+
+
+def main():
+    pool = db_pool.get_pool(caller="bench")
+
+    # Временный пользователь: его строки удалятся каскадом в конце
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO users (email, password_hash) VALUES (%s, 'x') RETURNING id_user",
+            (f"bench_{int(time.time())}@local",)
+        )
+        user_id = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+
+    print(f"{'ключей':>8} | {'построчно, с':>12} | {'пакетно, с':>10} | {'ключей/с (пакет)':>16} | ускорение")
+    try:
+        for n in SIZES:
+            rows = make_rows(user_id, n)
+            # Первый проход вставляет, второй — обновляет; меряем обновление (как в работе)
+            run(pool, activity_ingest.upsert_activity, rows)
+            per_row = run(pool, activity_ingest.upsert_activity_per_row, rows)
+            batched = run(pool, activity_ingest.upsert_activity, rows)
+            print(f"{n:>8} | {per_row:>12.4f} | {batched:>10.4f} | {n / batched:>16.0f} | x{per_row / batched:.1f}")
+
+        # Проверка: итоги совпадают с построчным сложением (3 прохода по 10 сек)
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT MIN(total_seconds), MAX(total_seconds) FROM activity_monitoring WHERE user_id = %s",
+                        (user_id,))
+            print("min/max total_seconds:", cur.fetchone(), "(ожидается 30/30)")
+            cur.close()
+    finally:
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM users WHERE id_user = %s", (user_id,))
+            conn.commit()
+            cur.close()
+        db_pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
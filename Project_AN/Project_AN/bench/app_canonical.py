@@ -0,0 +1,111 @@
+# bench/app_canonical.py
+# Канонизация имён (app_canonical.py) на корпусе реалистичных заголовков окон
+# и доменов расширения: во сколько раз меньше разных «приложений» и сколько
+# стоит один замер без памяти результатов и с ней.
+# Запуск из папки проекта:  python -m bench.app_canonical [--samples N]
+import argparse
+import random
+import time
+
+import app_canonical
+import window_probe
+
+SEED = 11
+SAMPLES = 200_000     # замеров окна ≈ 2,5 дня опроса раз в секунду по 8 часов
+
+WORDS = ["отчёт", "курсовая", "диплом", "план", "бюджет", "notes", "README", "main", "utils", "config",
+         "lecture", "презентация", "резюме", "invoice", "draft", "todo", "statistics", "лаба", "эссе", "сценарий"]
+PROJECTS = ["Anti-Procrastinator", "site", "bot", "ml-course", "homework"]
+CHATS = ["general", "memes", "dev", "random", "voice", "announcements"]
+
+# (процесс, шаблон заголовка, вес)
+WINDOWS = [
+    ("code", "{w}.py - {p} - Visual Studio Code", 20),
+    ("pycharm64", "{p} – {w}.py", 8),
+    ("winword", "{w}_{n}.docx - Word", 12),
+    ("excel", "{w}.xlsx - Excel", 5),
+    ("powerpnt", "{w}.pptx - PowerPoint", 3),
+    ("telegram", "Telegram ({n})", 8),
+    ("discord", "#{c} | {p} - Discord", 6),
+    ("explorer", "{w}", 4),
+    ("applicationframehost", "{w}_{n}.jpg - Фотографии", 1),
+    ("applicationframehost", "Калькулятор", 1),
+    ("javaw", "Minecraft 1.20.{d} - Multiplayer (3rd-party Server)", 3),
+    ("dota2", "Dota 2", 4),
+    ("spotify", "{w} - {c}", 3),
+    ("vlc", "{w}.s01e{n}.mkv - VLC media player", 3),
+    ("acrord32", "{w}_{n}.pdf - Adobe Acrobat Reader (64-bit)", 3),
+    ("notepad", "*{w}.txt - Блокнот", 2),
+    ("someeditor", "{w} [{p}] - Some Editor", 2),
+    # X11 без _NET_WM_PID: процесса нет, только заголовок
+    ("", "{w}.py - {p} - Visual Studio Code", 3),
+    ("", "({n}) {w} - Почта", 1),
+]
+
+DOMAINS = ["youtube.com", "vk.com", "github.com", "stackoverflow.com", "habr.com", "wikipedia.org",
+           "ru.wikipedia.org", "mail.google.com", "docs.google.com", "twitch.tv", "reddit.com",
+           "netflix.com", "chatgpt.com", "web.telegram.org", "music.yandex.ru", "kinopoisk.ru",
+           "ozon.ru", "avito.ru", "lms.university.ru", "localhost"]
+DOMAIN_VARIANTS = ["{}", "www.{}", "m.{}", "{}.", "WWW.{}"]
+
+
+def make_windows(rng, count):
+    weights = [weight for _, _, weight in WINDOWS]
+    corpus = []
+    for process, template, _ in rng.choices(WINDOWS, weights, k=count):
+        title = template.format(w=rng.choice(WORDS), p=rng.choice(PROJECTS), c=rng.choice(CHATS),
+                                n=rng.randint(1, 40), d=rng.randint(1, 4))
+        corpus.append(window_probe.WindowInfo(process, title, None))
+    return corpus
+
+
+def make_domains(rng, count):
+    return [rng.choice(DOMAIN_VARIANTS).format(rng.choice(DOMAINS)) for _ in range(count)]
+
+
+def timed(fn, items):
+    started = time.perf_counter()
+    results = [fn(item) for item in items]
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Канонизация имён приложений и доменов")
+    parser.add_argument("--samples", type=int, default=SAMPLES)
+    args = parser.parse_args()
+
+    rng = random.Random(SEED)
+    windows = make_windows(rng, args.samples)
+    domains = make_domains(rng, args.samples // 4)
+
+    raw, raw_time = timed(lambda info: window_probe.app_name_from_window(info)[0], windows)
+    uncached = app_canonical.Canonicalizer(cache_size=0)
+    _, uncached_time = timed(uncached.from_window, windows)
+    cached = app_canonical.Canonicalizer()
+    canonical, cached_time = timed(cached.from_window, windows)
+    canonical = [name for name, _ in canonical]
+
+    print(f"Окна: {len(windows):,} замеров")
+    print(f"{'':<26} | {'разных имён':>12} | {'нс/замер':>9}")
+    print(f"{'заголовок как есть':<26} | {len(set(raw)):>12,} | {raw_time / len(windows) * 1e9:>9.0f}")
+    print(f"{'правила, без памяти':<26} | {len(set(canonical)):>12,} | {uncached_time / len(windows) * 1e9:>9.0f}")
+    print(f"{'правила + LRU':<26} | {len(set(canonical)):>12,} | {cached_time / len(windows) * 1e9:>9.0f}")
+    info = cached.cache_info()["app_name"]
+    print(f"LRU: попаданий {info['hits'] / len(windows):.1%}, в памяти {info['currsize']:,}")
+
+    _, domain_uncached_time = timed(app_canonical.Canonicalizer(cache_size=0).domain, domains)
+    normalized, domain_time = timed(cached.domain, domains)
+    print(f"\nДомены: {len(domains):,} имён сайтов, разных {len(set(domains))} -> {len(set(normalized))}; "
+          f"{domain_uncached_time / len(domains) * 1e9:.0f} нс без памяти, "
+          f"{domain_time / len(domains) * 1e9:.0f} нс с LRU")
+
+    print("\nСамые частые имена после канонизации:")
+    counts = {}
+    for name in canonical:
+        counts[name] = counts.get(name, 0) + 1
+    for name, count in sorted(counts.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {name:<28} {count:>8,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# bench/apps_dictionary.py
+# Размер activity_monitoring и свёрток до и после словаря приложений (apps):
+# заголовок окна в каждой строке и индексе против app_id.
+# SQLite: база строится по схеме версии 2, замеряется, затем к ней применяется
+# миграция версии 3 из storage.py и база замеряется снова.
+# PostgreSQL: те же данные во временных таблицах обеих раскладок;
+# --live — размеры таблиц рабочей БД (запустить до и после миграции 10).
+# Запуск из папки проекта:  python -m bench.apps_dictionary [--only sqlite] [--live]
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+
+import storage
+
+USERS = 50
+DAYS = 31
+APPS_PER_DAY = 25    # разных окон у пользователя за день
+SEED = 7
+
+# Заголовки окон, как их присылает монитор: документы, вкладки браузера, мессенджеры
+TITLE_TEMPLATES = [
+    "{doc} - Microsoft Word",
+    "{doc}.xlsx - Excel",
+    "{topic} - YouTube — Mozilla Firefox",
+    "{topic} - YouTube - Google Chrome",
+    "{topic} — Википедия - Google Chrome",
+    "Входящие ({n}) - почта - Яндекс Почта - Google Chrome",
+    "{repo}: {doc}.py - Visual Studio Code",
+    "Telegram ({n})",
+    "Discord | #{topic}",
+    "{topic} | Habr - Google Chrome",
+    "Steam",
+    "Dota 2",
+    "Проводник",
+    "Диспетчер задач",
+]
+WORDS = ["отчёт", "курсовая", "react hooks", "python asyncio", "lofi beats", "план на неделю",
+         "sql индексы", "минималистичный дизайн", "budget_2026", "диплом глава 2", "новости", "general"]
+
+
+def make_titles(rng, count=600):
+    titles = set()
+    while len(titles) < count:
+        template = rng.choice(TITLE_TEMPLATES)
+        titles.add(template.format(doc=rng.choice(WORDS), topic=rng.choice(WORDS),
+                                   repo=rng.choice(WORDS).replace(" ", "-"), n=rng.randint(1, 300)))
+    return sorted(titles)
+
+
+def make_rows():
+    rng = random.Random(SEED)
+    titles = make_titles(rng)
+    start = date.today() - timedelta(days=DAYS - 1)
+    rows = {}
+    for user_id in range(1, USERS + 1):
+        for offset in range(DAYS):
+            day = start + timedelta(days=offset)
+            for title in rng.sample(titles, APPS_PER_DAY):
+                rows[(user_id, title, day)] = rng.randint(5, 7200)
+    return rows
+
+
+def fmt_size(size):
+    return f"{size / 1024:,.0f} КБ"
+
+
+# ================= SQLite =================
+def sqlite_sizes(conn):
+    """{объект: байт} по dbstat для таблиц активности, их индексов и apps"""
+    sizes = {}
+    for name, table, size in conn.execute("""
+        SELECT s.name, m.tbl_name, SUM(s.pgsize)
+        FROM dbstat s
+        JOIN sqlite_master m ON m.name = s.name
+        WHERE m.tbl_name IN ('activity_monitoring', 'activity_weekly', 'activity_monthly', 'apps')
+        GROUP BY s.name
+    """):
+        sizes[name] = size
+    return sizes
+
+
+def sqlite_report(title, sizes):
+    print(f"\n--- {title} ---")
+    for name, size in sorted(sizes.items()):
+        print(f"{name:<44} {fmt_size(size):>12}")
+    print(f"{'итого':<44} {fmt_size(sum(sizes.values())):>12}")
+    return sum(sizes.values())
+
+
+def run_sqlite(rows):
+    with tempfile.TemporaryDirectory() as directory:
+        conn = sqlite3.connect(os.path.join(directory, "bench.sqlite3"), isolation_level=None)
+        conn.execute("BEGIN")
+        for version, statements in storage.SQLITE_MIGRATIONS:
+            if version > 2:
+                break
+            for statement in statements:
+                conn.execute(statement)
+        conn.executemany(
+            "INSERT INTO activity_monitoring (user_id, app_name, total_seconds, activity_date) VALUES (?, ?, ?, ?)",
+            [(user_id, title, seconds, day.isoformat()) for (user_id, title, day), seconds in sorted(rows.items())])
+        # Свёртки заполняются теми же выражениями, что и при миграции на версию 2
+        for statement in dict(storage.SQLITE_MIGRATIONS)[2][3:]:
+            conn.execute(statement)
+        conn.execute("COMMIT")
+        conn.execute("VACUUM")
+        before = sqlite_report("SQLite, версия 2: app_name в строках", sqlite_sizes(conn))
+
+        conn.execute("BEGIN")
+        for statement in dict(storage.SQLITE_MIGRATIONS)[3]:
+            conn.execute(statement)
+        conn.execute("COMMIT")
+        conn.execute("VACUUM")
+        after = sqlite_report("SQLite, версия 3: app_id + apps", sqlite_sizes(conn))
+        conn.close()
+    print(f"\nSQLite: {fmt_size(before)} -> {fmt_size(after)} ({(1 - after / before) * 100:.0f}% меньше)")
+
+
+# ================= PostgreSQL =================
+PG_SIZES_SQL = """
+    SELECT COALESCE(SUM(pg_table_size(relid)), 0), COALESCE(SUM(pg_indexes_size(relid)), 0)
+    FROM pg_partition_tree(%s)
+    WHERE isleaf
+"""
+
+
+def pg_sizes(cur, tables):
+    result = {}
+    for table in tables:
+        cur.execute(PG_SIZES_SQL, (table,))
+        result[table] = cur.fetchone()
+    return result
+
+
+def pg_report(title, sizes):
+    print(f"\n--- {title} ---")
+    print(f"{'таблица':<28} | {'данные':>12} | {'индексы':>12}")
+    for table, (data, indexes) in sizes.items():
+        print(f"{table:<28} | {fmt_size(data):>12} | {fmt_size(indexes):>12}")
+    return sum(data + indexes for data, indexes in sizes.values())
+
+
+def run_postgres(rows, live):
+    try:
+        import db_pool
+    except ImportError as e:
+        print(f"\nPostgreSQL пропущен: {e}")
+        return
+    pool = db_pool.get_pool(caller="bench")
+    if not pool.ping():
+        print("\nPostgreSQL пропущен: сервер недоступен")
+        return
+    try:
+        with pool.transaction() as cur:
+            if live:
+                cur.execute("SELECT to_regclass('apps') IS NOT NULL")
+                tables = ["activity_monitoring", "activity_weekly", "activity_monthly"]
+                if cur.fetchone()[0]:
+                    tables.append("apps")
+                pg_report("PostgreSQL, рабочая БД", pg_sizes(cur, tables))
+                return
+
+            names = sorted({title for _, title, _ in rows})
+            keys = sorted(rows)
+            cur.execute("""
+                CREATE TEMP TABLE bench_am_text (
+                    user_id INT NOT NULL, app_name TEXT NOT NULL,
+                    total_seconds INT NOT NULL, activity_date DATE NOT NULL,
+                    PRIMARY KEY (user_id, app_name, activity_date)
+                ) ON COMMIT DROP
+            """)
+            cur.execute("CREATE INDEX ON bench_am_text(user_id, activity_date) INCLUDE (app_name, total_seconds)")
+            cur.execute("CREATE TEMP TABLE bench_apps (id SERIAL PRIMARY KEY, name TEXT NOT NULL UNIQUE) "
+                        "ON COMMIT DROP")
+            cur.execute("""
+                CREATE TEMP TABLE bench_am_id (
+                    user_id INT NOT NULL, app_id INT NOT NULL,
+                    total_seconds INT NOT NULL, activity_date DATE NOT NULL,
+                    PRIMARY KEY (user_id, app_id, activity_date)
+                ) ON COMMIT DROP
+            """)
+            cur.execute("CREATE INDEX ON bench_am_id(user_id, activity_date) INCLUDE (app_id, total_seconds)")
+            cur.execute("""
+                INSERT INTO bench_am_text
+                SELECT * FROM unnest(%s::int[], %s::text[], %s::int[], %s::date[])
+            """, ([k[0] for k in keys], [k[1] for k in keys], [rows[k] for k in keys], [k[2] for k in keys]))
+            cur.execute("INSERT INTO bench_apps (name) SELECT unnest(%s::text[])", (names,))
+            cur.execute("""
+                INSERT INTO bench_am_id
+                SELECT t.user_id, a.id, t.total_seconds, t.activity_date
+                FROM bench_am_text t JOIN bench_apps a ON a.name = t.app_name
+            """)
+            cur.execute("ANALYZE bench_am_text, bench_am_id, bench_apps")
+            before = pg_report("PostgreSQL: app_name в строках", pg_sizes(cur, ["bench_am_text"]))
+            after = pg_report("PostgreSQL: app_id + apps", pg_sizes(cur, ["bench_am_id", "bench_apps"]))
+            print(f"\nPostgreSQL: {fmt_size(before)} -> {fmt_size(after)} ({(1 - after / before) * 100:.0f}% меньше)")
+    finally:
+        db_pool.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Размер таблиц активности со словарём приложений и без")
+    parser.add_argument("--only", choices=("sqlite", "postgres"))
+    parser.add_argument("--live", action="store_true", help="размеры таблиц рабочей БД PostgreSQL")
+    args = parser.parse_args()
+
+    if args.live:
+        run_postgres(None, live=True)
+        return
+    rows = make_rows()
+    print(f"{len(rows):,} строк: {USERS} пользователей × {DAYS} дней × {APPS_PER_DAY} окон, "
+          f"{len({title for _, title, _ in rows})} разных заголовков")
+    if args.only != "postgres":
+        run_sqlite(rows)
+    if args.only != "sqlite":
+        run_postgres(rows, live=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# bench/load_monitor.py
+# Нагрузочный тест монитора: req/s и задержки (p50/p99) для /log_activity и
+# /current_user. Каждый поток держит одно keep-alive соединение.
+# Сравнение серверов: запустить монитор с MONITOR_SERVER=dev, затем с
+# MONITOR_SERVER=waitress (MONITOR_THREADS=...), и прогнать тест против обоих.
+# Токен для /log_activity выдаёт POST /auth/token по email и паролю
+# (--email/--password или BENCH_EMAIL/BENCH_PASSWORD), либо он передаётся --token.
+# Запуск из папки проекта:  python -m bench.load_monitor --email ... --password ... [--concurrency 32]
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+ENDPOINTS = ("current_user", "log_activity")
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def fetch_token(host, port, email, password):
+    """Токен клиента через POST /auth/token; None — вход не удался"""
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    body = json.dumps({"email": email, "password": password, "client": "load_monitor"})
+    conn.request("POST", "/auth/token", body=body, headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    data = json.loads(response.read() or b"{}")
+    conn.close()
+    if response.status != 200:
+        print(f"⚠️ /auth/token: {response.status} {data.get('message', '')}")
+        return None
+    return data.get("token")
+
+
+def worker(host, port, endpoint, token, deadline, latencies, statuses, lock, idx):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    body = json.dumps({"site_times": {f"load{idx}.example.com": 1}})
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
+    local_latencies = []
+    local_statuses = {}
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if endpoint == "log_activity":
+                conn.request("POST", "/log_activity", body=body, headers=headers)
+            else:
+                conn.request("GET", "/current_user")
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+        except (OSError, http.client.HTTPException):
+            status = "error"
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+        local_latencies.append(time.perf_counter() - started)
+        local_statuses[status] = local_statuses.get(status, 0) + 1
+    conn.close()
+    with lock:
+        latencies.extend(local_latencies)
+        for status, count in local_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+
+
+def run(base_url, endpoint, concurrency, duration, token):
+    url = urlparse(base_url)
+    host, port = url.hostname, url.port or 80
+    latencies, statuses, lock = [], {}, threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=worker, args=(host, port, endpoint, token, deadline, latencies, statuses, lock, i))
+        for i in range(concurrency)
+    ]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    print(f"/{endpoint:<13} | {len(latencies) / elapsed:>8.0f} req/s | "
+          f"p50 {percentile(latencies, 50) * 1000:>7.2f} мс | p99 {percentile(latencies, 99) * 1000:>7.2f} мс | "
+          f"статусы: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест монитора активности")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--endpoint", choices=ENDPOINTS + ("all",), default="all")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--token", help="токен клиента; без него берётся из /auth/token")
+    parser.add_argument("--email", default=os.environ.get("BENCH_EMAIL"))
+    parser.add_argument("--password", default=os.environ.get("BENCH_PASSWORD"))
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    token = args.token
+    if not token and args.email and args.password:
+        token = fetch_token(url.hostname, url.port or 80, args.email, args.password)
+    if not token and args.endpoint != "current_user":
+        print("⚠️ Нет токена: передайте --email и --password (или --token), /log_activity ответит 401")
+
+    endpoints = ENDPOINTS if args.endpoint == "all" else (args.endpoint,)
+    print(f"{args.url}, потоков: {args.concurrency}, {args.duration:.0f} сек на эндпоинт")
+    for endpoint in endpoints:
+        run(args.url, endpoint, args.concurrency, args.duration, token)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# bench/sim_ingest.py
+# Бенчмарк конвейера замеров без рабочего стола: SimulatedProbe с виртуальными
+# часами -> канонизация имени (app_canonical) -> ActivityBuffer (с журналом) -> сброс.
+# По умолчанию сброс идёт в память; с --db — в PostgreSQL через db_pool.
+# Запуск из папки проекта:  python -m bench.sim_ingest [--db] [--samples N]
+import argparse
+import shutil
+import tempfile
+import time
+from datetime import date
+
+import activity_ingest
+import activity_journal
+import app_canonical
+from activity_buffer import ActivityBuffer
+from activity_journal import ActivityJournal
+from window_probe import SimulatedProbe
+
+CHECK_INTERVAL = 10     # виртуальных секунд на один замер, как в mon.py
+FLUSH_EVERY = 600       # сброс каждые N замеров (= DB_SAVE_INTERVAL в виртуальном времени)
+USERS = 5
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_memory_writer(totals):
+    def write(rows, journal_seq):
+        for user_id, app_name, activity_date, seconds in rows:
+            key = (user_id, app_name, activity_date)
+            totals[key] = totals.get(key, 0) + seconds
+    return write
+
+
+def make_db_writer(pool, journal_name):
+    def write(rows, journal_seq):
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            activity_ingest.upsert_activity(cur, rows)
+            activity_journal.set_db_checkpoint(cur, journal_name, journal_seq)
+            conn.commit()
+            cur.close()
+    return write
+
+
+def create_users(pool, count):
+    """Временные пользователи: их строки удалятся каскадом в конце"""
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        user_ids = []
+        for i in range(count):
+            cur.execute(
+                "INSERT INTO users (email, password_hash) VALUES (%s, 'x') RETURNING id_user",
+                (f"sim_{int(time.time())}_{i}@local",)
+            )
+            user_ids.append(cur.fetchone()[0])
+        conn.commit()
+        cur.close()
+    return user_ids
+
+
+def run(samples, use_db):
+    journal_dir = tempfile.mkdtemp(prefix="sim_ingest_")
+    journal = ActivityJournal("sim_bench", directory=journal_dir)
+    buffer = ActivityBuffer(journal=journal)
+    clock = VirtualClock()
+    probes = [SimulatedProbe(clock=clock) for _ in range(USERS)]
+    canonicalizer = app_canonical.get_canonicalizer()
+    today = date.today()
+
+    totals = {}
+    if use_db:
+        import db_pool  # psycopg2 нужен только для режима --db
+        pool = db_pool.get_pool(caller="bench")
+        user_ids = create_users(pool, USERS)
+        write = make_db_writer(pool, journal.name)
+    else:
+        user_ids = list(range(1, USERS + 1))
+        write = make_memory_writer(totals)
+
+    expected = 0
+    flush_time = 0.0
+    started = time.perf_counter()
+    try:
+        for i in range(samples):
+            user_idx = i % USERS
+            app_name, _ = canonicalizer.from_window(probes[user_idx].active_window())
+            if app_name:
+                buffer.add((user_ids[user_idx], app_name, today), CHECK_INTERVAL)
+                expected += CHECK_INTERVAL
+            if user_idx == USERS - 1:
+                clock.now += CHECK_INTERVAL
+            if (i + 1) % FLUSH_EVERY == 0:
+                t = time.perf_counter()
+                buffer.flush(write)
+                flush_time += time.perf_counter() - t
+        t = time.perf_counter()
+        buffer.flush(write)
+        flush_time += time.perf_counter() - t
+        elapsed = time.perf_counter() - started
+    finally:
+        journal.close()
+        shutil.rmtree(journal_dir, ignore_errors=True)
+
+    print(f"замеров: {samples} за {elapsed:.2f} сек -> {samples / elapsed:,.0f} замеров/сек")
+    print(f"из них сброс: {flush_time:.2f} сек ({flush_time / elapsed:.0%})")
+    print(f"ожидалось секунд: {expected}")
+
+    if use_db:
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT COALESCE(SUM(total_seconds), 0) FROM activity_monitoring "
+                        "WHERE user_id = ANY(%s)", (user_ids,))
+            stored = cur.fetchone()[0]
+            cur.execute("DELETE FROM users WHERE id_user = ANY(%s)", (user_ids,))
+            cur.execute("DELETE FROM activity_journal_checkpoint WHERE journal_name = %s", (journal.name,))
+            conn.commit()
+            cur.close()
+        db_pool.close_all()
+    else:
+        stored = sum(totals.values())
+
+    print(f"сохранено секунд: {stored}")
+    assert stored == expected, "потеряны или задвоены замеры"
+    print("✅ Потерь нет")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера замеров на симулированном окне")
+    parser.add_argument("--samples", type=int, default=200_000)
+    parser.add_argument("--db", action="store_true", help="писать в PostgreSQL, а не в память")
+    args = parser.parse_args()
+    run(args.samples, args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# bench/storage_backends.py
+# Сравнение хранилищ (storage.py): SQLite в WAL против PostgreSQL.
+# Меряется приём активности (пакеты как у очереди приёма) и задержка запросов
+# дашборда: агрегаты детализации за день/неделю/месяц и данные главной по дням.
+# Запуск из папки проекта:  python -m bench.storage_backends [--only sqlite]
+# Без psycopg2 или недоступном сервере PostgreSQL пропускается.
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+import storage
+
+APPS = 40            # приложений на пользователя
+DAYS = 30            # дней истории
+FLUSH_KEYS = 500     # ключей в одном сбросе (≈ FLUSH_MAX_KEYS очереди при средней нагрузке)
+FLUSHES = 200
+QUERY_REPEAT = 200
+
+
+def make_flush(user_id, n, offset):
+    """Сброс очереди: n ключей (приложение, день) по 10 секунд"""
+    start = date.today() - timedelta(days=DAYS - 1)
+    rows = []
+    for i in range(offset, offset + n):
+        rows.append((user_id, f"bench_app_{i % APPS}", start + timedelta(days=(i // APPS) % DAYS), 10))
+    return [(None, rows)]
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def bench_ingest(backend, user_id):
+    latencies = []
+    started = time.perf_counter()
+    for i in range(FLUSHES):
+        batches = make_flush(user_id, FLUSH_KEYS, i * FLUSH_KEYS)
+        t = time.perf_counter()
+        backend.write_activity(batches, checkpoint=(f"bench_{backend.name}", i + 1))
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return FLUSHES * FLUSH_KEYS / elapsed, latencies
+
+
+def bench_queries(backend, user_id):
+    today = date.today()
+    queries = {
+        "детализация: сегодня": lambda: backend.activity_totals(user_id, today, today),
+        "детализация: 7 дней": lambda: backend.activity_totals(user_id, today - timedelta(days=6), today),
+        "детализация: 30 дней": lambda: backend.activity_totals(user_id, today - timedelta(days=29), today),
+        "диапазон дат": lambda: backend.activity_date_range(user_id),
+        "сводка (итоги + даты): 30 дней":
+            lambda: backend.activity_summary(user_id, today - timedelta(days=29), today),
+        "главная: по дням, 7 дней": lambda: backend.daily_totals(user_id, today - timedelta(days=6), today),
+    }
+    results = {}
+    for name, query in queries.items():
+        query()  # прогрев кэшей
+        samples = []
+        for _ in range(QUERY_REPEAT):
+            t = time.perf_counter()
+            query()
+            samples.append(time.perf_counter() - t)
+        results[name] = samples
+    return results
+
+
+def report(name, rate, flush_latencies, queries):
+    print(f"\n=== {name} ===")
+    print(f"приём: {rate:,.0f} ключей/с; сброс {FLUSH_KEYS} ключей p50 "
+          f"{percentile(flush_latencies, 50) * 1000:.1f} мс, p99 {percentile(flush_latencies, 99) * 1000:.1f} мс")
+    print(f"{'запрос':<32} | {'p50, мс':>8} | {'p99, мс':>8}")
+    for query, samples in queries.items():
+        print(f"{query:<32} | {percentile(samples, 50) * 1000:>8.3f} | {percentile(samples, 99) * 1000:>8.3f}")
+
+
+def run_sqlite():
+    with tempfile.TemporaryDirectory() as directory:
+        backend = storage.SqliteBackend(os.path.join(directory, "bench.sqlite3"))
+        user_id = 1
+        rate, flush_latencies = bench_ingest(backend, user_id)
+        report("SQLite (WAL)", rate, flush_latencies, bench_queries(backend, user_id))
+
+
+def run_postgres():
+    try:
+        import db_pool
+    except ImportError as e:
+        print(f"\nPostgreSQL пропущен: {e}")
+        return
+    pool = db_pool.get_pool(caller="bench")
+    if not pool.ping():
+        print("\nPostgreSQL пропущен: сервер недоступен")
+        return
+    backend = storage.PostgresBackend(pool)
+
+    # Временный пользователь: его строки удалятся каскадом в конце
+    with pool.transaction() as cur:
+        cur.execute("INSERT INTO users (email, password_hash) VALUES (%s, 'x') RETURNING id_user",
+                    (f"bench_{int(time.time())}@local",))
+        user_id = cur.fetchone()[0]
+    try:
+        rate, flush_latencies = bench_ingest(backend, user_id)
+        report("PostgreSQL", rate, flush_latencies, bench_queries(backend, user_id))
+    finally:
+        with pool.transaction() as cur:
+            cur.execute("DELETE FROM users WHERE id_user = %s", (user_id,))
+            cur.execute("DELETE FROM activity_journal_checkpoint WHERE journal_name = 'bench_postgres'")
+        db_pool.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение хранилищ SQLite и PostgreSQL")
+    parser.add_argument("--only", choices=("sqlite", "postgres"))
+    args = parser.parse_args()
+
+    print(f"{FLUSHES} сбросов по {FLUSH_KEYS} ключей, {APPS} приложений × {DAYS} дней, "
+          f"запросы по {QUERY_REPEAT} раз")
+    if args.only != "postgres":
+        run_sqlite()
+    if args.only != "sqlite":
+        run_postgres()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# client_tokens.py
+import hashlib
+import secrets
+import threading
+import time
+
+# ================= НАСТРОЙКИ ТОКЕНОВ =================
+TOKEN_TTL = 30 * 24 * 3600   # срок жизни токена клиента, сек
+CACHE_TTL = 60               # сколько доверяем проверке токена по БД без повтора, сек
+
+
+def hash_token(token):
+    """В БД хранится только SHA-256 токена, сам токен знает лишь клиент"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TokenStore:
+    """Токены клиентов мониторинга (десктоп, расширения браузера).
+
+    issue() выдаёт случайный токен пользователю при входе, resolve() находит
+    по нему user_id. Проверенные токены кэшируются в памяти, поэтому приём
+    активности не ходит в БД на каждый запрос. Если БД недоступна, выданный
+    токен всё равно действует в этом процессе. Токены хранятся в выбранном
+    хранилище (storage.get_storage).
+    """
+
+    def __init__(self, storage_backend, ttl=TOKEN_TTL, cache_ttl=CACHE_TTL):
+        self.storage = storage_backend
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self._lock = threading.Lock()
+        self._cache = {}  # token_hash -> (user_id, valid_until)
+
+    def issue(self, user_id, client="desktop"):
+        token = secrets.token_urlsafe(32)
+        token_hash = hash_token(token)
+        with self._lock:
+            self._cache[token_hash] = (user_id, time.time() + self.ttl)
+        try:
+            self.storage.save_client_token(token_hash, user_id, client, self.ttl)
+        except Exception as e:
+            print(f"⚠️ Токен user {user_id} не сохранён в БД (действует до перезапуска): {e}")
+        return token
+
+    def resolve(self, token):
+        """user_id по токену или None"""
+        if not token:
+            return None
+        token_hash = hash_token(token)
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(token_hash)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        try:
+            row = self.storage.use_client_token(token_hash)
+        except Exception as e:
+            print(f"❌ Не удалось проверить токен: {e}")
+            return None
+
+        with self._lock:
+            if row is None:
+                self._cache.pop(token_hash, None)
+                return None
+            user_id, expires_at = row[0], float(row[1])
+            self._cache[token_hash] = (user_id, min(expires_at, now + self.cache_ttl))
+        return user_id
+
+    def revoke(self, token):
+        if not token:
+            return
+        token_hash = hash_token(token)
+        with self._lock:
+            self._cache.pop(token_hash, None)
+        try:
+            self.storage.delete_client_token(token_hash)
+        except Exception as e:
+            print(f"⚠️ Токен не удалён из БД: {e}")
+
+    def active_users(self):
+        """user_id, чьи токены сейчас в кэше (для статистики)"""
+        now = time.time()
+        with self._lock:
+            return sorted({user_id for user_id, valid_until in self._cache.values() if valid_until > now})
@@ -0,0 +1,406 @@
+# db_pool.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+import monitor_metrics
+import query_stats
+
+
+# ================= КОНФИГУРАЦИЯ БД =================
+# Единственное место с параметрами подключения — все подсистемы берут их
+# отсюда. Переопределяются переменными окружения DB_*
+DB_CONFIG = {
+    "dbname": os.environ.get("DB_NAME", "Your_db_name"),
+    "user": os.environ.get("DB_USER", "postgres"),
+    "password": os.environ.get("DB_PASSWORD", "Your_password"),
+    "host": os.environ.get("DB_HOST", "localhost"),
+    "port": os.environ.get("DB_PORT", "5432"),
+}
+BACKUP_DB_CONFIG = dict(DB_CONFIG, dbname=os.environ.get("DB_BACKUP_NAME", "postgres_backup"))
+
+# ================= НАСТРОЙКИ ПУЛА =================
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = 10
+POOL_WAIT_TIMEOUT = 5.0        # сколько ждём свободное соединение, сек
+HEALTH_CHECK_INTERVAL = 30.0   # соединение, простоявшее дольше, проверяется SELECT 1
+CONNECT_RETRIES = 3
+STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "30000"))  # 0 — без ограничения
+DEFAULT_CALLER = "default"
+
+# Сколько соединений одновременно может держать фоновая подсистема: бэкап и
+# боты не должны занимать весь пул, пока интерфейс и монитор ждут
+CALLER_MAX_CONN = {
+    "backup": 2,
+    "admin_bot": 2,
+    "schedule_bot": 2,
+    "maintenance": 1,
+}
+
+
+class PoolTimeout(Exception):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений с PostgreSQL.
+
+    Оборачивает ThreadedConnectionPool: ограничивает число одновременно
+    выданных соединений семафором (вместо мгновенной ошибки — ожидание),
+    проверяет простоявшие соединения перед выдачей и пересоздаёт
+    разорванные. Собирает метрики размера пула и времени ожидания.
+
+    Каждое соединение выдаётся от имени подсистемы (caller): по ним ведётся
+    учёт, а для подсистем из CALLER_MAX_CONN действует свой лимит. Для всех
+    соединений сервер ограничивает время запроса STATEMENT_TIMEOUT_MS.
+    """
+
+    def __init__(self, db_config, minconn=POOL_MIN_CONN, maxconn=POOL_MAX_CONN,
+                 wait_timeout=POOL_WAIT_TIMEOUT, health_check_interval=HEALTH_CHECK_INTERVAL,
+                 statement_timeout=STATEMENT_TIMEOUT_MS, caller_limits=None):
+        self.db_config = dict(db_config)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.wait_timeout = wait_timeout
+        self.health_check_interval = health_check_interval
+        self.statement_timeout = statement_timeout
+        self.caller_limits = dict(CALLER_MAX_CONN if caller_limits is None else caller_limits)
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}  # id(conn) -> время последнего возврата в пул
+        self._owners = {}     # id(conn) -> caller, которому выдано соединение
+        self._caller_slots = {}
+        self._callers = {}    # caller -> {"borrowed", "in_use", "max_in_use", "timeouts"}
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "borrowed": 0,
+            "in_use": 0,
+            "max_in_use": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "connects": 0,
+            "reconnects": 0,
+            "health_check_failures": 0,
+        }
+
+    # ---------- внутренние ----------
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = self._create_pool()
+        return self._pool
+
+    def _create_pool(self):
+        last_error = None
+        for attempt in range(CONNECT_RETRIES):
+            try:
+                params = dict(self.db_config)
+                if self.statement_timeout:
+                    params["options"] = f"-c statement_timeout={int(self.statement_timeout)}"
+                if query_stats.ENABLED:
+                    params["connection_factory"] = query_stats.InstrumentedConnection
+                created = pg_pool.ThreadedConnectionPool(self.minconn, self.maxconn, **params)
+                self._bump("connects", self.minconn)
+                return created
+            except psycopg2.OperationalError as e:
+                last_error = e
+                time.sleep(0.5 * (attempt + 1))
+        raise last_error
+
+    def _bump(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _is_alive(self, conn, force=False):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if not force and last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            self._bump("health_check_failures")
+            return False
+
+    def _get_live_conn(self, pool):
+        """Соединение из пула, прошедшее проверку.
+
+        После рестарта Postgres разорваны все простаивающие соединения, поэтому
+        мёртвые выбрасываются по одному, пока не найдётся живое или пул не
+        откроет новое; после первого мёртвого проверяются и недавно
+        использованные. Простаивающих не больше maxconn — столько и попыток.
+        """
+        force = False
+        for _ in range(self.maxconn + 1):
+            conn = pool.getconn()
+            if self._is_alive(conn, force=force):
+                return conn
+            # Соединение разорвано (рестарт Postgres, таймаут) — заменяем новым
+            pool.putconn(conn, close=True)
+            self._last_used.pop(id(conn), None)
+            self._bump("reconnects")
+            force = True
+        raise psycopg2.OperationalError(f"Нет рабочего соединения после {self.maxconn + 1} попыток")
+
+    def _caller_stats(self, caller):
+        # вызывается под _stats_lock
+        stats = self._callers.get(caller)
+        if stats is None:
+            stats = self._callers[caller] = {"borrowed": 0, "in_use": 0, "max_in_use": 0, "timeouts": 0}
+        return stats
+
+    def _caller_slot(self, caller):
+        limit = self.caller_limits.get(caller)
+        if not limit:
+            return None
+        with self._pool_lock:
+            slot = self._caller_slots.get(caller)
+            if slot is None:
+                slot = self._caller_slots[caller] = threading.BoundedSemaphore(limit)
+        return slot
+
+    def _acquire_slot(self):
+        started = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            self._bump("waits")
+            if not self._slots.acquire(timeout=self.wait_timeout):
+                self._bump("timeouts")
+                raise PoolTimeout(f"Нет свободных соединений за {self.wait_timeout} сек")
+        waited = time.monotonic() - started
+        with self._stats_lock:
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+
+    # ---------- публичный API ----------
+    def getconn(self, caller=DEFAULT_CALLER):
+        """Выдаёт рабочее соединение. Вернуть его нужно через putconn()"""
+        started = time.perf_counter()
+        dbname = self.db_config.get("dbname")
+        caller_slot = self._caller_slot(caller)
+        if caller_slot is not None and not caller_slot.acquire(timeout=self.wait_timeout):
+            with self._stats_lock:
+                self._caller_stats(caller)["timeouts"] += 1
+            monitor_metrics.DB_ERRORS.inc(db=dbname, kind="pool_timeout")
+            raise PoolTimeout(f"{caller}: занято {self.caller_limits[caller]} соединений из лимита")
+        try:
+            self._acquire_slot()
+        except PoolTimeout:
+            if caller_slot is not None:
+                caller_slot.release()
+            with self._stats_lock:
+                self._caller_stats(caller)["timeouts"] += 1
+            monitor_metrics.DB_ERRORS.inc(db=dbname, kind="pool_timeout")
+            raise
+        try:
+            conn = self._get_live_conn(self._get_pool())
+        except Exception:
+            self._slots.release()
+            if caller_slot is not None:
+                caller_slot.release()
+            monitor_metrics.DB_ERRORS.inc(db=dbname, kind="connect")
+            raise
+
+        monitor_metrics.DB_CONNECT_SECONDS.observe(time.perf_counter() - started, db=dbname)
+        with self._stats_lock:
+            self._stats["borrowed"] += 1
+            self._stats["in_use"] += 1
+            self._stats["max_in_use"] = max(self._stats["max_in_use"], self._stats["in_use"])
+            stats = self._caller_stats(caller)
+            stats["borrowed"] += 1
+            stats["in_use"] += 1
+            stats["max_in_use"] = max(stats["max_in_use"], stats["in_use"])
+            self._owners[id(conn)] = caller
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Возвращает соединение в пул (незакоммиченная транзакция откатывается)"""
+        try:
+            broken = close or conn.closed
+            if not broken and conn.autocommit:
+                conn.autocommit = False
+            self._get_pool().putconn(conn, close=broken)
+            if broken:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+        finally:
+            with self._stats_lock:
+                self._stats["in_use"] -= 1
+                caller = self._owners.pop(id(conn), DEFAULT_CALLER)
+                self._caller_stats(caller)["in_use"] -= 1
+            self._slots.release()
+            caller_slot = self._caller_slot(caller)
+            if caller_slot is not None:
+                caller_slot.release()
+
+    @contextmanager
+    def connection(self, caller=DEFAULT_CALLER):
+        """with pool.connection() as conn: ... — соединение вернётся в пул само"""
+        conn = self.getconn(caller)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            monitor_metrics.DB_ERRORS.inc(db=self.db_config.get("dbname"), kind="connection_lost")
+            raise
+        except Exception as e:
+            if isinstance(e, psycopg2.Error):
+                monitor_metrics.DB_ERRORS.inc(db=self.db_config.get("dbname"), kind="query")
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    @contextmanager
+    def transaction(self, caller=DEFAULT_CALLER, timeout_ms=None):
+        """with pool.transaction() as cur: ... — COMMIT при выходе, ROLLBACK при ошибке.
+
+        timeout_ms меняет statement_timeout только для этой транзакции
+        (0 — без ограничения, например для бэкапа).
+        """
+        with self.connection(caller) as conn:
+            cur = conn.cursor()
+            try:
+                if timeout_ms is not None:
+                    cur.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms),))
+                yield cur
+                conn.commit()
+            finally:
+                cur.close()
+
+    def for_caller(self, caller):
+        return PoolClient(self, caller)
+
+    def ping(self, caller=DEFAULT_CALLER):
+        """Быстрая проверка доступности БД"""
+        try:
+            with self.connection(caller) as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+            return True
+        except Exception:
+            return False
+
+    def stats(self):
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot["max_size"] = self.maxconn
+        snapshot["idle"] = len(self._pool._pool) if self._pool else 0
+        snapshot["wait_time_avg"] = (
+            snapshot["wait_time_total"] / snapshot["waits"] if snapshot["waits"] else 0.0
+        )
+        with self._stats_lock:
+            snapshot["callers"] = {
+                caller: dict(stats, limit=self.caller_limits.get(caller))
+                for caller, stats in self._callers.items()
+            }
+        return snapshot
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+            self._last_used.clear()
+
+
+class PoolClient:
+    """Общий пул от имени одной подсистемы: соединения учитываются по caller.
+
+    Повторяет интерфейс ConnectionPool, поэтому подходит везде, где ждут пул
+    (TokenStore, очереди приёма, страницы).
+    """
+
+    def __init__(self, pool, caller):
+        self.pool = pool
+        self.caller = caller
+
+    @property
+    def db_config(self):
+        return self.pool.db_config
+
+    def getconn(self):
+        return self.pool.getconn(self.caller)
+
+    def putconn(self, conn, close=False):
+        self.pool.putconn(conn, close=close)
+
+    def connection(self):
+        return self.pool.connection(self.caller)
+
+    def transaction(self, timeout_ms=None):
+        return self.pool.transaction(self.caller, timeout_ms)
+
+    def ping(self):
+        return self.pool.ping(self.caller)
+
+    def stats(self):
+        return self.pool.stats()
+
+
+# ================= РЕЕСТР ПУЛОВ =================
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _config_key(db_config):
+    return tuple(sorted((k, str(v)) for k, v in db_config.items()))
+
+
+def get_pool(db_config=None, caller=None, **kwargs):
+    """Возвращает общий пул для данной конфигурации БД (один на процесс).
+
+    По умолчанию — основная БД (DB_CONFIG). С caller возвращается PoolClient,
+    выдающий соединения от имени этой подсистемы.
+    """
+    db_config = DB_CONFIG if db_config is None else db_config
+    key = _config_key(db_config)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_config, **kwargs)
+            _pools[key] = pool
+    return pool.for_caller(caller) if caller else pool
+
+
+def connect(db_config=None, **overrides):
+    """Отдельное соединение вне пула: миграции, CREATE DATABASE, долгие выгрузки"""
+    params = dict(DB_CONFIG if db_config is None else db_config, **overrides)
+    if query_stats.ENABLED:
+        params.setdefault("connection_factory", query_stats.InstrumentedConnection)
+    return psycopg2.connect(**params)
+
+
+def pool_stats():
+    """Метрики всех пулов процесса: {dbname: stats}"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {p.db_config.get("dbname"): p.stats() for p in pools}
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for p in pools:
+        p.close()
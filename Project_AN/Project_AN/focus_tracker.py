@@ -0,0 +1,139 @@
+# focus_tracker.py
+import time
+from datetime import date, datetime, timedelta
+
+# ================= НАСТРОЙКИ ОТСЛЕЖИВАНИЯ =================
+MIN_POLL = 1.0          # опрос сразу после смены окна, сек
+MAX_POLL = 3.0          # предел опроса, пока окно не меняется: на столько может опоздать смена окна
+NOTIFIED_MAX_POLL = 30.0  # то же, если источник сам сообщает о смене окна (wait_for_change)
+IDLE_POLL = 60.0        # предел опроса в простое / без пользователя
+BACKOFF = 1.5           # во сколько раз растёт пауза, если ничего не изменилось
+IDLE_THRESHOLD = 300    # столько секунд без ввода — пользователь отошёл
+GAP_LIMIT = 2 * IDLE_POLL + 10  # дольше между опросами — компьютер спал
+CREDIT_EVERY = 60       # открытый интервал засчитывается частями не реже, сек
+
+
+def split_by_day(started, ended):
+    """[(date, seconds)] для интервала (unix-время), разбитого по полуночи.
+
+    Границы округляются до секунды, поэтому у смежных интервалов секунды
+    складываются ровно в длину общего отрезка, без накопления погрешности.
+    """
+    parts = []
+    start, end = round(started), round(ended)
+    while start < end:
+        day = date.fromtimestamp(start)
+        midnight = int(datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp())
+        part_end = min(end, midnight)
+        parts.append((day, part_end - start))
+        start = part_end
+    return parts
+
+
+class FocusTracker:
+    """Отслеживание фокуса по смене окна, а не по фиксированным тикам.
+
+    poll() спрашивает активное приложение и, если оно сменилось, закрывает
+    предыдущий интервал: on_interval(user_id, app_name, started, ended) с
+    точными unix-временами начала и конца. Секунды засчитываются через
+    on_credit(user_id, app_name, from, to) смежными кусками — при закрытии и
+    не реже CREDIT_EVERY для открытого интервала, чтобы долгий фокус на одном
+    окне не терялся при падении процесса. Возвращает паузу до следующего
+    опроса: после смены окна она минимальна и растёт в BACKOFF раз, пока фокус
+    стабилен, а в простое растёт до IDLE_POLL. Длинная пауза при стабильном
+    фокусе (NOTIFIED_MAX_POLL) годится только источнику с уведомлениями о смене
+    окна: без них смена замечается лишь следующим опросом, и всё время до него
+    засчитывается предыдущему окну.
+
+    Простой определяется через idle_fn() (секунды без ввода или None): интервал
+    закрывается на моменте последнего ввода. Слишком большой разрыв между
+    опросами (сон ноутбука) тоже закрывает интервал на последнем опросе.
+    """
+
+    def __init__(self, get_app_name, on_credit, on_interval=None, idle_fn=None, clock=time.time,
+                 min_poll=MIN_POLL, max_poll=MAX_POLL, idle_poll=IDLE_POLL, backoff=BACKOFF,
+                 idle_threshold=IDLE_THRESHOLD, gap_limit=GAP_LIMIT, credit_every=CREDIT_EVERY):
+        self.get_app_name = get_app_name
+        self.on_credit = on_credit
+        self.on_interval = on_interval
+        self.idle_fn = idle_fn
+        self.clock = clock
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.idle_poll = idle_poll
+        self.backoff = backoff
+        self.idle_threshold = idle_threshold
+        self.gap_limit = gap_limit
+        self.credit_every = credit_every
+
+        self._current = None        # (user_id, app_name)
+        self._started = None
+        self._credited = None       # до какого момента секунды уже засчитаны
+        self._last_poll = None
+        self._delay = min_poll
+        self.polls = 0
+        self.intervals = 0
+
+    @property
+    def current(self):
+        """(user_id, app_name, начало интервала) или None"""
+        if self._current is None:
+            return None
+        return self._current[0], self._current[1], self._started
+
+    def _credit(self, until):
+        if self._current is not None and until > self._credited:
+            self.on_credit(self._current[0], self._current[1], self._credited, until)
+            self._credited = until
+
+    def _close(self, ended):
+        if self._current is not None:
+            user_id, app_name = self._current
+            self._credit(ended)
+            if ended > self._started:
+                self.intervals += 1
+                if self.on_interval is not None:
+                    self.on_interval(user_id, app_name, self._started, ended)
+        self._current = None
+        self._started = None
+        self._credited = None
+
+    def poll(self, user_id):
+        """Один опрос. Возвращает паузу до следующего, сек"""
+        now = self.clock()
+        self.polls += 1
+
+        # Разрыв больше допустимого: процесс не работал (сон, гибернация)
+        if self._last_poll is not None and now - self._last_poll > self.gap_limit:
+            self._close(self._last_poll)
+        self._last_poll = now
+
+        idle = self.idle_fn() if (self.idle_fn and user_id) else None
+        is_idle = idle is not None and idle >= self.idle_threshold
+
+        key = None
+        if user_id and not is_idle:
+            app_name = self.get_app_name()
+            if app_name:
+                key = (user_id, app_name)
+
+        if key != self._current:
+            # В простое интервал заканчивается на последнем вводе (но уже
+            # засчитанные секунды не отзываются)
+            ended = max(self._credited, now - idle) if (is_idle and self._current) else now
+            self._close(ended)
+            if key is not None:
+                self._current = key
+                self._started = self._credited = now
+            self._delay = self.min_poll
+        else:
+            if key is not None and now - self._credited >= self.credit_every:
+                self._credit(now)
+            limit = self.max_poll if key is not None else self.idle_poll
+            self._delay = min(self._delay * self.backoff, limit)
+        return self._delay
+
+    def close(self):
+        """Закрывает текущий интервал (выход пользователя, остановка)"""
+        self._close(self.clock())
+        self._delay = self.min_poll
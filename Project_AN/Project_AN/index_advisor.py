@@ -0,0 +1,347 @@
+# index_advisor.py
+# Отчёт по индексам БД: неиспользуемые, дубликаты, избыточные по префиксу и
+# недостающие покрывающие индексы. Умеет выдать готовую миграцию для
+# schema_migrations.py.
+# Запуск из папки проекта:  python index_advisor.py [имя_бд] [--migration] [--hot 20]
+import argparse
+
+from psycopg2 import errors as pg_errors
+
+# ================= НАСТРОЙКИ =================
+HOT_QUERIES_LIMIT = 20   # сколько самых тяжёлых запросов из pg_stat_statements смотреть
+
+
+class CoveringProposal:
+    """Покрывающий индекс под известный горячий запрос.
+
+    match — подстрока, по которой запрос узнаётся в pg_stat_statements.
+    """
+
+    def __init__(self, name, table, keys, include, match, reason):
+        self.name = name
+        self.table = table
+        self.keys = tuple(keys)
+        self.include = tuple(include)
+        self.match = match
+        self.reason = reason
+
+    def create_sql(self, partitioned=False):
+        # Секционированной таблице CONCURRENTLY не поддерживается: обычный
+        # CREATE INDEX строит индексы всех секций, блокируя запись на время построения
+        concurrently = "" if partitioned else "CONCURRENTLY "
+        sql = (f"CREATE INDEX {concurrently}IF NOT EXISTS {self.name} "
+               f"ON {self.table}({', '.join(self.keys)})")
+        if self.include:
+            sql += f" INCLUDE ({', '.join(self.include)})"
+        return sql
+
+
+# Агрегаты детализации и графики главной: фильтр по пользователю и диапазону
+# дат, читаются app_id и total_seconds — с INCLUDE хватает index-only scan
+COVERING_PROPOSALS = [
+    CoveringProposal(
+        "idx_activity_user_date_cover", "activity_monitoring",
+        ("user_id", "activity_date"), ("app_id", "total_seconds"),
+        "FROM activity_monitoring",
+        "агрегаты детализации по user_id и диапазону activity_date",
+    ),
+]
+
+
+class IndexInfo:
+    def __init__(self, table, name, keys, include, unique, primary, constraint, method,
+                 predicate, expression, scans, size, partitioned=False):
+        self.table = table
+        self.partitioned = partitioned  # индекс секционированной таблицы (relkind = 'p')
+        self.name = name
+        self.keys = tuple(keys)
+        self.include = tuple(include)
+        self.unique = unique
+        self.primary = primary
+        self.constraint = constraint   # индекс обслуживает PRIMARY KEY/UNIQUE-ограничение
+        self.method = method
+        self.predicate = predicate
+        self.expression = expression
+        self.scans = scans
+        self.size = size
+
+    @property
+    def removable(self):
+        """Можно удалить DROP INDEX, не трогая ограничения таблицы"""
+        return not (self.primary or self.constraint)
+
+    def describe(self):
+        text = f"{self.name} ({', '.join(self.keys)})"
+        if self.include:
+            text += f" INCLUDE ({', '.join(self.include)})"
+        if self.predicate:
+            text += f" WHERE {self.predicate}"
+        return text
+
+
+class Finding:
+    """Одна рекомендация. kind: duplicate | redundant_prefix | unused | covering"""
+
+    def __init__(self, kind, table, index, reason, sql, size=0):
+        self.kind = kind
+        self.table = table
+        self.index = index
+        self.reason = reason
+        self.sql = sql
+        self.size = size
+
+
+# ================= СБОР ДАННЫХ =================
+def load_indexes(cur):
+    cur.execute("""
+        SELECT
+            t.relname,
+            c.relname,
+            ARRAY(
+                SELECT a.attname
+                FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                ORDER BY k.ord
+            ),
+            i.indnkeyatts,
+            i.indisunique,
+            i.indisprimary,
+            EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = i.indexrelid),
+            am.amname,
+            pg_get_expr(i.indpred, i.indrelid),
+            i.indexprs IS NOT NULL,
+            COALESCE(s.idx_scan, 0) + COALESCE(parts.scans, 0),
+            pg_relation_size(i.indexrelid) + COALESCE(parts.size, 0),
+            t.relkind = 'p'
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_class t ON t.oid = i.indrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        JOIN pg_am am ON am.oid = c.relam
+        LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = i.indexrelid
+        -- Индекс секционированной таблицы: сканирования и размер — сумма по секциям
+        LEFT JOIN LATERAL (
+            SELECT SUM(ps.idx_scan) AS scans, SUM(pg_relation_size(inh.inhrelid)) AS size
+            FROM pg_inherits inh
+            LEFT JOIN pg_stat_user_indexes ps ON ps.indexrelid = inh.inhrelid
+            WHERE inh.inhparent = i.indexrelid
+        ) parts ON TRUE
+        WHERE n.nspname = 'public' AND NOT c.relispartition
+        ORDER BY t.relname, c.relname
+    """)
+    indexes = []
+    for (table, name, columns, key_count, unique, primary, constraint, method,
+         predicate, expression, scans, size, partitioned) in cur.fetchall():
+        indexes.append(IndexInfo(
+            table, name, columns[:key_count], columns[key_count:], unique, primary, constraint,
+            method, predicate, expression, scans, size, partitioned
+        ))
+    return indexes
+
+
+def load_hot_queries(cur, limit=HOT_QUERIES_LIMIT):
+    """[(запрос, вызовов, суммарное время мс)] из pg_stat_statements; [] — расширения нет"""
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+    if not cur.fetchone():
+        return []
+    # В PostgreSQL 13 total_time переименовали в total_exec_time
+    for column in ("total_exec_time", "total_time"):
+        try:
+            cur.execute(f"""
+                SELECT query, calls, {column}
+                FROM pg_stat_statements
+                WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                ORDER BY {column} DESC
+                LIMIT %s
+            """, (limit,))
+            return cur.fetchall()
+        except pg_errors.UndefinedColumn:
+            cur.connection.rollback()
+    return []
+
+
+def stats_since(cur):
+    """С какого момента копится idx_scan: «не используется» верно только для этого окна"""
+    cur.execute("SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()")
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+# ================= АНАЛИЗ =================
+def _preference(index):
+    # Какой из одинаковых индексов оставить: ограничение > уникальный > чаще используемый
+    return (not index.removable, index.unique, index.scans)
+
+
+def _drop_sql(index):
+    # DROP INDEX CONCURRENTLY секционированного индекса PostgreSQL отвергает
+    if index.partitioned:
+        return f"DROP INDEX IF EXISTS {index.name}"
+    return f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"
+
+
+def analyze(indexes, hot_queries=(), proposals=COVERING_PROPOSALS):
+    """Список Finding по индексам (load_indexes) и горячим запросам (load_hot_queries)"""
+    findings = []
+    flagged = set()
+
+    by_table = {}
+    for index in indexes:
+        if not index.expression:
+            by_table.setdefault(index.table, []).append(index)
+
+    for table, table_indexes in by_table.items():
+        # Дубликаты: те же ключи, метод, INCLUDE и условие
+        groups = {}
+        for index in table_indexes:
+            groups.setdefault((index.method, index.keys, index.include, index.predicate), []).append(index)
+        for group in groups.values():
+            if len(group) < 2:
+                continue
+            keep = max(group, key=_preference)
+            for index in group:
+                if index is keep or not index.removable:
+                    continue
+                flagged.add(index.name)
+                findings.append(Finding(
+                    "duplicate", table, index.name,
+                    f"повторяет {keep.describe()}", _drop_sql(index), index.size
+                ))
+
+        # Префикс: ключи A — начало ключей B (btree), значит B обслуживает те же запросы
+        for index in table_indexes:
+            if index.name in flagged or index.unique or not index.removable or index.method != "btree":
+                continue
+            for other in table_indexes:
+                if other is index or other.method != "btree" or other.predicate != index.predicate:
+                    continue
+                if len(other.keys) > len(index.keys) and other.keys[:len(index.keys)] == index.keys \
+                        and set(index.include) <= set(other.keys) | set(other.include):
+                    flagged.add(index.name)
+                    findings.append(Finding(
+                        "redundant_prefix", table, index.name,
+                        f"ключи — префикс {other.describe()}", _drop_sql(index), index.size
+                    ))
+                    break
+
+    # Покрывающие индексы под горячие запросы
+    for proposal in proposals:
+        table_indexes = by_table.get(proposal.table, [])
+        needed = set(proposal.include)
+        covered = any(
+            index.keys[:len(proposal.keys)] == proposal.keys
+            and needed <= set(index.keys) | set(index.include)
+            for index in table_indexes
+        )
+        if covered or not table_indexes:
+            continue
+        hits = [(calls, total) for query, calls, total in hot_queries if proposal.match in query]
+        reason = proposal.reason
+        if hits:
+            reason += (f"; в pg_stat_statements: {len(hits)} запросов, "
+                       f"{sum(c for c, _ in hits)} вызовов, {sum(t for _, t in hits):.0f} мс")
+        partitioned = any(index.partitioned for index in table_indexes)
+        findings.append(Finding("covering", proposal.table, proposal.name, reason,
+                                proposal.create_sql(partitioned)))
+
+        # Индекс с теми же ключами без INCLUDE новый полностью заменяет
+        for index in table_indexes:
+            if index.keys == proposal.keys and not index.include and not index.predicate \
+                    and index.removable and not index.unique and index.name not in flagged:
+                flagged.add(index.name)
+                findings.append(Finding(
+                    "redundant_prefix", proposal.table, index.name,
+                    f"заменяется покрывающим {proposal.name}", _drop_sql(index), index.size
+                ))
+
+    # Неиспользуемые: ни одного сканирования с момента сброса статистики
+    for index in indexes:
+        if index.name in flagged or index.unique or not index.removable or index.scans:
+            continue
+        findings.append(Finding(
+            "unused", index.table, index.name,
+            "idx_scan = 0 с момента сброса статистики — проверьте вручную", _drop_sql(index), index.size
+        ))
+    return findings
+
+
+def render_migration(findings, version, name="index_cleanup"):
+    """Текст миграции для schema_migrations.MIGRATIONS.
+
+    Сначала создаются новые индексы, потом удаляются лишние — запросы ни на
+    миг не остаются без индекса. Неиспользуемые в миграцию не попадают:
+    решение об их удалении принимается вручную. concurrent=True — только если
+    есть выражения CONCURRENTLY; индексы секционированных таблиц без них
+    применяются обычной транзакцией.
+    """
+    creates = [f.sql for f in findings if f.kind == "covering"]
+    drops = [f.sql for f in findings if f.kind in ("duplicate", "redundant_prefix")]
+    if not creates and not drops:
+        return None
+    lines = [f'    Migration({version}, "{name}", [']
+    for finding in [f for f in findings if f.kind == "covering"] + \
+            [f for f in findings if f.kind in ("duplicate", "redundant_prefix")]:
+        lines.append(f"        # {finding.index}: {finding.reason}")
+        lines.append(f'        "{finding.sql}",')
+    concurrent = any("CONCURRENTLY" in sql for sql in creates + drops)
+    lines.append("    ], concurrent=True)," if concurrent else "    ]),")
+    return "\n".join(lines)
+
+
+def _format_size(size):
+    for unit in ("Б", "КБ", "МБ", "ГБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ТБ"
+
+
+# ================= ЗАПУСК ИЗ КОНСОЛИ =================
+TITLES = {
+    "duplicate": "Дубликаты",
+    "redundant_prefix": "Избыточные (префикс другого индекса)",
+    "covering": "Предлагаемые покрывающие индексы",
+    "unused": "Не используются",
+}
+
+
+def main():
+    from db import connect
+    from schema_migrations import MIGRATIONS
+
+    parser = argparse.ArgumentParser(description="Анализ индексов БД")
+    parser.add_argument("db_name", nargs="?", help="по умолчанию — основная БД из db_pool.DB_CONFIG")
+    parser.add_argument("--migration", action="store_true", help="напечатать миграцию для schema_migrations.py")
+    parser.add_argument("--hot", type=int, default=HOT_QUERIES_LIMIT, help="сколько горячих запросов учитывать")
+    args = parser.parse_args()
+
+    conn = connect(args.db_name)
+    try:
+        cur = conn.cursor()
+        indexes = load_indexes(cur)
+        hot_queries = load_hot_queries(cur, args.hot)
+        since = stats_since(cur)
+        cur.close()
+    finally:
+        conn.close()
+
+    findings = analyze(indexes, hot_queries)
+    print(f"Индексов: {len(indexes)}, горячих запросов: {len(hot_queries) or 'нет pg_stat_statements'}, "
+          f"статистика с: {since or 'неизвестно'}")
+    for kind, title in TITLES.items():
+        items = [f for f in findings if f.kind == kind]
+        if not items:
+            continue
+        print(f"\n{title}:")
+        for finding in items:
+            size = f", {_format_size(finding.size)}" if finding.size else ""
+            print(f"  • {finding.table}.{finding.index}{size} — {finding.reason}")
+
+    if args.migration:
+        version = max(m.version for m in MIGRATIONS) + 1
+        migration = render_migration(findings, version)
+        print("\n" + (migration or "# Миграция не нужна"))
+
+
+if __name__ == "__main__":
+    main()
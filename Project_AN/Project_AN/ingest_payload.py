@@ -0,0 +1,164 @@
+# ingest_payload.py
+import json
+import time
+import zlib
+from datetime import date
+
+import app_canonical
+
+# ================= ОГРАНИЧЕНИЯ ПАКЕТОВ =================
+MAX_SECONDS_PER_SITE = 86400          # больше суток за один день не бывает
+MAX_BODY_BYTES = 1024 * 1024          # тело после распаковки
+MAX_BATCH_ENTRIES = 1000              # интервалов в одном пакете
+MAX_BUCKET_AGE_DAYS = 30              # насколько старые интервалы принимаем (офлайн-очередь)
+MAX_BATCH_ID_LENGTH = 128
+
+JSON_TYPES = ("application/json",)
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+CBOR_TYPES = ("application/cbor",)
+SUPPORTED_ENCODINGS = ("gzip", "deflate", "identity")
+
+
+class PayloadError(Exception):
+    """Пакет нельзя принять; status — HTTP-код ответа"""
+
+    def __init__(self, message, status=400, code="BAD_PAYLOAD"):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def supported_types():
+    """Content-Type, которые сервер умеет разбирать (msgpack/CBOR — если установлены)"""
+    types = list(JSON_TYPES)
+    try:
+        import msgpack  # noqa: F401
+        types.extend(MSGPACK_TYPES)
+    except ImportError:
+        pass
+    try:
+        import cbor2  # noqa: F401
+        types.extend(CBOR_TYPES)
+    except ImportError:
+        pass
+    return types
+
+
+def _decompress(body, encoding):
+    """Распаковка с ограничением размера: защита от gzip-бомб"""
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        if len(body) > MAX_BODY_BYTES:
+            raise PayloadError("Слишком большой пакет", 413, "TOO_LARGE")
+        return body
+    if encoding not in SUPPORTED_ENCODINGS:
+        raise PayloadError(f"Неподдерживаемый Content-Encoding: {encoding}", 415, "UNSUPPORTED_ENCODING")
+
+    # 16 + MAX_WBITS — gzip-заголовок, MAX_WBITS — zlib (deflate по HTTP)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, MAX_BODY_BYTES + 1)
+    except zlib.error as e:
+        raise PayloadError(f"Не удалось распаковать {encoding}: {e}")
+    if len(data) > MAX_BODY_BYTES or decompressor.unconsumed_tail:
+        raise PayloadError("Слишком большой пакет после распаковки", 413, "TOO_LARGE")
+    return data
+
+
+def decode_payload(body, content_type, content_encoding=None):
+    """Тело запроса -> объект. Формат выбирается по Content-Type и Content-Encoding"""
+    mimetype = (content_type or "application/json").split(";")[0].strip().lower()
+    data = _decompress(body, content_encoding)
+    try:
+        if mimetype in JSON_TYPES:
+            return json.loads(data.decode("utf-8"))
+        if mimetype in MSGPACK_TYPES:
+            import msgpack
+            return msgpack.unpackb(data, raw=False)
+        if mimetype in CBOR_TYPES:
+            import cbor2
+            return cbor2.loads(data)
+    except ImportError:
+        pass
+    except Exception as e:
+        raise PayloadError(f"Некорректное тело запроса ({mimetype}): {e}")
+    raise PayloadError(f"Неподдерживаемый Content-Type: {mimetype}", 415, "UNSUPPORTED_MEDIA_TYPE")
+
+
+def parse_site_times(site_times):
+    """Проверяет {домен: секунды}. Возвращает {домен: секунды} без нулевых.
+
+    Домены приводятся к одному виду (www.youtube.com -> youtube.com), время
+    совпавших складывается.
+    """
+    canonicalizer = app_canonical.get_canonicalizer()
+    if not isinstance(site_times, dict):
+        raise PayloadError("site_times должен быть объектом {домен: секунды}")
+    parsed = {}
+    for site, seconds in site_times.items():
+        if not isinstance(site, str) or not site.strip():
+            raise PayloadError("Пустое имя сайта")
+        if isinstance(seconds, bool) or not isinstance(seconds, (int, float)):
+            raise PayloadError(f"Некорректное время для {site}")
+        if not 0 <= seconds <= MAX_SECONDS_PER_SITE:
+            raise PayloadError(f"Время вне диапазона для {site}")
+        if seconds:
+            name = canonicalizer.domain(site)
+            parsed[name] = parsed.get(name, 0) + int(seconds)
+    return parsed
+
+
+def parse_batch_id(header_value, data):
+    """Ключ идемпотентности: заголовок Idempotency-Key или поле batch_id. None — ключа нет"""
+    batch_id = header_value or (data.get("batch_id") if isinstance(data, dict) else None)
+    if batch_id is None:
+        return None
+    if not isinstance(batch_id, str) or not 0 < len(batch_id) <= MAX_BATCH_ID_LENGTH \
+            or not batch_id.isprintable():
+        raise PayloadError(f"batch_id должен быть строкой до {MAX_BATCH_ID_LENGTH} символов")
+    return batch_id
+
+
+def _bucket_date(bucket_start, now):
+    if isinstance(bucket_start, bool) or not isinstance(bucket_start, (int, float)):
+        raise PayloadError("bucket_start должен быть unix-временем в секундах")
+    if not now - MAX_BUCKET_AGE_DAYS * 86400 <= bucket_start <= now + 86400:
+        raise PayloadError("bucket_start вне допустимого диапазона")
+    return date.fromtimestamp(bucket_start)
+
+
+def payload_rows(data, user_id, today=None):
+    """Пакет -> строки (user_id, site, activity_date, seconds).
+
+    Поддерживаются два формата:
+      {"site_times": {домен: секунды}}                      — всё за сегодня
+      {"entries": [{"bucket_start": unix, "site_times": {...}}, ...]}
+    В пакетном формате дата берётся из начала интервала, так что интервалы,
+    накопленные до полуночи или в офлайне, попадают в свой день.
+    """
+    if not isinstance(data, dict) or not data:
+        raise PayloadError("Нет данных")
+    today = today or date.today()
+
+    totals = {}
+    if "entries" in data:
+        entries = data["entries"]
+        if not isinstance(entries, list):
+            raise PayloadError("entries должен быть списком")
+        if len(entries) > MAX_BATCH_ENTRIES:
+            raise PayloadError(f"Больше {MAX_BATCH_ENTRIES} интервалов в пакете", 413, "TOO_LARGE")
+        now = time.time()
+        for entry in entries:
+            if not isinstance(entry, dict):
+                raise PayloadError("Элемент entries должен быть объектом")
+            activity_date = _bucket_date(entry.get("bucket_start"), now)
+            for site, seconds in parse_site_times(entry.get("site_times", {})).items():
+                totals[(site, activity_date)] = totals.get((site, activity_date), 0) + seconds
+    else:
+        for site, seconds in parse_site_times(data.get("site_times", {})).items():
+            totals[(site, today)] = seconds
+
+    for (site, activity_date), seconds in totals.items():
+        if seconds > MAX_SECONDS_PER_SITE:
+            raise PayloadError(f"Больше суток для {site} за {activity_date}")
+    return [(user_id, site, activity_date, seconds) for (site, activity_date), seconds in totals.items()]
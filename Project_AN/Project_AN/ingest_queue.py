@@ -0,0 +1,285 @@
+# ingest_queue.py
+import queue
+import threading
+import time
+
+import activity_journal
+import monitor_metrics
+
+# ================= НАСТРОЙКИ ОЧЕРЕДИ =================
+QUEUE_MAX_BATCHES = 1000   # сколько пакетов от расширения может ждать записи
+FLUSH_MAX_KEYS = 5000      # сбрасываем, когда накопилось столько уникальных ключей
+FLUSH_INTERVAL = 2.0       # ...или когда самый старый ключ ждёт дольше, сек
+RETRY_DELAY = 5.0          # пауза после неудачной записи в БД, сек
+INGEST_SHARDS = 4          # число независимых очередей (шардов по user_id)
+BATCH_KEY_TTL_DAYS = 30    # сколько помним ключи идемпотентности пакетов
+BATCH_PRUNE_INTERVAL = 3600.0  # как часто чистим старые ключи, сек
+
+
+class IngestQueue:
+    """Ограниченная очередь приёма активности с одним потоком-писателем.
+
+    Эндпоинт кладёт строки (user_id, app_name, activity_date, seconds) через
+    submit() и сразу отвечает клиенту. Писатель складывает строки с одинаковым
+    ключом и пишет их в activity_monitoring одним запросом по триггеру
+    размера или времени. Если БД недоступна, накопленное не теряется, а
+    пишется повторно. Пока накоплен полный сброс или запись в БД не проходит,
+    писатель не разбирает очередь: она заполняется, и submit отказывает
+    (эндпоинт отвечает 429), а не копит строки в памяти писателя.
+
+    С журналом пакет дописывается в ActivityJournal до ответа клиенту, а
+    номер журнала сохраняется в БД в одной транзакции с данными; при старте
+    писатель сначала воспроизводит то, что не успело попасть в БД.
+
+    Пакет с ключом идемпотентности (user_id, batch_id) хранится отдельно от
+    общего словаря и при сбросе записывается, только если ключ ещё не был
+    принят (таблица ingest_batches, в той же транзакции).
+    """
+
+    def __init__(self, storage, maxsize=QUEUE_MAX_BATCHES, flush_max_keys=FLUSH_MAX_KEYS,
+                 flush_interval=FLUSH_INTERVAL, journal=None):
+        self.storage = storage
+        self.flush_max_keys = flush_max_keys
+        self.flush_interval = flush_interval
+        self.journal = journal
+        self._replay_upto = journal.last_seq if journal is not None else None
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._submit_lock = threading.Lock()
+        self._pending = {}            # (user_id, app_name, activity_date) -> seconds
+        self._pending_since = None
+        self._pending_seq = None      # последний seq журнала среди накопленного
+        self._pending_batches = {}    # (user_id, batch_id) -> rows
+        self._pending_batch_rows = 0
+        self._flush_failing = False   # последний сброс не удался, ждём повтора
+        self._last_prune = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued_batches": 0,
+            "dropped_batches": 0,
+            "flushes": 0,
+            "flush_failures": 0,
+            "flushed_keys": 0,
+            "duplicate_batches": 0,
+            "flush_latency_last": 0.0,
+            "flush_latency_max": 0.0,
+            "flush_latency_total": 0.0,
+        }
+
+    # ---------- приём ----------
+    def submit(self, rows, batch_id=None):
+        """Кладёт пакет строк в очередь. False — очередь переполнена.
+
+        batch_id — ключ идемпотентности клиента: повторно доставленный пакет
+        с тем же ключом в БД не попадёт.
+        """
+        batch = (rows[0][0], batch_id) if (batch_id and rows) else None
+        # Проверка заполненности, запись в журнал и постановка в очередь — под
+        # одной блокировкой: отклонённый пакет не должен попасть в журнал, а
+        # номера журнала в очереди должны идти по возрастанию
+        with self._submit_lock:
+            if self._queue.full():
+                self._bump("dropped_batches")
+                return False
+            seq = self.journal.append(rows, batch) if self.journal is not None else None
+            self._queue.put_nowait((seq, rows, batch))
+        self._bump("enqueued_batches")
+        return True
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # ---------- писатель ----------
+    def start(self):
+        if self.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._writer_loop, name="ingest_writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Останавливает писателя, предварительно записав всё накопленное"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self.journal is not None:
+            self.journal.sync()
+
+    def _replay_journal(self):
+        """Воспроизводит журнал прошлого запуска; до успеха сброс не выполняется"""
+        while not self._stop.is_set():
+            try:
+                replayed = activity_journal.replay(self.storage, self.journal, self._replay_upto)
+                if replayed:
+                    print(f"♻️ Из журнала {self.journal.name} восстановлено {replayed} записей")
+                return
+            except Exception as e:
+                print(f"❌ Не удалось воспроизвести журнал {self.journal.name}: {e}")
+                self._stop.wait(RETRY_DELAY)
+
+    def _writer_loop(self):
+        if self.journal is not None:
+            self._replay_journal()
+
+        while not self._stop.is_set() or not self._queue.empty():
+            # При остановке забираем всё: отказывать уже некому, сброс — последний
+            if self._stop.is_set() or not self._holding():
+                try:
+                    item = self._queue.get(timeout=self._time_to_flush())
+                    self._merge(item)
+                    # Забираем всё, что уже лежит в очереди, не дожидаясь
+                    while self._pending_size() < self.flush_max_keys:
+                        self._merge(self._queue.get_nowait())
+                except queue.Empty:
+                    pass
+
+            if self._should_flush() and not self._flush():
+                self._stop.wait(RETRY_DELAY)
+
+        # Финальный сброс при остановке
+        self._flush()
+
+    def _merge(self, item):
+        seq, rows, batch = item
+        if seq is not None:
+            self._pending_seq = seq if self._pending_seq is None else max(self._pending_seq, seq)
+        if batch is not None:
+            if batch not in self._pending_batches:
+                self._pending_batches[batch] = rows
+                self._pending_batch_rows += len(rows)
+        else:
+            for user_id, app_name, activity_date, seconds in rows:
+                key = (user_id, app_name, activity_date)
+                self._pending[key] = self._pending.get(key, 0) + seconds
+        if self._pending_size() and self._pending_since is None:
+            self._pending_since = time.monotonic()
+
+    def _pending_size(self):
+        return len(self._pending) + self._pending_batch_rows
+
+    def _holding(self):
+        """Не брать из очереди, пока накопленное не записано"""
+        return self._flush_failing or self._pending_size() >= self.flush_max_keys
+
+    def _time_to_flush(self):
+        if self._pending_since is None:
+            return self.flush_interval
+        return max(0.0, self.flush_interval - (time.monotonic() - self._pending_since))
+
+    def _should_flush(self):
+        if not self._pending_size():
+            return False
+        return (self._pending_size() >= self.flush_max_keys
+                or time.monotonic() - self._pending_since >= self.flush_interval)
+
+    def _flush(self):
+        if not self._pending_size():
+            return True
+        started = time.monotonic()
+        batches = [(None, [(u, a, d, s) for (u, a, d), s in self._pending.items()])]
+        batches.extend(self._pending_batches.items())
+        try:
+            prune = time.monotonic() - self._last_prune >= BATCH_PRUNE_INTERVAL
+            checkpoint = (self.journal.name, self._pending_seq) if self._pending_seq is not None else None
+            with monitor_metrics.DB_EXECUTE_SECONDS.time(op="upsert_activity"):
+                written, duplicates = self.storage.write_activity(
+                    batches, checkpoint=checkpoint, prune_days=BATCH_KEY_TTL_DAYS if prune else None)
+            if prune:
+                self._last_prune = time.monotonic()
+        except Exception as e:
+            self._flush_failing = True
+            self._bump("flush_failures")
+            print(f"❌ Ошибка записи очереди в БД (повтор через {RETRY_DELAY} сек): {e}")
+            return False
+
+        self._flush_failing = False
+        latency = time.monotonic() - started
+        monitor_metrics.FLUSH_SECONDS.observe(latency, buffer="ingest")
+        if self._pending_seq is not None:
+            self.journal.checkpoint(self._pending_seq)
+        self._pending = {}
+        self._pending_batches = {}
+        self._pending_batch_rows = 0
+        self._pending_since = None
+        self._pending_seq = None
+        with self._stats_lock:
+            self._stats["flushes"] += 1
+            self._stats["flushed_keys"] += written
+            self._stats["duplicate_batches"] += duplicates
+            self._stats["flush_latency_last"] = latency
+            self._stats["flush_latency_total"] += latency
+            self._stats["flush_latency_max"] = max(self._stats["flush_latency_max"], latency)
+        return True
+
+    # ---------- метрики ----------
+    def _bump(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def stats(self):
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot["queue_depth"] = self._queue.qsize()
+        snapshot["queue_capacity"] = self._queue.maxsize
+        snapshot["pending_keys"] = self._pending_size()
+        snapshot["writer_alive"] = self.is_alive()
+        snapshot["flush_latency_avg"] = (
+            snapshot["flush_latency_total"] / snapshot["flushes"] if snapshot["flushes"] else 0.0
+        )
+        return snapshot
+
+
+class ShardedIngestQueue:
+    """Несколько IngestQueue, между которыми пакеты делятся по user_id.
+
+    У каждого шарда своя ограниченная очередь, свой писатель и свой журнал:
+    активный пользователь заполняет только свой шард и не задерживает
+    остальных, а писатели пишут в БД параллельно. Интерфейс тот же, что у
+    IngestQueue; все строки одного пакета должны принадлежать одному user_id.
+    """
+
+    def __init__(self, storage, shards=INGEST_SHARDS, maxsize=QUEUE_MAX_BATCHES,
+                 journal_factory=None, **kwargs):
+        self.shards = []
+        for i in range(shards):
+            # Шард 0 использует журнал прежней единственной очереди
+            journal = journal_factory("ingest" if i == 0 else f"ingest_{i}") if journal_factory else None
+            self.shards.append(IngestQueue(storage, maxsize=max(1, maxsize // shards), journal=journal, **kwargs))
+
+    def shard_for(self, user_id):
+        return self.shards[hash(user_id) % len(self.shards)]
+
+    def submit(self, rows, batch_id=None):
+        if not rows:
+            return True
+        return self.shard_for(rows[0][0]).submit(rows, batch_id)
+
+    def is_alive(self):
+        return all(shard.is_alive() for shard in self.shards)
+
+    def start(self):
+        for shard in self.shards:
+            shard.start()
+
+    def stop(self, timeout=10.0):
+        for shard in self.shards:
+            shard._stop.set()
+        for shard in self.shards:
+            shard.stop(timeout)
+
+    def stats(self):
+        per_shard = [shard.stats() for shard in self.shards]
+        total = {}
+        for key in ("enqueued_batches", "dropped_batches", "flushes", "flush_failures", "flushed_keys",
+                    "duplicate_batches",
+                    "flush_latency_total", "queue_depth", "queue_capacity", "pending_keys"):
+            total[key] = sum(shard[key] for shard in per_shard)
+        total["flush_latency_last"] = max(shard["flush_latency_last"] for shard in per_shard)
+        total["flush_latency_max"] = max(shard["flush_latency_max"] for shard in per_shard)
+        total["flush_latency_avg"] = total["flush_latency_total"] / total["flushes"] if total["flushes"] else 0.0
+        total["writer_alive"] = all(shard["writer_alive"] for shard in per_shard)
+        total["shards"] = per_shard
+        return total
@@ -2,8 +2,12 @@ import flet as ft
 from route import Router
 from db import init_db
 import threading
+import time
 import backUp
 import mon  # Импортируем модуль Flask
+import db_pool
+import storage
+import activity_partitions
 from tg_page import TelegramBot  # Импортируем класс бота расписания
 from tgAdmin import TelegramBackupBot  # Импортируем класс backup бота
 
@@ -16,27 +20,25 @@ backup_bot = None  # Глобальная ссылка на backup бота
 SCHEDULE_BOT_TOKEN = 'Your_TGBOT_TOKEN'
 BACKUP_BOT_TOKEN = 'Your_TGBOT_TOKEN'
 
-DB_CONFIG = {
-    "dbname": "Your_db_name",
-    "user": "postgres",
-    "password": "Your_password",
-    "host": "localhost",
-    "port": "5432"
-}
-
-BACKUP_DB_CONFIG = {
-    "dbname": "postgres_backup",
-    "user": "postgres",
-    "password": "Your_password",
-    "host": "localhost",
-    "port": "5432"
-}
-
 
 def run_backup():
     backUp.main_backup_loop()
 
 
+def run_activity_maintenance():
+    """Срок хранения активности: устаревшие секции удаляются в фоне, а не при открытии страниц"""
+    activity_storage = storage.get_storage(caller="maintenance")
+    while True:
+        try:
+            result = activity_storage.maintain_activity()
+            if result["created"] or result["dropped"] or result["deleted_rows"]:
+                print(f"🗂️ Обслуживание активности: создано секций {len(result['created'])}, "
+                      f"удалено секций {len(result['dropped'])}, строк {result['deleted_rows']}")
+        except Exception as e:
+            print(f"❌ Ошибка обслуживания activity_monitoring: {e}")
+        time.sleep(activity_partitions.MAINTENANCE_INTERVAL)
+
+
 def run_flask_server():
     """Запуск Flask сервера в отдельном потоке"""
     try:
@@ -54,7 +56,7 @@ def run_schedule_bot():
         # Создаем экземпляр бота расписания
         telegram_bot = TelegramBot(
             token=SCHEDULE_BOT_TOKEN,
-            db_config=DB_CONFIG,
+            db_config=db_pool.DB_CONFIG,
             on_user_authorized=lambda user_id: update_user_id(user_id)
         )
         telegram_bot.start_bot()
@@ -69,8 +71,8 @@ def run_backup_bot():
         # Создаем экземпляр backup бота
         backup_bot = TelegramBackupBot(
             token=BACKUP_BOT_TOKEN,
-            db_config=DB_CONFIG,
-            backup_db_config=BACKUP_DB_CONFIG
+            db_config=db_pool.DB_CONFIG,
+            backup_db_config=db_pool.BACKUP_DB_CONFIG
         )
         backup_bot.start_bot()
     except Exception as e:
@@ -247,22 +249,33 @@ def create_telegram_bots_control(page):
 
 
 def main(page: ft.Page):
-    init_db()
+    # Резервная копия и Telegram-боты работают только с PostgreSQL;
+    # со встроенной SQLite приложение запускается без сервера БД
+    uses_postgres = storage.STORAGE_BACKEND == "postgres"
+
+    if uses_postgres:
+        init_db()
 
-    # Запускаем бекап в отдельном потоке
-    threading.Thread(target=run_backup, daemon=True).start()
+        # Запускаем бекап в отдельном потоке
+        threading.Thread(target=run_backup, daemon=True).start()
+    else:
+        print(f"ℹ️ Хранилище {storage.STORAGE_BACKEND}: резервная копия и Telegram-боты отключены")
+
+    # Секции и срок хранения activity_monitoring
+    threading.Thread(target=run_activity_maintenance, daemon=True).start()
 
     # Запускаем Flask мониторинг в отдельном потоке
     flask_thread = threading.Thread(target=run_flask_server, daemon=True)
     flask_thread.start()
 
-    # Запускаем Telegram бот расписания в отдельном потоке
-    schedule_thread = threading.Thread(target=run_schedule_bot, daemon=True)
-    schedule_thread.start()
+    if uses_postgres:
+        # Запускаем Telegram бот расписания в отдельном потоке
+        schedule_thread = threading.Thread(target=run_schedule_bot, daemon=True)
+        schedule_thread.start()
 
-    # Запускаем Telegram backup бот в отдельном потоке
-    backup_thread = threading.Thread(target=run_backup_bot, daemon=True)
-    backup_thread.start()
+        # Запускаем Telegram backup бот в отдельном потоке
+        backup_thread = threading.Thread(target=run_backup_bot, daemon=True)
+        backup_thread.start()
 
     # Создаем Router и передаем функцию для обновления user_id
     router_instance = Router(page)
@@ -280,7 +293,7 @@ def main(page: ft.Page):
     # 3. Создать отдельный маршрут
 
     # Пример добавления в Router (если у вас есть метод для создания страниц):
-    if hasattr(router_instance, 'add_telegram_page'):
+    if uses_postgres and hasattr(router_instance, 'add_telegram_page'):
         bot_control_panel = create_telegram_bots_control(page)
         router_instance.add_telegram_page(bot_control_panel)
 
@@ -296,15 +309,16 @@ def main(page: ft.Page):
     else:
         status_messages.append("❌ Flask мониторинг не запустился")
 
-    if schedule_thread.is_alive():
-        status_messages.append("✅ Telegram бот расписания успешно запущен")
-    else:
-        status_messages.append("❌ Telegram бот расписания не запустился")
+    if uses_postgres:
+        if schedule_thread.is_alive():
+            status_messages.append("✅ Telegram бот расписания успешно запущен")
+        else:
+            status_messages.append("❌ Telegram бот расписания не запустился")
 
-    if backup_thread.is_alive():
-        status_messages.append("✅ Telegram backup бот успешно запущен")
-    else:
-        status_messages.append("❌ Telegram backup бот не запустился")
+        if backup_thread.is_alive():
+            status_messages.append("✅ Telegram backup бот успешно запущен")
+        else:
+            status_messages.append("❌ Telegram backup бот не запустился")
 
     # Выводим все статусы
     for msg in status_messages:
@@ -334,6 +348,12 @@ def stop_application():
     if backup_bot:
         backup_bot.stop_bot()
 
+    # Дожидаемся запросов к монитору и сбрасываем накопленное в БД
+    mon.stop_flask_monitor()
+
+    # Закрываем общие пулы соединений с БД
+    db_pool.close_all()
+
     print("✅ Приложение остановлено")
 
 
@@ -1,30 +1,88 @@
 # flask_monitor.py
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
+import json
+import re
 from flask_cors import CORS
-import psycopg2
-from datetime import date
+import bcrypt
 import threading
 import time
-import win32gui
-import win32process
-import psutil
+from collections import OrderedDict
 import sys
-
-# Глобальная переменная для user_id
+import db_pool
+import monitor_metrics
+import query_stats
+import storage
+import ingest_payload
+from ingest_payload import PayloadError
+from ingest_queue import ShardedIngestQueue
+from client_tokens import TokenStore
+from activity_buffer import ActivityBuffer
+from activity_journal import ActivityJournal
+import activity_journal
+import app_canonical
+import window_probe
+from monitor_server import MonitorServer, MAX_HELD_REQUESTS
+from focus_tracker import FocusTracker, split_by_day, MAX_POLL, NOTIFIED_MAX_POLL
+
+# Глобальная переменная для user_id (пользователь этого компьютера)
 current_user_id = None
+current_token = None   # токен, выданный этому пользователю при входе
+token_store = None
 flask_app = None
+monitor_server = None
+
+# Origin расширения Chrome: chrome-extension://<32 буквы a-p>
+EXTENSION_ORIGIN_RE = r"^chrome-extension://[a-p]{32}$"
+
+# Номер версии сессии растёт при каждом входе/выходе; по нему строятся ETag
+# /current_user и push-уведомления /events
+session_version = 0
+session_changed = threading.Condition()
+streams_closing = False   # остановка сервера: потоки /events и долгие опросы завершаются
 
 
 def set_user_id(user_id):
-    """Установить user_id извне (вызывается из Flet приложения)"""
-    global current_user_id
+    """Установить user_id извне (вызывается из Flet приложения).
+
+    При входе пользователю выдаётся токен клиента, при выходе он отзывается.
+    Подписчики /events и ожидающие /current_user?wait= узнают об этом сразу.
+    """
+    global current_user_id, current_token, session_version
+    if token_store is not None and current_token:
+        token_store.revoke(current_token)
+    current_token = None
+
     if user_id:
         current_user_id = int(user_id) if isinstance(user_id, str) and user_id.isdigit() else user_id
+        if token_store is not None:
+            current_token = token_store.issue(current_user_id)
         print(f"✅ Установлен user_id для мониторинга: {current_user_id}")
     else:
         current_user_id = None
         print("⚠️ User_id сброшен (пользователь вышел)")
 
+    with session_changed:
+        session_version += 1
+        session_changed.notify_all()
+
+
+def wait_for_session_change(version, timeout):
+    """Ждёт, пока версия сессии станет отличной от version. Возвращает текущую версию.
+
+    При остановке сервера (close_streams) возвращается сразу.
+    """
+    with session_changed:
+        session_changed.wait_for(lambda: session_version != version or streams_closing, timeout)
+        return session_version
+
+
+def close_streams():
+    """Будит и завершает потоки /events и долгие опросы (плавная остановка сервера)"""
+    global streams_closing
+    with session_changed:
+        streams_closing = True
+        session_changed.notify_all()
+
 
 def get_user_id():
     """Получаем текущий user_id - ТОЛЬКО установленный, не из базы!"""
@@ -34,122 +92,245 @@ def get_user_id():
 
 def create_app():
     """Создает и настраивает Flask приложение"""
+    global token_store
     app = Flask(__name__)
+    # Сжатое тело не больше распакованного лимита; больше — 413 до чтения
+    app.config["MAX_CONTENT_LENGTH"] = ingest_payload.MAX_BODY_BYTES
 
-    # Настройка CORS
+    # CORS только для расширений: фоновому скрипту хватает host_permissions из
+    # static/manifest.json, а страницы сайтов не должны читать ответы монитора
+    # (в /current_user и /events лежит токен пользователя)
     CORS(app, resources={
         r"/*": {
-            "origins": ["chrome-extension://*", "http://127.0.0.1:*", "http://localhost:*"],
+            "origins": [EXTENSION_ORIGIN_RE],
             "methods": ["GET", "POST", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
+            "allow_headers": ["Content-Type", "Content-Encoding", "Authorization", "Idempotency-Key"]
         }
     })
 
     @app.after_request
     def after_request(response):
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+        if request.path == "/log_activity" and request.method == "POST":
+            monitor_metrics.INGEST_REQUESTS.inc(status=response.status_code)
+            monitor_metrics.INGEST_RATE.mark()
+            monitor_metrics.INGEST_PAYLOAD_BYTES.observe(request.content_length or 0)
         return response
 
-    DB_CONFIG = {
-        "dbname": "Your_db_name",
-        "user": "postgres",
-        "password": "Your_password",
-        "host": "localhost",
-        "port": "5432"
-    }
+    # Активность и токены клиентов — в выбранном хранилище (STORAGE_BACKEND)
+    activity_storage = storage.get_storage(caller="monitor")
+    token_store = TokenStore(activity_storage)
+    # Журналы на диске: замеры не теряются при падении процесса или БД
+    sampler_journal = ActivityJournal("sampler")
+    # Приём от расширений делится на шарды по user_id
+    ingest_queue = ShardedIngestQueue(activity_storage, journal_factory=ActivityJournal)
 
-    activity_buffer = {}
-    CHECK_INTERVAL = 10
+    activity_buffer = ActivityBuffer(journal=sampler_journal)
+    sampler_replay_upto = sampler_journal.last_seq
     DB_SAVE_INTERVAL = 60
+    DB_RETRY_MIN = 5      # первая повторная попытка после ошибки БД, сек
     browser_active = False
 
     # ================== Python мониторинг ==================
+    # Бэкенд выбирается по платформе или переменной MONITOR_PROBE (win32 | x11 | sim)
+    probe = window_probe.get_probe()
+    # Заголовок окна -> устойчивое имя приложения до буфера (app_canonical.py)
+    canonicalizer = app_canonical.get_canonicalizer()
+
     def get_active_app_name():
         nonlocal browser_active
-        try:
-            hwnd = win32gui.GetForegroundWindow()
-            if not hwnd:
-                browser_active = False
-                return None
-
-            _, pid = win32process.GetWindowThreadProcessId(hwnd)
-            process = psutil.Process(pid)
-            process_name = process.name().lower()
-            window_title = win32gui.GetWindowText(hwnd).strip()
-
-            if window_title in ("Program Manager", ""):
-                browser_active = False
-                return None
-
-            if process_name in ("chrome.exe", "msedge.exe", "firefox.exe"):
-                browser_active = True
-                return "Browser"
-
+        if probe is None:
             browser_active = False
-            return window_title or process_name.title()
+            return None
+        try:
+            app_name, browser_active = canonicalizer.from_window(probe.active_window())
+            return app_name
         except Exception as e:
             print("Ошибка получения активного приложения:", e)
             browser_active = False
             return None
 
+    # Точные интервалы фокуса ждут записи в focus_intervals; секунды по ним
+    # засчитываются в activity_buffer (с журналом) сразу
+    pending_intervals = []
+    intervals_lock = threading.Lock()
+
+    def credit_focus(user_id, app_name, started, ended):
+        for day, seconds in split_by_day(started, ended):
+            activity_buffer.add((user_id, app_name, day), seconds)
+
+    def record_focus_interval(user_id, app_name, started, ended):
+        with intervals_lock:
+            pending_intervals.append((user_id, app_name, started, ended))
+
+    focus_tracker = FocusTracker(
+        get_active_app_name, credit_focus, record_focus_interval,
+        idle_fn=probe.idle_seconds if probe is not None else None,
+        # Редкий опрос — только если смену окна сообщит система, иначе она опоздает
+        max_poll=NOTIFIED_MAX_POLL if probe is not None and probe.notifies_changes else MAX_POLL,
+    )
+
     def activity_loop():
-        """Цикл отслеживания активных приложений - работает ТОЛЬКО если user_id установлен"""
+        """Отслеживание фокуса - интервалы пишутся ТОЛЬКО если user_id установлен.
+
+        Опрос учащается после смены окна и редеет, пока фокус стабилен или
+        пользователь в простое; где есть уведомления о смене окна, ожидание
+        прерывается сразу.
+        """
         while True:
             try:
-                user_id = get_user_id()
-                if not user_id:
-                    # Если user_id не установлен, НЕ отслеживаем
-                    time.sleep(CHECK_INTERVAL)
-                    continue
-
-                app_name = get_active_app_name()
-                today = date.today()
-                if app_name:
-                    key = (user_id, app_name, today)
-                    activity_buffer[key] = activity_buffer.get(key, 0) + CHECK_INTERVAL
-                    print(f"🟢 User {user_id}: {app_name} | +{CHECK_INTERVAL} сек")
+                delay = focus_tracker.poll(get_user_id())
             except Exception as e:
                 print("Ошибка в activity_loop:", e)
-            time.sleep(CHECK_INTERVAL)
+                delay = focus_tracker.max_poll
+            started = time.monotonic()
+            if probe is not None:
+                if not probe.notifies_changes:
+                    # Хук не установился — частый опрос, как у источников без уведомлений
+                    focus_tracker.max_poll = min(focus_tracker.max_poll, MAX_POLL)
+                woke_early = probe.wait_for_change(delay)
+            else:
+                time.sleep(delay)
+                woke_early = False
+            if not woke_early:
+                # Насколько позже плана проснулся сэмплер (перегрузка, сон ОС)
+                monitor_metrics.SAMPLER_JITTER.observe(max(0.0, time.monotonic() - started - delay))
+
+    def save_focus_intervals():
+        with intervals_lock:
+            intervals = pending_intervals[:]
+            del pending_intervals[:]
+        if not intervals:
+            return
+        try:
+            activity_storage.insert_focus_intervals(intervals)
+        except Exception:
+            with intervals_lock:
+                pending_intervals[:0] = intervals
+            raise
+
+    def write_activity(rows, journal_seq):
+        # Контрольная точка журнала — в той же транзакции, что и данные
+        with monitor_metrics.DB_EXECUTE_SECONDS.time(op="upsert_activity"):
+            activity_storage.write_activity([(None, rows)], checkpoint=(sampler_journal.name, journal_seq))
 
     def save_loop():
-        """Сохранение в БД - работает ТОЛЬКО если user_id установлен"""
+        """Сохранение в БД: буфер подменяется пустым и пишется целиком (все пользователи)"""
+        # Сначала дописываем то, что прошлый запуск не успел сохранить
+        activity_journal.wait_for_db(activity_storage)
+        replayed = False
+        retry_delay = DB_RETRY_MIN
         while True:
-            time.sleep(DB_SAVE_INTERVAL)
-
-            user_id = get_user_id()
-            if not user_id:
-                # Если user_id не установлен, НЕ сохраняем
-                continue
-
-            if not activity_buffer:
-                continue
-
             try:
-                conn = psycopg2.connect(**DB_CONFIG)
-                cur = conn.cursor()
-                for (user_id_key, app_name, activity_date), seconds in list(activity_buffer.items()):
-                    # Сохраняем только для текущего пользователя
-                    if user_id_key == user_id:
-                        cur.execute("""
-                            INSERT INTO activity_monitoring (user_id, app_name, total_seconds, activity_date)
-                            VALUES (%s, %s, %s, %s)
-                            ON CONFLICT (user_id, app_name, activity_date)
-                            DO UPDATE SET total_seconds = activity_monitoring.total_seconds + EXCLUDED.total_seconds;
-                        """, (user_id, app_name, seconds, activity_date))
-                conn.commit()
-                activity_buffer.clear()
-                cur.close()
-                conn.close()
-                print("💾 Данные из буфера сохранены в БД")
+                if not replayed:
+                    restored = activity_journal.replay(activity_storage, sampler_journal, sampler_replay_upto)
+                    replayed = True
+                    if restored:
+                        print(f"♻️ Из журнала восстановлено {restored} записей активности")
+
+                if len(activity_buffer):
+                    # Замеры, пришедшие во время записи, попадут уже в новый буфер;
+                    # при ошибке снятые данные вернутся обратно
+                    with monitor_metrics.FLUSH_SECONDS.time(buffer="sampler"):
+                        saved = activity_buffer.flush(write_activity)
+                    print(f"💾 Данные из буфера сохранены в БД ({saved} записей)")
+                save_focus_intervals()
+                retry_delay = DB_RETRY_MIN
+                time.sleep(DB_SAVE_INTERVAL)
             except Exception as e:
-                print("Ошибка подключения к БД:", e)
+                # Повторяем с нарастающей, но ограниченной интервалом сохранения паузой
+                print(f"Ошибка подключения к БД (повтор через {retry_delay} сек):", e)
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, DB_SAVE_INTERVAL)
+
+    def request_user_id():
+        """user_id клиента по заголовку Authorization: Bearer <токен>"""
+        header = request.headers.get("Authorization", "")
+        scheme, _, token = header.partition(" ")
+        if scheme.lower() != "bearer":
+            return None
+        return token_store.resolve(token.strip())
+
+    # Недавно принятые ключи пакетов: повтор отвечаем сразу, не ставя в очередь.
+    # Окончательную проверку делает писатель по таблице ingest_batches
+    RECENT_BATCHES_MAX = 10000
+    recent_batches = OrderedDict()
+    recent_batches_lock = threading.Lock()
+
+    def batch_seen(key):
+        with recent_batches_lock:
+            if key in recent_batches:
+                recent_batches.move_to_end(key)
+                return True
+            return False
+
+    def remember_batch(key):
+        with recent_batches_lock:
+            recent_batches[key] = True
+            if len(recent_batches) > RECENT_BATCHES_MAX:
+                recent_batches.popitem(last=False)
+
+    def is_local_request():
+        return request.remote_addr in ("127.0.0.1", "::1")
+
+    def can_receive_token():
+        """Токен — только локальному клиенту без Origin (скрипт, десктоп) или расширению"""
+        if not is_local_request():
+            return False
+        origin = request.headers.get("Origin")
+        return origin is None or re.match(EXTENSION_ORIGIN_RE, origin) is not None
+
+    monitor_threads = {}
 
     def start_monitoring():
-        threading.Thread(target=activity_loop, daemon=True).start()
-        threading.Thread(target=save_loop, daemon=True).start()
+        ingest_queue.start()
+        for target in (activity_loop, save_loop):
+            thread = threading.Thread(target=target, name=target.__name__, daemon=True)
+            monitor_threads[target.__name__] = thread
+            thread.start()
+
+    def threads_alive():
+        alive = {(("thread", name),): int(t.is_alive()) for name, t in monitor_threads.items()}
+        for i, shard in enumerate(ingest_queue.shards):
+            alive[(("thread", f"ingest_writer_{i}"),)] = int(shard.is_alive())
+        return alive
+
+    # Значения, которые снимаются в момент запроса /metrics
+    monitor_metrics.REGISTRY.gauge(
+        "monitor_thread_alive", "Жив ли фоновый поток монитора (1/0)", threads_alive)
+    monitor_metrics.REGISTRY.gauge(
+        "monitor_buffer_keys", "Уникальных ключей в буферах, ждущих записи",
+        lambda: {(("buffer", "sampler"),): len(activity_buffer),
+                 (("buffer", "ingest"),): ingest_queue.stats()["pending_keys"]})
+    monitor_metrics.REGISTRY.gauge(
+        "monitor_ingest_queue_depth", "Пакетов в очередях приёма", lambda: ingest_queue.stats()["queue_depth"])
+    monitor_metrics.REGISTRY.gauge(
+        "monitor_ingest_requests_per_second", "Запросов /log_activity в секунду за последнюю минуту",
+        monitor_metrics.INGEST_RATE.rate)
+    monitor_metrics.REGISTRY.gauge(
+        "monitor_db_pool_in_use", "Выданных соединений пула",
+        lambda: {(("db", db),): stats["in_use"] for db, stats in db_pool.pool_stats().items()})
+    monitor_metrics.REGISTRY.gauge(
+        "monitor_db_pool_caller_in_use", "Выданных соединений пула по подсистемам",
+        lambda: {
+            (("caller", caller), ("db", db)): caller_stats["in_use"]
+            for db, stats in db_pool.pool_stats().items()
+            for caller, caller_stats in stats["callers"].items()
+        })
+
+    def drain(timeout):
+        """Финальный сброс при остановке: очередь приёма, текущий интервал, буфер"""
+        ingest_queue.stop(timeout)
+        try:
+            focus_tracker.close()
+            saved = activity_buffer.flush(write_activity)
+            save_focus_intervals()
+            print(f"💾 При остановке сохранено {saved} записей")
+        except Exception as e:
+            # Несохранённое осталось в журнале и будет дописано при следующем запуске
+            print(f"⚠️ Финальный сброс не удался, данные в журнале: {e}")
+        sampler_journal.sync()
+
+    app.extensions["activity_monitor"] = {"drain": drain, "close_streams": close_streams}
 
     # ================== ЭНДПОИНТЫ ==================
     @app.route("/")
@@ -162,10 +343,17 @@ def create_app():
             "message": "Авторизуйтесь в Flet приложении" if not user_id else "Мониторинг активен",
             "endpoints": {
                 "/": "эта страница (GET)",
-                "/log_activity": "прием данных от расширения (POST) - ТРЕБУЕТ user_id",
+                "/log_activity": "прием данных от расширения (POST) - ТРЕБУЕТ токен (Authorization: Bearer)",
+                "/auth/token": "выдача токена клиенту по email и паролю (POST)",
+                "/auth/logout": "отзыв токена клиента (POST)",
                 "/browser_status": "статус браузера (GET)",
-                "/current_user": "текущий user_id (GET)",
-                "/ping": "проверка связи (GET)"
+                "/current_user": "текущий user_id и токен для локального расширения; ETag/304, ?wait=сек — long-poll (GET)",
+                "/events": "Server-Sent Events: вход/выход пользователя (GET)",
+                "/ping": "проверка связи (GET)",
+                "/ingest_stats": "очередь приёма: глубина, задержка записи, отброшенные пакеты (GET)",
+                "/pool_stats": "метрики пула соединений с БД (GET)",
+                "/query_stats": "время SQL-запросов по месту вызова и медленные запросы; ?format=text (GET)",
+                "/metrics": "метрики в формате Prometheus; ?format=json — JSON (GET)"
             }
         })
 
@@ -176,52 +364,68 @@ def create_app():
     # ================== JS логирование ==================
     @app.route("/log_activity", methods=["POST", "OPTIONS"])
     def log_activity():
+        # Какие форматы тела принимаются — и в ответ на OPTIONS, и при 415
+        formats = {
+            "Accept-Post": ", ".join(ingest_payload.supported_types()),
+            "Accept-Encoding": "gzip, deflate",
+        }
         # Обработка OPTIONS запросов для CORS
         if request.method == "OPTIONS":
-            return jsonify({"status": "ok"}), 200
+            return jsonify({"status": "ok"}), 200, formats
 
         try:
-            # Проверяем user_id ПЕРВЫМ делом!
-            user_id = get_user_id()
+            # Пользователь определяется по токену клиента ПЕРВЫМ делом!
+            user_id = request_user_id()
             if not user_id:
-                print("❌ ОТКАЗ: user_id не установлен. Авторизуйтесь в Flet приложении.")
                 return jsonify({
                     "status": "error",
-                    "message": "User ID не установлен. Авторизуйтесь в Flet приложении.",
-                    "code": "NO_USER_ID"
-                }), 403  # 403 Forbidden - доступ запрещен без авторизации
+                    "message": "Нет действительного токена. Авторизуйтесь в Flet приложении.",
+                    "code": "INVALID_TOKEN"
+                }), 401, {"WWW-Authenticate": "Bearer"}
 
-            data = request.json
-            if not data:
-                return jsonify({"status": "error", "message": "Нет данных"}), 400
+            # JSON, msgpack или CBOR, сжатые gzip/deflate или нет; одиночный
+            # site_times или пакет интервалов entries
+            try:
+                data = ingest_payload.decode_payload(
+                    request.get_data(cache=False), request.content_type, request.headers.get("Content-Encoding")
+                )
+                rows = ingest_payload.payload_rows(data, user_id)
+                batch_id = ingest_payload.parse_batch_id(request.headers.get("Idempotency-Key"), data)
+            except PayloadError as e:
+                headers = formats if e.status == 415 else {}
+                return jsonify({"status": "error", "message": str(e), "code": e.code}), e.status, headers
+            monitor_metrics.INGEST_PAYLOAD_SITES.observe(len(rows))
+
+            if not rows:
+                return jsonify({"status": "ok", "message": "Нет данных для сохранения"})
 
-            site_times = data.get("site_times", {})
-            today = date.today()
+            if batch_id and batch_seen((user_id, batch_id)):
+                return jsonify({"status": "ok", "duplicate": True, "batch_id": batch_id, "user_id": user_id})
 
-            if not site_times:
-                return jsonify({"status": "ok", "message": "Нет данных для сохранения"})
+            if not ingest_queue.is_alive():
+                return jsonify({
+                    "status": "error",
+                    "message": "Запись в БД временно недоступна",
+                    "code": "WRITER_DOWN"
+                }), 503, {"Retry-After": "30"}
 
-            print(f"📨 Получены данные для user {user_id}: {site_times}")
-
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-            for site, seconds in site_times.items():
-                cur.execute("""
-                    INSERT INTO activity_monitoring (user_id, app_name, total_seconds, activity_date)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (user_id, app_name, activity_date)
-                    DO UPDATE SET total_seconds = activity_monitoring.total_seconds + EXCLUDED.total_seconds;
-                """, (user_id, site, seconds, today))
-            conn.commit()
-            cur.close()
-            conn.close()
-
-            print(f"✅ Данные для user {user_id} сохранены в БД")
+            # Запись в БД выполняет поток-писатель; клиенту отвечаем сразу
+            if not ingest_queue.submit(rows, batch_id):
+                print(f"⚠️ Очередь приёма переполнена, пакет user {user_id} отклонён")
+                return jsonify({
+                    "status": "error",
+                    "message": "Сервер перегружен, повторите позже",
+                    "code": "QUEUE_FULL"
+                }), 429, {"Retry-After": "10"}
+
+            if batch_id:
+                remember_batch((user_id, batch_id))
             return jsonify({
                 "status": "ok",
-                "saved_sites": len(site_times),
+                "queued_sites": len(rows),
+                "batch_id": batch_id,
                 "user_id": user_id
-            })
+            }), 202
         except Exception as e:
             print(f"❌ Ошибка в /log_activity: {e}")
             return jsonify({"status": "error", "message": str(e)}), 500
@@ -230,14 +434,138 @@ def create_app():
     def get_browser_status():
         return jsonify({"browser_active": browser_active, "user_id": get_user_id()})
 
-    @app.route("/current_user", methods=["GET"])
-    def get_current_user():
+    MAX_LONG_POLL = 55        # дольше держать /current_user?wait= не даём, сек
+    EVENTS_HEARTBEAT = 25     # комментарий в поток /events, чтобы соединение не рвалось
+    # Потоки /events и долгие опросы делят одни слоты: каждый занимает рабочий
+    # поток сервера, а /log_activity и /ping должны оставаться доступны
+    held_requests = threading.BoundedSemaphore(MAX_HELD_REQUESTS)
+
+    def too_many_waiters():
+        return jsonify({"status": "error", "message": "Слишком много подписчиков"}), 503, {"Retry-After": "60"}
+
+    def session_state(local):
         user_id = get_user_id()
-        return jsonify({
+        state = {
             "user_id": user_id,
             "has_user": bool(user_id),
+            "version": session_version,
             "message": "Авторизуйтесь в Flet приложении" if not user_id else "Пользователь авторизован"
-        })
+        }
+        # Токен пользователя этого компьютера отдаём только локальному расширению
+        # (can_receive_token): страница другого сайта его прочитать не должна
+        if user_id and local:
+            state["token"] = current_token
+        return state
+
+    def session_etag(version, local):
+        # Локальный и сетевой ответы различаются наличием токена
+        return f"session-{version}-{'l' if local else 'r'}"
+
+    @app.route("/current_user", methods=["GET"])
+    def get_current_user():
+        local = can_receive_token()
+        version = session_version
+        wait = min(request.args.get("wait", 0, type=float), MAX_LONG_POLL)
+
+        if session_etag(version, local) in request.if_none_match:
+            # Состояние у клиента актуально: при ?wait= ждём изменения, иначе 304
+            if wait > 0 and not streams_closing:
+                if not held_requests.acquire(blocking=False):
+                    return too_many_waiters()
+                try:
+                    version = wait_for_session_change(version, wait)
+                finally:
+                    held_requests.release()
+            if session_etag(version, local) in request.if_none_match:
+                response = Response(status=304)
+                response.set_etag(session_etag(version, local))
+                return response
+
+        state = session_state(local)
+        response = jsonify(state)
+        response.set_etag(session_etag(state["version"], local))
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    @app.route("/events", methods=["GET"])
+    def session_events():
+        """Поток Server-Sent Events: событие session при каждом входе/выходе"""
+        if streams_closing or not held_requests.acquire(blocking=False):
+            return too_many_waiters()
+        local = can_receive_token()
+
+        def stream():
+            version = None
+            while not streams_closing:
+                if version != session_version:
+                    state = session_state(local)
+                    version = state["version"]
+                    yield f"event: session\nid: {version}\ndata: {json.dumps(state)}\n\n"
+                elif wait_for_session_change(version, EVENTS_HEARTBEAT) == version:
+                    yield ": ping\n\n"
+
+        response = Response(stream(), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        # Слот освобождается при закрытии ответа сервером — даже если поток не начался
+        response.call_on_close(held_requests.release)
+        return response
+
+    @app.route("/auth/token", methods=["POST", "OPTIONS"])
+    def issue_token():
+        """Токен для клиента на другом компьютере: вход по email и паролю"""
+        if request.method == "OPTIONS":
+            return jsonify({"status": "ok"}), 200
+
+        data = request.get_json(silent=True) or {}
+        email = str(data.get("email", "")).strip()
+        password = str(data.get("password", ""))
+        if not email or not password:
+            return jsonify({"status": "error", "message": "Нужны email и пароль"}), 400
+
+        try:
+            user = activity_storage.find_user(email)
+        except Exception as e:
+            print(f"❌ Ошибка в /auth/token: {e}")
+            return jsonify({"status": "error", "message": "БД недоступна"}), 503, {"Retry-After": "30"}
+
+        if not user or not bcrypt.checkpw(password.encode("utf-8"), user[2].encode("utf-8")):
+            return jsonify({"status": "error", "message": "Неверный email или пароль"}), 401
+
+        client = str(data.get("client", "extension"))[:64]
+        return jsonify({"status": "ok", "user_id": user[0], "token": token_store.issue(user[0], client)})
+
+    @app.route("/auth/logout", methods=["POST", "OPTIONS"])
+    def revoke_token():
+        if request.method == "OPTIONS":
+            return jsonify({"status": "ok"}), 200
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and token.strip():
+            token_store.revoke(token.strip())
+        return jsonify({"status": "ok"})
+
+    @app.route("/ingest_stats", methods=["GET"])
+    def get_ingest_stats():
+        return jsonify(ingest_queue.stats())
+
+    @app.route("/metrics", methods=["GET"])
+    def get_metrics():
+        wants_json = (request.args.get("format") == "json"
+                      or request.accept_mimetypes.best == "application/json")
+        if wants_json:
+            return jsonify(monitor_metrics.REGISTRY.as_json())
+        return Response(monitor_metrics.REGISTRY.render_prometheus(),
+                        mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+    @app.route("/pool_stats", methods=["GET"])
+    def get_pool_stats():
+        return jsonify(db_pool.pool_stats())
+
+    @app.route("/query_stats", methods=["GET"])
+    def get_query_stats():
+        top = request.args.get("top", type=int)
+        if request.args.get("format") == "text":
+            return Response(query_stats.report(top or 20), mimetype="text/plain; charset=utf-8")
+        return jsonify(query_stats.STATS.snapshot(top))
 
     # Запускаем мониторинг в фоне
     start_monitoring()
@@ -261,7 +589,15 @@ def start_flask_monitor():
     print("   http://127.0.0.1:5000/")
     print("=" * 60)
 
-    flask_app.run(port=5000, debug=False, use_reloader=False)
+    global monitor_server
+    monitor_server = MonitorServer(flask_app)
+    monitor_server.serve_forever()
+
+
+def stop_flask_monitor():
+    """Плавная остановка сервера с финальным сбросом данных в БД"""
+    if monitor_server is not None:
+        monitor_server.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,224 @@
+# monitor_metrics.py
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы бакетов гистограмм по умолчанию, сек
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+RATE_WINDOW = 60  # окно для расчёта запросов в секунду (JSON), сек
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+class Counter:
+    """Монотонно растущий счётчик с метками"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def as_json(self):
+        with self._lock:
+            return {_format_labels(key) or "total": value for key, value in self._values.items()}
+
+
+class Histogram:
+    """Гистограмма с фиксированными бакетами (как в Prometheus)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [counts по бакетам, sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    result.append((f"{self.name}_bucket", key + (("le", repr(float(bound))),), bucket_count))
+                result.append((f"{self.name}_bucket", key + (("le", "+Inf"),), count))
+                result.append((f"{self.name}_sum", key, total))
+                result.append((f"{self.name}_count", key, count))
+        return result
+
+    def as_json(self):
+        with self._lock:
+            return {
+                _format_labels(key) or "total": {
+                    "count": count,
+                    "sum": total,
+                    "avg": total / count if count else 0.0,
+                    "buckets": {str(bound): c for bound, c in zip(self.buckets, counts)},
+                }
+                for key, (counts, total, count) in self._series.items()
+            }
+
+
+class Gauge:
+    """Значение, которое считывается в момент запроса метрик.
+
+    fn() возвращает число или словарь {метки(dict как кортеж пар): число}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+
+    def _read(self):
+        value = self.fn()
+        if isinstance(value, dict):
+            return list(value.items())
+        return [((), value)]
+
+    def samples(self):
+        return [(self.name, key, float(value)) for key, value in self._read()]
+
+    def as_json(self):
+        return {_format_labels(key) or "value": value for key, value in self._read()}
+
+
+class RateMeter:
+    """События в секунду за последние RATE_WINDOW секунд"""
+
+    def __init__(self, window=RATE_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._buckets = {}  # целая секунда -> число событий
+
+    def mark(self, count=1):
+        now = int(time.time())
+        with self._lock:
+            self._buckets[now] = self._buckets.get(now, 0) + count
+            if len(self._buckets) > self.window * 2:
+                for second in [s for s in self._buckets if s <= now - self.window]:
+                    del self._buckets[second]
+
+    def rate(self):
+        now = int(time.time())
+        with self._lock:
+            total = sum(c for s, c in self._buckets.items() if now - self.window < s <= now)
+        return total / self.window
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, fn):
+        return self.register(Gauge(name, help_text, fn))
+
+    def render_prometheus(self):
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                lines.append(f"# {metric.name}: ошибка сбора: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in samples:
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def as_json(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        result = {}
+        for metric in metrics:
+            try:
+                result[metric.name] = metric.as_json()
+            except Exception as e:
+                result[metric.name] = {"error": str(e)}
+        return result
+
+
+# ================= МЕТРИКИ ПРОЦЕССА =================
+REGISTRY = Registry()
+
+INGEST_REQUESTS = REGISTRY.counter(
+    "monitor_ingest_requests_total", "Запросы /log_activity по HTTP-статусу")
+INGEST_RATE = RateMeter()
+INGEST_PAYLOAD_BYTES = REGISTRY.histogram(
+    "monitor_ingest_payload_bytes", "Размер тела запроса /log_activity, байт", SIZE_BUCKETS)
+INGEST_PAYLOAD_SITES = REGISTRY.histogram(
+    "monitor_ingest_payload_sites", "Число сайтов в одном запросе /log_activity", (1, 5, 10, 25, 50, 100, 250, 1000))
+FLUSH_SECONDS = REGISTRY.histogram(
+    "monitor_flush_duration_seconds", "Длительность сброса буфера в БД")
+DB_CONNECT_SECONDS = REGISTRY.histogram(
+    "monitor_db_connect_seconds", "Время получения рабочего соединения из пула (ожидание, проверка, подключение)")
+DB_EXECUTE_SECONDS = REGISTRY.histogram(
+    "monitor_db_execute_seconds", "Время выполнения запросов записи в БД")
+DB_ERRORS = REGISTRY.counter(
+    "monitor_db_errors_total", "Ошибки работы с БД")
+SAMPLER_JITTER = REGISTRY.histogram(
+    "monitor_sampler_tick_jitter_seconds", "Опоздание пробуждения сэмплера относительно плана",
+    (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
@@ -0,0 +1,165 @@
+# monitor_server.py
+import os
+import threading
+import time
+
+# ================= НАСТРОЙКИ СЕРВЕРА =================
+# Всё переопределяется переменными окружения MONITOR_*
+SERVER = os.environ.get("MONITOR_SERVER", "waitress")     # waitress | dev
+HOST = os.environ.get("MONITOR_HOST", "127.0.0.1")        # 0.0.0.0 — принимать клиентов из сети
+PORT = int(os.environ.get("MONITOR_PORT", "5000"))
+THREADS = int(os.environ.get("MONITOR_THREADS", "8"))     # рабочих потоков
+KEEPALIVE_TIMEOUT = int(os.environ.get("MONITOR_KEEPALIVE_TIMEOUT", "120"))  # простой keep-alive, сек
+DRAIN_TIMEOUT = float(os.environ.get("MONITOR_DRAIN_TIMEOUT", "10"))         # ожидание запросов при остановке
+# Потоки /events и долгие опросы /current_user?wait= держат рабочий поток всё
+# время ожидания; вместе их не больше четверти THREADS, остальные — приёму
+MAX_HELD_REQUESTS = int(os.environ.get("MONITOR_MAX_HELD_REQUESTS", str(max(1, THREADS // 4))))
+
+
+class _TrackedBody:
+    """Тело ответа, которое снимает запрос с учёта только после close() сервера"""
+
+    def __init__(self, body, done):
+        self._body = body
+        self._done = done
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def close(self):
+        try:
+            close = getattr(self._body, "close", None)
+            if close is not None:
+                close()
+        finally:
+            done, self._done = self._done, None
+            if done is not None:
+                done()
+
+
+class InFlightMiddleware:
+    """WSGI-обёртка: считает запросы в обработке, чтобы дождаться их при остановке.
+
+    Запрос считается до закрытия тела ответа, так что потоковые ответы
+    (/events) тоже учитываются, пока сервер их отдаёт.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self.in_flight = 0
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            body = self.app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        return _TrackedBody(body, self._done)
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout):
+        """True — все запросы завершились за timeout"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self.in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+
+class MonitorServer:
+    """Запуск Flask-приложения монитора под production-сервером.
+
+    По умолчанию — waitress (чистый Python, работает и на Windows): пул из
+    THREADS рабочих потоков, HTTP/1.1 keep-alive. Несколько процессов не
+    используются намеренно: в процессе монитора живут сэмплер окон, буферы и
+    журналы, их нельзя дублировать. Без waitress (или с MONITOR_SERVER=dev)
+    используется многопоточный сервер Werkzeug, тоже с keep-alive.
+
+    stop() останавливает приём соединений, просит приложение завершить
+    открытые потоки и долгие опросы (close_streams), ждёт запросы в обработке
+    не дольше DRAIN_TIMEOUT и вызывает drain-функцию приложения (финальный
+    сброс в БД).
+    """
+
+    def __init__(self, app, host=HOST, port=PORT, threads=THREADS, server=SERVER,
+                 keepalive_timeout=KEEPALIVE_TIMEOUT, drain_timeout=DRAIN_TIMEOUT):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.server = server
+        self.keepalive_timeout = keepalive_timeout
+        self.drain_timeout = drain_timeout
+        self.middleware = InFlightMiddleware(app.wsgi_app)
+        app.wsgi_app = self.middleware
+        self._server = None
+        self._stopped = threading.Event()
+
+    def _make_waitress(self):
+        import waitress
+        return waitress.create_server(
+            self.app, host=self.host, port=self.port, threads=self.threads,
+            channel_timeout=self.keepalive_timeout, ident="activity_monitor"
+        )
+
+    def _make_dev(self):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+        # HTTP/1.1 — иначе Werkzeug закрывает соединение после каждого ответа
+        WSGIRequestHandler.protocol_version = "HTTP/1.1"
+        return make_server(self.host, self.port, self.app, threaded=True)
+
+    def serve_forever(self):
+        if self.server == "waitress":
+            try:
+                self._server = self._make_waitress()
+            except ImportError:
+                print("⚠️ waitress не установлен (pip install waitress), запускаю сервер Werkzeug")
+                self.server = "dev"
+        if self._server is None:
+            self._server = self._make_dev()
+
+        print(f"🌐 Сервер {self.server}: http://{self.host}:{self.port}, потоков: {self.threads}")
+        if self.server == "waitress":
+            self._server.run()
+        else:
+            self._server.serve_forever()
+
+    def stop(self):
+        """Плавная остановка: новые соединения не принимаются, текущие дорабатывают"""
+        if self._stopped.is_set() or self._server is None:
+            return
+        self._stopped.set()
+
+        print("🛑 Останавливаю сервер монитора...")
+        if self.server == "waitress":
+            self._server.close()
+        else:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+        hooks = self.app.extensions.get("activity_monitor", {})
+        close_streams = hooks.get("close_streams")
+        if close_streams:
+            close_streams()
+
+        if not self.middleware.wait_idle(self.drain_timeout):
+            print(f"⚠️ Не дождались {self.middleware.in_flight} запросов за {self.drain_timeout} сек")
+
+        drain = hooks.get("drain")
+        if drain:
+            drain(self.drain_timeout)
+
+        if self.server == "waitress":
+            self._server.task_dispatcher.shutdown()
+        print("✅ Сервер монитора остановлен")
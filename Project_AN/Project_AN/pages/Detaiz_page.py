@@ -1,15 +1,20 @@
 import flet as ft
-import psycopg2
 from flet_route import Params, Basket
-import datetime
-
-# --- Настройки подключения ---
-DB_CONFIG = {
-    "host": "localhost",
-    "dbname": "Your_db_name",
-    "user": "postgres",
-    "password": "Your_password",
-    "port": 5432
+import activity_summary
+import app_categories
+
+# --- Сводки активности — одним запросом и с памятью по периоду (activity_summary.py) ---
+# Старые записи удаляет фоновое обслуживание (main.run_activity_maintenance)
+summary_service = activity_summary.get_service()
+
+# Категории приложений — app_categories.py; здесь только их значки
+CATEGORY_ICONS = {
+    "browser": ft.Icons.WEB,
+    "social": ft.Icons.CHAT_BUBBLE,
+    "entertainment": ft.Icons.PLAY_CIRCLE,
+    "productivity": ft.Icons.WORK,
+    "gaming": ft.Icons.SPORTS_ESPORTS,
+    app_categories.OTHER: ft.Icons.APPS,
 }
 
 
@@ -39,35 +44,6 @@ def Detalization_page(page: ft.Page, basket: Basket, params: Params):
             ]
         )
 
-    # Функция для удаления старых записей (старше 31 дня)
-    def cleanup_old_records():
-        """Удаляет записи старше 31 дня для текущего пользователя"""
-        try:
-            connection = psycopg2.connect(**DB_CONFIG)
-            cursor = connection.cursor()
-
-            # Вычисляем дату 31 день назад
-            cutoff_date = datetime.date.today() - datetime.timedelta(days=31)
-
-            # Удаляем записи старше cutoff_date
-            cursor.execute("""
-                DELETE FROM activity_monitoring 
-                WHERE user_id = %s AND activity_date < %s
-            """, (user_id, cutoff_date))
-
-            deleted_count = cursor.rowcount
-
-            connection.commit()
-            cursor.close()
-            connection.close()
-
-            print(f"Автоматически удалено {deleted_count} записей старше {cutoff_date}")
-            return deleted_count
-
-        except Exception as e:
-            print(f"Ошибка при удалении старых записей: {e}")
-            return 0
-
     # Функция для форматирования времени
     def format_time(seconds):
         """Преобразует секунды в часы и минуты"""
@@ -107,68 +83,13 @@ def Detalization_page(page: ft.Page, basket: Basket, params: Params):
     date_info_text = ft.Text("", size=12, color="#333333")
 
     # --- Функция для получения данных из БД ---
-    def fetch_data(period):
+    def fetch_data(period, refresh=False):
         try:
-            connection = psycopg2.connect(**DB_CONFIG)
-            cursor = connection.cursor()
-
-            today = datetime.date.today()
-
-            if period == "today":
-                start_date = today
-                end_date = today
-                cursor.execute("""
-                    SELECT 
-                        app_name, 
-                        SUM(total_seconds) as total_seconds,
-                        ROUND(SUM(total_seconds) / 3600.0, 2) as total_hours
-                    FROM activity_monitoring 
-                    WHERE user_id = %s AND activity_date = %s
-                    GROUP BY app_name
-                    ORDER BY total_seconds DESC
-                """, (user_id, today))
-                period_text = "сегодня"
-
-            elif period == "week":
-                start_date = today - datetime.timedelta(days=6)
-                end_date = today
-                cursor.execute("""
-                    SELECT 
-                        app_name, 
-                        SUM(total_seconds) as total_seconds,
-                        ROUND(SUM(total_seconds) / 3600.0, 2) as total_hours
-                    FROM activity_monitoring 
-                    WHERE user_id = %s AND activity_date BETWEEN %s AND %s
-                    GROUP BY app_name
-                    ORDER BY total_seconds DESC
-                """, (user_id, start_date, end_date))
-                period_text = "за последние 7 дней"
-
-            else:
-                start_date = today - datetime.timedelta(days=29)
-                end_date = today
-                cursor.execute("""
-                    SELECT 
-                        app_name, 
-                        SUM(total_seconds) as total_seconds,
-                        ROUND(SUM(total_seconds) / 3600.0, 2) as total_hours
-                    FROM activity_monitoring 
-                    WHERE user_id = %s AND activity_date BETWEEN %s AND %s
-                    GROUP BY app_name
-                    ORDER BY total_seconds DESC
-                """, (user_id, start_date, end_date))
-                period_text = "за последние 30 дней"
-
-            data = cursor.fetchall()
-
-            cursor.execute("""
-                SELECT MIN(activity_date), MAX(activity_date) 
-                FROM activity_monitoring 
-                WHERE user_id = %s
-            """, (user_id,))
-
-            date_range = cursor.fetchone()
-            min_date, max_date = date_range if date_range else (None, None)
+            summary = summary_service.get(user_id, period, refresh=refresh)
+            data = summary.apps
+            min_date, max_date = summary.min_date, summary.max_date
+            start_date, end_date = summary.start_date, summary.end_date
+            period_text = summary.period_text
 
             if min_date and max_date:
                 date_info = f"Данные с {min_date.strftime('%d.%m.%Y')} по {max_date.strftime('%d.%m.%Y')}"
@@ -179,19 +100,17 @@ def Detalization_page(page: ft.Page, basket: Basket, params: Params):
 
             debug_text.value = f"Период: {period_text}"
 
-            total_seconds = 0
+            total_seconds = summary.total_seconds
             app_data = []
-            for app_name, total_seconds_db, total_hours_db in data:
-                total_seconds += total_seconds_db
+            categories = app_categories.categorize((app_name for app_name, _ in data), user_id)
+            for app_name, total_seconds_db in data:
                 app_data.append({
                     'app_name': app_name,
                     'seconds': total_seconds_db,
-                    'hours': total_hours_db
+                    'hours': round(total_seconds_db / 3600, 2),
+                    'category': categories[app_name],
                 })
 
-            cursor.close()
-            connection.close()
-
             total_hours = round(total_seconds / 3600, 2) if total_seconds > 0 else 0
 
             return app_data, total_hours, total_seconds, period_text
@@ -234,19 +153,7 @@ def Detalization_page(page: ft.Page, basket: Basket, params: Params):
 
         for i, app in enumerate(top_apps):
             percentage = (app['seconds'] / total_seconds) * 100
-
-            category = "Приложение"
-            app_lower = app['app_name'].lower()
-            if any(browser in app_lower for browser in
-                   ['chrome', 'firefox', 'safari', 'edge', 'opera', 'brave', 'yandex']):
-                category = "Браузер"
-            elif any(social in app_lower for social in
-                     ['telegram', 'whatsapp', 'vk', 'discord', 'instagram', 'facebook', 'twitter']):
-                category = "Соцсети"
-            elif any(work in app_lower for work in ['vscode', 'pycharm', 'word', 'excel', 'powerpoint', 'notion']):
-                category = "Работа"
-            elif any(media in app_lower for media in ['spotify', 'youtube', 'netflix', 'twitch', 'tiktok']):
-                category = "Медиа"
+            category = app_categories.CATEGORY_LABELS[app['category']]
 
             chart_sections.append(
                 ft.PieChartSection(
@@ -262,15 +169,7 @@ def Detalization_page(page: ft.Page, basket: Basket, params: Params):
                 )
             )
 
-            icon = ft.Icons.WEB
-            if category == "Браузер":
-                icon = ft.Icons.WEB
-            elif category == "Соцсети":
-                icon = ft.Icons.PEOPLE
-            elif category == "Работа":
-                icon = ft.Icons.WORK
-            elif category == "Медиа":
-                icon = ft.Icons.PLAY_CIRCLE
+            icon = CATEGORY_ICONS[app['category']]
 
             legend_items.append(
                 ft.Container(
@@ -344,27 +243,12 @@ def Detalization_page(page: ft.Page, basket: Basket, params: Params):
         )
 
         categories_stats = {
-            "Браузер": {"seconds": 0, "apps": []},
-            "Соцсети": {"seconds": 0, "apps": []},
-            "Работа": {"seconds": 0, "apps": []},
-            "Медиа": {"seconds": 0, "apps": []},
-            "Другие": {"seconds": 0, "apps": []},
+            app_categories.CATEGORY_LABELS[category]: {"seconds": 0, "apps": []}
+            for category in (*app_categories.CATEGORIES, app_categories.OTHER)
         }
 
         for app in app_data:
-            app_lower = app['app_name'].lower()
-            category = "Другие"
-            if any(browser in app_lower for browser in
-                   ['chrome', 'firefox', 'safari', 'edge', 'opera', 'brave', 'yandex']):
-                category = "Браузер"
-            elif any(social in app_lower for social in
-                     ['telegram', 'whatsapp', 'vk', 'discord', 'instagram', 'facebook', 'twitter']):
-                category = "Соцсети"
-            elif any(work in app_lower for work in ['vscode', 'pycharm', 'word', 'excel', 'powerpoint', 'notion']):
-                category = "Работа"
-            elif any(media in app_lower for media in ['spotify', 'youtube', 'netflix', 'twitch', 'tiktok']):
-                category = "Медиа"
-
+            category = app_categories.CATEGORY_LABELS[app['category']]
             categories_stats[category]["seconds"] += app['seconds']
             categories_stats[category]["apps"].append(app['app_name'])
 
@@ -433,21 +317,40 @@ def Detalization_page(page: ft.Page, basket: Basket, params: Params):
             border=ft.border.all(1, "#E0E0E0"),
         )
 
-    # --- Функция для обновления отображения ---
-    def update_display(e=None):
-        deleted_count = cleanup_old_records()
-
-        if deleted_count > 0:
+    # --- Своя категория приложения: только для этого имени (app_categories.set_user_category) ---
+    def change_category(app_name, category):
+        try:
+            app_categories.set_user_category(user_id, app_name, category)
+        except Exception as e:
+            print(f"Ошибка при сохранении категории: {e}")
             page.snack_bar = ft.SnackBar(
-                ft.Text(f"Автоматически удалено {deleted_count} записей старше 31 дня",
-                        color="#FFFFFF"),
-                bgcolor="#4A90E2",
-                duration=3000
+                content=ft.Text(f"Не удалось сохранить категорию: {e}", size=14, color=ft.Colors.WHITE),
+                bgcolor=ft.Colors.RED_ACCENT_200,
+                duration=2000
             )
             page.snack_bar.open = True
+            page.update()
+            return
+        update_display()
 
+    def category_menu(app):
+        return ft.PopupMenuButton(
+            icon=ft.Icons.LABEL_OUTLINE,
+            tooltip=f"Категория: {app_categories.CATEGORY_LABELS[app['category']]}",
+            items=[
+                ft.PopupMenuItem(
+                    text=label,
+                    checked=category == app['category'],
+                    on_click=lambda e, category=category: change_category(app['app_name'], category),
+                )
+                for category, label in app_categories.CATEGORY_LABELS.items()
+            ],
+        )
+
+    # --- Функция для обновления отображения ---
+    def update_display(e=None, refresh=False):
         period = period_dropdown.value
-        app_data, total_hours, total_seconds, period_text = fetch_data(period)
+        app_data, total_hours, total_seconds, period_text = fetch_data(period, refresh)
 
         if total_hours > 0:
             summary_text.value = f"📊 Общая активность: {total_hours} часов ({format_time_detailed(total_seconds)}) {period_text}"
@@ -500,18 +403,7 @@ def Detalization_page(page: ft.Page, basket: Basket, params: Params):
             for i, app in enumerate(app_data[:10]):
                 percentage = (app['seconds'] / total_seconds) * 100 if total_seconds > 0 else 0
 
-                icon = ft.Icons.APPS
-                app_lower = app['app_name'].lower()
-                if any(browser in app_lower for browser in ['chrome', 'firefox', 'safari', 'edge', 'opera']):
-                    icon = ft.Icons.WEB
-                elif any(social in app_lower for social in ['telegram', 'whatsapp', 'vk', 'discord']):
-                    icon = ft.Icons.CHAT_BUBBLE
-                elif 'tiktok' in app_lower or 'instagram' in app_lower:
-                    icon = ft.Icons.VIDEO_LIBRARY
-                elif 'spotify' in app_lower or 'youtube' in app_lower:
-                    icon = ft.Icons.MUSIC_NOTE
-                elif any(work in app_lower for work in ['vscode', 'pycharm', 'word', 'excel']):
-                    icon = ft.Icons.WORK
+                icon = CATEGORY_ICONS[app['category']]
 
                 app_items.append(
                     ft.Container(
@@ -536,6 +428,7 @@ def Detalization_page(page: ft.Page, basket: Basket, params: Params):
                                 width=60,
                                 alignment=ft.alignment.center_right,
                             ),
+                            category_menu(app),
                         ], vertical_alignment=ft.CrossAxisAlignment.CENTER),
                         padding=ft.padding.symmetric(vertical=12, horizontal=15),
                         bgcolor="#FFFFFF" if i % 2 == 0 else "#F7F7F7",
@@ -606,7 +499,7 @@ def Detalization_page(page: ft.Page, basket: Basket, params: Params):
                         ft.IconButton(
                             icon=ft.Icons.REFRESH,
                             icon_color="#4A90E2",
-                            on_click=update_display,
+                            on_click=lambda e: update_display(refresh=True),
                             tooltip="Обновить данные"
                         ),
                     ], alignment=ft.MainAxisAlignment.CENTER, spacing=10)
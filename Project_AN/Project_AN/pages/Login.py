@@ -1,7 +1,7 @@
 import flet as ft
 from flet_route import Params, Basket
-import psycopg2
 import bcrypt
+import storage
 
 
 def Login_page(page: ft.Page, params: Params, basket: Basket):
@@ -78,21 +78,7 @@ def Login_page(page: ft.Page, params: Params, basket: Basket):
         page.update()
 
         try:
-            conn = psycopg2.connect(
-                dbname="Your_db_name",
-                user="postgres",
-                password="Your_password",
-                host="localhost",
-                port="5432"
-            )
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT id_user, email, password_hash FROM users WHERE email = %s",
-                (email,)
-            )
-            user = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            user = storage.get_storage(caller="auth").find_user(email)
 
             if user:
                 db_user_id = user[0]
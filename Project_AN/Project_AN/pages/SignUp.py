@@ -1,7 +1,7 @@
 import flet as ft
 from flet_route import Params, Basket
-import psycopg2
 import bcrypt
+import storage
 from email_validator import validate_email, EmailNotValidError
 import time
 import threading
@@ -72,24 +72,7 @@ def SignUP_page(page: ft.Page, params: Params, basket: Basket):
         password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
         try:
-            conn = psycopg2.connect(
-                dbname="Your_db_name",
-                user="postgres",
-                password="Your_password",
-                host="localhost",
-                port="5432"
-            )
-            cursor = conn.cursor()
-
-            cursor.execute(
-                "INSERT INTO users (email, password_hash) VALUES (%s, %s) RETURNING id_user",
-                (email, password_hash)
-            )
-
-            user_id = cursor.fetchone()[0]
-            conn.commit()
-            cursor.close()
-            conn.close()
+            user_id = storage.get_storage(caller="auth").create_user(email, password_hash)
 
             username = email.split('@')[0]
 
@@ -131,7 +114,7 @@ def SignUP_page(page: ft.Page, params: Params, basket: Basket):
             user_password.value = ""
             btn_reg.disabled = True
 
-        except psycopg2.errors.UniqueViolation:
+        except storage.UserExistsError:
             show_message("Такой Email уже зарегистрирован", is_error=True)
         except Exception as e:
             show_message(f"Ошибка: {e}", is_error=True)
@@ -1,24 +1,18 @@
 import flet as ft
 from flet_route import Params, Basket
 import google.generativeai as genai
-import psycopg2
-from psycopg2 import extras
 from datetime import datetime, timedelta
 import json
 import re
+import app_categories
+import storage
 
 # --- 1. КОНФИГУРАЦИЯ API И БД ---
 
 genai.configure(api_key="Your_API_KEY")
 model = genai.GenerativeModel("gemini-2.5-flash")
 
-DB_CONFIG = {
-    "host": "localhost",
-    "dbname": "Your_db_name",
-    "user": "postgres",
-    "password": "Your_password",
-    "port": 5432
-}
+home_storage = storage.get_storage(caller="home")
 
 
 # --- 2. ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ БД ---
@@ -26,48 +20,23 @@ DB_CONFIG = {
 def get_user_schedule(user_id):
     """Извлекает расписание пользователя из БД и форматирует его."""
     schedule_data = {}
-    conn = None
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=extras.DictCursor)
-
-        query = """
-        SELECT 
-            sd.day_of_week,
-            st.start_time,
-            st.description
-        FROM 
-            schedule_days sd
-        JOIN 
-            schedule_tasks st ON sd.id_day = st.day_id
-        WHERE 
-            sd.user_id = %s
-        ORDER BY 
-            sd.day_of_week, st.start_time;
-        """
-        cursor.execute(query, (user_id,))
-        results = cursor.fetchall()
+        results = home_storage.get_week_schedule(user_id)
 
         # Дни недели для отображения
         days_of_week = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
 
-        for row in results:
-            day_num = row['day_of_week']
+        for day_num, start_time, description in results:
             day_name = days_of_week[day_num - 1] if 1 <= day_num <= 7 else f"День {day_num}"
-            start_time = row['start_time']
-            description = row['description']
 
             if day_name not in schedule_data:
                 schedule_data[day_name] = []
             # НОВЫЙ ФОРМАТ: время задача
             schedule_data[day_name].append(f"{start_time} {description}")
 
-    except (Exception, psycopg2.Error) as error:
-        print(f"Ошибка при работе с PostgreSQL: {error}")
+    except Exception as error:
+        print(f"Ошибка при получении расписания: {error}")
         return None, f"Ошибка БД: {error}"
-    finally:
-        if conn:
-            conn.close()
 
     # Форматирование расписания в строку
     formatted_schedule = ""
@@ -86,69 +55,33 @@ def get_user_schedule(user_id):
 
 def get_user_activity_data(user_id, days=7):
     """Получает данные об активности пользователя за последние N дней."""
-    activity_data = {}
-    conn = None
+    app_totals = {}
+    daily_hours = {}
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=extras.DictCursor)
-
         # Рассчитываем дату начала периода
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days - 1)
 
-        query = """
-        SELECT 
-            activity_date,
-            app_name,
-            total_seconds
-        FROM 
-            activity_monitoring
-        WHERE 
-            user_id = %s
-            AND activity_date BETWEEN %s AND %s
-        ORDER BY 
-            activity_date, total_seconds DESC;
-        """
-        cursor.execute(query, (user_id, start_date, end_date))
-        results = cursor.fetchall()
-
-        # Группируем данные по датам
-        for row in results:
-            date_str = row['activity_date'].strftime("%Y-%m-%d")
-            app_name = row['app_name']
-            hours = row['total_seconds'] / 3600
-
-            if date_str not in activity_data:
-                activity_data[date_str] = []
-
-            activity_data[date_str].append({
-                'app': app_name,
-                'hours': round(hours, 2)
-            })
-
-    except (Exception, psycopg2.Error) as error:
+        # Итоги по приложениям и по дням читаются из свёрток, а не из сырых строк
+        for app_name, total_seconds in home_storage.activity_totals(user_id, start_date, end_date):
+            app_totals[app_name] = total_seconds / 3600
+        for activity_date, total_seconds in home_storage.daily_totals(user_id, start_date, end_date):
+            daily_hours[activity_date.strftime("%Y-%m-%d")] = total_seconds / 3600
+
+    except Exception as error:
         print(f"Ошибка при получении данных активности: {error}")
         return None, f"Ошибка БД активности: {error}"
-    finally:
-        if conn:
-            conn.close()
 
     # Форматируем данные активности
     formatted_activity = ""
-    if activity_data:
+    if app_totals:
         formatted_activity = "\n\n📊 СТАТИСТИКА ИСПОЛЬЗОВАНИЯ ПРИЛОЖЕНИЙ ЗА ПОСЛЕДНИЕ 7 ДНЕЙ:\n"
 
-        # Общая статистика по приложениям за неделю
-        app_totals = {}
-        app_categories = categorize_apps(activity_data)
-
-        for date_str, apps in activity_data.items():
-            for app_data in apps:
-                app_name = app_data['app']
-                app_totals[app_name] = app_totals.get(app_name, 0) + app_data['hours']
+        # Общая статистика по приложениям за неделю (с правилами пользователя)
+        categories = app_categories.categorize(app_totals, user_id)
 
         # Рассчитываем СРЕДНЕЕ В ДЕНЬ для каждого приложения
-        days_with_data = len(activity_data)
+        days_with_data = len(daily_hours)
         app_daily_average = {}
         if days_with_data > 0:
             for app_name, total_hours in app_totals.items():
@@ -168,7 +101,7 @@ def get_user_activity_data(user_id, days=7):
         other_daily = 0
 
         for app_name, total_hours in app_totals.items():
-            category = app_categories.get(app_name, 'other')
+            category = categories.get(app_name, app_categories.OTHER)
             daily_avg = app_daily_average.get(app_name, 0)
 
             if category == 'productivity':
@@ -200,14 +133,13 @@ def get_user_activity_data(user_id, days=7):
 
         for app_name, daily_avg in sorted_apps[:7]:
             total_hours = app_totals.get(app_name, 0)
-            category = app_categories.get(app_name, 'other')
-            category_icon = get_category_icon(category)
+            category = categories.get(app_name, app_categories.OTHER)
+            category_icon = app_categories.CATEGORY_ICONS[category]
             formatted_activity += f"  {category_icon} {app_name}: {round(daily_avg, 1)} ч/день (всего {round(total_hours, 1)} ч)\n"
 
         # Добавляем анализ по дням
         formatted_activity += f"\n📅 ДНЕВНАЯ СТАТИСТИКА:\n"
-        for date_str, apps in activity_data.items():
-            day_total = sum(app['hours'] for app in apps)
+        for date_str, day_total in daily_hours.items():
             formatted_activity += f"  {date_str}: {round(day_total, 2)} часов активности\n"
 
     else:
@@ -216,91 +148,18 @@ def get_user_activity_data(user_id, days=7):
     return formatted_activity, None
 
 
-def categorize_apps(activity_data):
-    """Категоризирует приложения по типам."""
-    app_categories = {}
-
-    # Определяем категории по ключевым словам
-    gaming_keywords = ['game', 'steam', 'epic', 'origin', 'battle.net', 'dota', 'cs:', 'fortnite', 'minecraft',
-                       'roblox']
-    social_keywords = ['facebook', 'instagram', 'vk', 'telegram', 'whatsapp', 'messenger', 'twitter', 'x.com', 'tiktok',
-                       'discord']
-    entertainment_keywords = ['youtube', 'netflix', 'spotify', 'twitch', 'disney+', 'hbo', 'prime video', 'kinopoisk']
-    productivity_keywords = ['word', 'excel', 'powerpoint', 'notion', 'todo', 'calendar', 'outlook', 'gmail', 'slack',
-                             'teams', 'zoom', 'figma', 'photoshop']
-
-    # Проходим по всем данным и категоризируем
-    for date_str, apps in activity_data.items():
-        for app_data in apps:
-            app_name = app_data['app'].lower()
-
-            if any(keyword in app_name for keyword in gaming_keywords):
-                app_categories[app_data['app']] = 'gaming'
-            elif any(keyword in app_name for keyword in social_keywords):
-                app_categories[app_data['app']] = 'social'
-            elif any(keyword in app_name for keyword in entertainment_keywords):
-                app_categories[app_data['app']] = 'entertainment'
-            elif any(keyword in app_name for keyword in productivity_keywords):
-                app_categories[app_data['app']] = 'productivity'
-            else:
-                app_categories[app_data['app']] = 'other'
-
-    return app_categories
-
-
-def get_category_icon(category):
-    """Возвращает иконку для категории приложения."""
-    icons = {
-        'gaming': '🎮',
-        'social': '💬',
-        'entertainment': '🎬',
-        'productivity': '💼',
-        'other': '📱'
-    }
-    return icons.get(category, '📱')
-
-
 def save_ai_schedule(user_id, schedule_data_by_day):
     """Сохраняет расписание, предложенное AI, в таблицу ai_generated_schedules.
     schedule_data_by_day: словарь {день_недели: [список_задач]}
     """
-    conn = None
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-
-        saved_days = []
-
-        for day_of_week, schedule_data in schedule_data_by_day.items():
-            if not schedule_data:  # Пропускаем пустые дни
-                continue
-
-            # Удаляем старые записи для этого пользователя и дня недели
-            delete_query = """
-            DELETE FROM ai_generated_schedules 
-            WHERE user_id = %s AND day_of_week = %s
-            """
-            cursor.execute(delete_query, (user_id, day_of_week))
-
-            # Вставляем новое расписание
-            insert_query = """
-            INSERT INTO ai_generated_schedules (user_id, day_of_week, data)
-            VALUES (%s, %s, %s)
-            """
-            cursor.execute(insert_query, (user_id, day_of_week, json.dumps(schedule_data, ensure_ascii=False)))
-            saved_days.append(day_of_week)
-
-        conn.commit()
+        # Все дни сохраняются одной транзакцией, пустые пропускаются
+        saved_days = home_storage.save_ai_schedules(user_id, schedule_data_by_day)
         return saved_days, None
 
-    except (Exception, psycopg2.Error) as error:
-        if conn:
-            conn.rollback()
+    except Exception as error:
         print(f"Ошибка при сохранении расписания AI: {error}")
         return [], f"Ошибка БД: {error}"
-    finally:
-        if conn:
-            conn.close()
 
 
 def parse_ai_response_for_schedule(ai_response):
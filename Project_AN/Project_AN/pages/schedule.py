@@ -1,19 +1,13 @@
 import flet as ft
-import psycopg2
 from flet_route import Params, Basket
 import datetime
 import json
 import threading
 import time
+import storage
 
-# --- Настройки подключения ---
-DB_CONFIG = {
-    "host": "localhost",
-    "dbname": "Your_db_name",
-    "user": "postgres",
-    "password": "Your_password",
-    "port": 5432
-}
+# --- Хранилище расписаний (storage.py: PostgreSQL или SQLite) ---
+schedule_storage = storage.get_storage(caller="schedule")
 
 # Цвета для градиента
 GRADIENT_COLORS = ["#E6FFF0", "#ADF0C3"]
@@ -55,52 +49,6 @@ def Schedule_page(page: ft.Page, params: Params, basket: Basket):
     # Кэш для хранения загруженных данных
     ai_schedules_cache = {}
     current_schedule_cache = {}
-    conn_pool = []
-
-    # --- Функция для получения соединения с БД (с пулом) ---
-    def get_conn():
-        try:
-            if conn_pool:
-                return conn_pool.pop()
-            return psycopg2.connect(**DB_CONFIG)
-        except Exception as e:
-            print(f"Ошибка подключения к БД: {e}")
-            return None
-
-    # --- Функция для возврата соединения в пул ---
-    def release_conn(conn):
-        if conn and not conn.closed:
-            conn_pool.append(conn)
-
-    # --- Функция для быстрого выполнения запроса ---
-    def execute_query(query, params=None, fetchone=False, fetchall=False, commit=False):
-        conn = get_conn()
-        if not conn:
-            return None
-
-        try:
-            cur = conn.cursor()
-            cur.execute(query, params or ())
-
-            if commit:
-                conn.commit()
-
-            result = None
-            if fetchone:
-                result = cur.fetchone()
-            elif fetchall:
-                result = cur.fetchall()
-
-            cur.close()
-            release_conn(conn)
-            return result
-
-        except Exception as e:
-            print(f"Ошибка выполнения запроса: {e}")
-            if conn:
-                conn.rollback()
-                release_conn(conn)
-            return None
 
     # --- Функция для отображения сообщений ---
     def show_message(text: str, color=ft.Colors.RED_ACCENT_200):
@@ -215,13 +163,7 @@ def Schedule_page(page: ft.Page, params: Params, basket: Basket):
             return current_schedule_cache[cache_key]
 
         try:
-            result = execute_query("""
-                SELECT st.start_time, st.description 
-                FROM schedule_days sd 
-                JOIN schedule_tasks st ON sd.id_day = st.day_id 
-                WHERE sd.user_id = %s AND sd.day_of_week = %s 
-                ORDER BY st.start_time
-            """, (user_id, day_index), fetchall=True)
+            result = schedule_storage.get_day_schedule(user_id, day_index)
 
             tasks = []
             if result:
@@ -247,14 +189,11 @@ def Schedule_page(page: ft.Page, params: Params, basket: Basket):
             return ai_schedules_cache[cache_key]
 
         try:
-            result = execute_query(
-                "SELECT data FROM ai_generated_schedules WHERE user_id = %s AND day_of_week = %s",
-                (user_id, day_index), fetchone=True
-            )
+            result = schedule_storage.get_ai_schedule(user_id, day_index)
 
-            if result and result[0]:
-                ai_schedules_cache[cache_key] = result[0]
-                return result[0]
+            if result:
+                ai_schedules_cache[cache_key] = result
+                return result
             return None
         except Exception as ex:
             print(f"Ошибка при получении AI-графика: {ex}")
@@ -266,10 +205,7 @@ def Schedule_page(page: ft.Page, params: Params, basket: Basket):
             cache_key = f"ai_{user_id}_{day_index}"
             ai_schedules_cache.pop(cache_key, None)
 
-            execute_query(
-                "DELETE FROM ai_generated_schedules WHERE user_id = %s AND day_of_week = %s",
-                (user_id, day_index), commit=True
-            )
+            schedule_storage.delete_ai_schedule(user_id, day_index)
             return True
         except Exception as ex:
             print(f"Ошибка при удалении AI-графика: {ex}")
@@ -278,21 +214,6 @@ def Schedule_page(page: ft.Page, params: Params, basket: Basket):
     # --- Сохранение графика в БД ---
     def save_schedule_to_db(day_index: int, tasks_list):
         try:
-            execute_query(
-                "DELETE FROM schedule_days WHERE user_id = %s AND day_of_week = %s",
-                (user_id, day_index), commit=True
-            )
-
-            result = execute_query("""
-                INSERT INTO schedule_days (user_id, day_of_week) 
-                VALUES (%s, %s) RETURNING id_day
-            """, (user_id, day_index), fetchone=True)
-
-            if not result:
-                return False
-
-            day_id = result[0]
-
             tasks_to_insert = []
             for task in tasks_list:
                 if " - " in task:
@@ -302,21 +223,12 @@ def Schedule_page(page: ft.Page, params: Params, basket: Basket):
                             h, m = map(int, time_part.split(":"))
                             if 0 <= h <= 23 and 0 <= m <= 59:
                                 start_time_obj = datetime.time(hour=h, minute=m)
-                                tasks_to_insert.append((day_id, start_time_obj, desc_part.strip()))
+                                tasks_to_insert.append((start_time_obj, desc_part.strip()))
                     except:
                         continue
 
-            if tasks_to_insert:
-                conn = get_conn()
-                if conn:
-                    cur = conn.cursor()
-                    cur.executemany(
-                        "INSERT INTO schedule_tasks (day_id, start_time, description) VALUES (%s, %s, %s)",
-                        tasks_to_insert
-                    )
-                    conn.commit()
-                    cur.close()
-                    release_conn(conn)
+            # День и его задачи заменяются одной транзакцией
+            schedule_storage.replace_day_schedule(user_id, day_index, tasks_to_insert)
 
             cache_key = f"current_{user_id}_{day_index}"
             current_schedule_cache[cache_key] = tasks_list
@@ -525,12 +437,7 @@ def Schedule_page(page: ft.Page, params: Params, basket: Basket):
     # --- Обновление кнопок сравнения ---
     def update_compare_buttons():
         try:
-            result = execute_query(
-                "SELECT day_of_week FROM ai_generated_schedules WHERE user_id = %s",
-                (user_id,), fetchall=True
-            )
-
-            ai_days = set(row[0] for row in result) if result else set()
+            ai_days = schedule_storage.ai_schedule_days(user_id)
 
             for wb in week_blocks:
                 has_ai = wb["day_index"] in ai_days
@@ -679,10 +586,7 @@ def Schedule_page(page: ft.Page, params: Params, basket: Basket):
 
         def confirm_delete(e):
             try:
-                execute_query(
-                    "DELETE FROM schedule_days WHERE user_id = %s AND day_of_week = %s",
-                    (user_id, day_index), commit=True
-                )
+                schedule_storage.delete_day_schedule(user_id, day_index)
 
                 cache_key = f"current_{user_id}_{day_index}"
                 current_schedule_cache.pop(cache_key, None)
@@ -762,30 +666,15 @@ def Schedule_page(page: ft.Page, params: Params, basket: Basket):
                 show_message("Нет задач для сохранения", ft.Colors.ORANGE_400)
                 return
 
-            execute_query("DELETE FROM schedule_days WHERE user_id = %s", (user_id,), commit=True)
-
             days_map = {}
             for day_index, start_time, description in all_tasks:
                 if day_index not in days_map:
                     days_map[day_index] = []
-                days_map[day_index].append((start_time, description))
-
-            saved_count = 0
-            for day_index, tasks in days_map.items():
-                result = execute_query("""
-                    INSERT INTO schedule_days (user_id, day_of_week) 
-                    VALUES (%s, %s) RETURNING id_day
-                """, (user_id, day_index), fetchone=True)
-
-                if result:
-                    day_id = result[0]
-                    for start_time, description in tasks:
-                        h, m = map(int, start_time.split(":"))
-                        execute_query(
-                            "INSERT INTO schedule_tasks (day_id, start_time, description) VALUES (%s, %s, %s)",
-                            (day_id, datetime.time(h, m), description), commit=True
-                        )
-                        saved_count += 1
+                h, m = map(int, start_time.split(":"))
+                days_map[day_index].append((datetime.time(h, m), description))
+
+            # Вся неделя заменяется одной транзакцией
+            saved_count = schedule_storage.replace_week_schedule(user_id, days_map)
 
             current_schedule_cache.clear()
 
@@ -800,13 +689,7 @@ def Schedule_page(page: ft.Page, params: Params, basket: Basket):
     # --- Загрузка графика ---
     def load_schedule():
         try:
-            result = execute_query("""
-                SELECT sd.day_of_week, st.start_time, st.description 
-                FROM schedule_days sd 
-                LEFT JOIN schedule_tasks st ON sd.id_day = st.day_id 
-                WHERE sd.user_id = %s 
-                ORDER BY sd.day_of_week, st.start_time
-            """, (user_id,), fetchall=True)
+            result = schedule_storage.get_week_schedule(user_id)
 
             if not result:
                 return
@@ -0,0 +1,316 @@
+# query_stats.py
+# Учёт времени всех SQL-запросов процесса: место вызова, форма запроса,
+# гистограммы задержек, журнал медленных запросов с планом.
+# Отчёт: админ-бот (кнопка «Статистика запросов»), GET /query_stats монитора
+# или из консоли:  python query_stats.py [--url http://127.0.0.1:5000] [--top 20]
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+import monitor_metrics
+
+try:
+    from psycopg2.extensions import connection as psycopg2_connection, cursor as psycopg2_cursor
+except ImportError:  # без psycopg2 модуль годится для отчёта из консоли
+    psycopg2_connection = psycopg2_cursor = None
+
+# ================= НАСТРОЙКИ =================
+ENABLED = os.environ.get("DB_QUERY_STATS", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", "500"))
+EXPLAIN_INTERVAL = 300      # план одной формы запроса снимаем не чаще раза в 5 минут
+SLOW_LOG_SIZE = 50          # сколько последних медленных запросов хранить
+MAX_SHAPE_LENGTH = 300
+
+QUERY_SECONDS = monitor_metrics.REGISTRY.histogram(
+    "monitor_db_query_seconds", "Время выполнения SQL-запросов по месту вызова")
+
+# Модули, кадры которых пропускаются при поиске места вызова: обёртки соединений
+# и слой доступа к данным — местом вызова считается страница или обработчик,
+# а не storage._fetchall
+_INTERNAL_MODULES = {__name__, "db_pool", "contextlib"}
+DATA_ACCESS_MODULES = {"storage", "activity_ingest", "activity_partitions", "activity_summary",
+                       "client_tokens"}
+_SKIPPED_MODULES = _INTERNAL_MODULES | DATA_ACCESS_MODULES
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%\(\w+\)s|%s")
+_LIST_RE = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+# Вызовы с побочным действием: блокировки, последовательности, настройки сеанса
+_SIDE_EFFECT_CALL_RE = re.compile(r"\b(?:pg_\w+|nextval|setval|set_config|lo_\w+|dblink\w*)\s*\(", re.IGNORECASE)
+_FROM_RE = re.compile(r"\bFROM\b", re.IGNORECASE)
+
+
+def query_shape(sql):
+    """Форма запроса: без литералов и лишних пробелов, списки (?, ?, ?) -> (?...)"""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    elif not isinstance(sql, str):
+        sql = str(sql)  # psycopg2.sql.Composed
+    shape = _SPACE_RE.sub(" ", sql).strip()
+    shape = _STRING_RE.sub("?", shape)
+    shape = _PLACEHOLDER_RE.sub("?", shape)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _LIST_RE.sub("(?...)", shape)
+    return shape[:MAX_SHAPE_LENGTH]
+
+
+_site_cache = {}
+
+
+def call_site():
+    """«модуль.функция» первого кадра вне обёрток: Detaiz_page.fetch_data"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "?")
+        if module not in _SKIPPED_MODULES and not module.startswith("psycopg2"):
+            code = frame.f_code
+            site = _site_cache.get(code)
+            if site is None:
+                site = _site_cache[code] = f"{module.rsplit('.', 1)[-1]}.{code.co_name}"
+            return site
+        frame = frame.f_back
+    return "?"
+
+
+class QueryStats:
+    """Агрегаты по (место вызова, форма запроса) и журнал медленных запросов"""
+
+    def __init__(self, buckets=monitor_metrics.DEFAULT_BUCKETS, slow_log_size=SLOW_LOG_SIZE):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}   # (site, shape) -> {"count", "errors", "total", "max", "rows", "buckets"}
+        self._slow = deque(maxlen=slow_log_size)
+        self._explained = {}  # shape -> когда последний раз снимали план
+        self.started = time.time()
+
+    def record(self, site, shape, seconds, rows=0, error=False):
+        with self._lock:
+            series = self._series.get((site, shape))
+            if series is None:
+                series = self._series[(site, shape)] = {
+                    "count": 0, "errors": 0, "total": 0.0, "max": 0.0, "rows": 0,
+                    "buckets": [0] * len(self.buckets),
+                }
+            series["count"] += 1
+            series["errors"] += bool(error)
+            series["total"] += seconds
+            series["max"] = max(series["max"], seconds)
+            series["rows"] += max(rows, 0)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["buckets"][i] += 1
+                    break
+        QUERY_SECONDS.observe(seconds, site=site)
+
+    def should_explain(self, shape):
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained.get(shape)
+            if last is not None and now - last < EXPLAIN_INTERVAL:
+                return False
+            self._explained[shape] = now
+            return True
+
+    def log_slow(self, site, shape, seconds, plan=None):
+        with self._lock:
+            self._slow.append({
+                "at": time.time(), "site": site, "shape": shape,
+                "ms": round(seconds * 1000, 1), "plan": plan,
+            })
+        print(f"🐢 Медленный запрос {seconds * 1000:.0f} мс в {site}: {shape[:120]}")
+        if plan:
+            print(plan)
+
+    def _percentile(self, series, p):
+        # Верхняя граница бакета, в который попал p-й перцентиль (точнее без сырых замеров нельзя)
+        target = series["count"] * p / 100
+        seen = 0
+        for bound, count in zip(self.buckets, series["buckets"]):
+            seen += count
+            if seen >= target:
+                return bound
+        return series["max"]
+
+    def snapshot(self, top=None, sort="total"):
+        with self._lock:
+            items = [(key, dict(value, buckets=list(value["buckets"]))) for key, value in self._series.items()]
+            slow = list(self._slow)
+        items.sort(key=lambda item: item[1][sort], reverse=True)
+        if top:
+            items = items[:top]
+        return {
+            "since": self.started,
+            "queries": [
+                {
+                    "site": site,
+                    "shape": shape,
+                    "count": s["count"],
+                    "errors": s["errors"],
+                    "total_ms": round(s["total"] * 1000, 1),
+                    "avg_ms": round(s["total"] / s["count"] * 1000, 2),
+                    "p50_ms": round(self._percentile(s, 50) * 1000, 1),
+                    "p95_ms": round(self._percentile(s, 95) * 1000, 1),
+                    "max_ms": round(s["max"] * 1000, 1),
+                    "rows": s["rows"],
+                }
+                for (site, shape), s in items
+            ],
+            "slow": slow,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._slow.clear()
+            self._explained.clear()
+            self.started = time.time()
+
+
+STATS = QueryStats()
+
+
+# ================= ОБЁРТКА КУРСОРА =================
+def _explain(cursor, query, params):
+    """План медленного запроса: простой EXPLAIN, запрос повторно не выполняется.
+
+    Фактические времена узлов (ANALYZE) стоили бы второго выполнения медленного
+    запроса; при необходимости их даёт auto_explain на сервере. План снимается
+    под SAVEPOINT: ошибка EXPLAIN не должна оборвать транзакцию вызывающего кода.
+    """
+    conn = cursor.connection
+    plan_cursor = conn.cursor(cursor_factory=psycopg2_cursor)
+    try:
+        psycopg2_cursor.execute(plan_cursor, "SAVEPOINT query_stats_explain")
+        psycopg2_cursor.execute(plan_cursor, "EXPLAIN " + query, params)
+        plan = "\n".join(row[0] for row in plan_cursor.fetchall())
+        psycopg2_cursor.execute(plan_cursor, "RELEASE SAVEPOINT query_stats_explain")
+        return plan
+    except Exception as e:
+        try:
+            psycopg2_cursor.execute(plan_cursor, "ROLLBACK TO SAVEPOINT query_stats_explain")
+        except Exception:
+            pass
+        return f"(план не получен: {e})"
+    finally:
+        plan_cursor.close()
+
+
+def _is_explainable(shape):
+    """Только чтение данных: SELECT/WITH с FROM, без блокировок строк и вызовов
+    с побочным действием (SELECT pg_advisory_lock(?), nextval и т.п.)"""
+    head = shape.lstrip("( ").upper()
+    return (head.startswith("SELECT") or head.startswith("WITH")) and "FOR UPDATE" not in head \
+        and "INSERT " not in head and "UPDATE " not in head and "DELETE " not in head \
+        and _FROM_RE.search(head) is not None and _SIDE_EFFECT_CALL_RE.search(head) is None
+
+
+class InstrumentedCursorMixin:
+    """Замеряет execute/executemany и пишет результат в STATS"""
+
+    def _timed(self, method, query, args):
+        site = call_site()
+        started = time.perf_counter()
+        error = False
+        try:
+            return method(self, query, args)
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            shape = query_shape(query)
+            STATS.record(site, shape, elapsed, self.rowcount, error)
+            if not error and elapsed * 1000 >= SLOW_QUERY_MS and STATS.should_explain(shape):
+                plan = None
+                # Именованный (серверный) курсор не трогаем; autocommit — это миграции
+                # и служебные соединения (DDL, CONCURRENTLY), там план не снимаем
+                if method is psycopg2_cursor.execute and isinstance(query, str) and not self.name \
+                        and not self.connection.autocommit and _is_explainable(shape):
+                    plan = _explain(self, query, args)
+                STATS.log_slow(site, shape, elapsed, plan)
+
+    def execute(self, query, vars=None):
+        return self._timed(psycopg2_cursor.execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(psycopg2_cursor.executemany, query, vars_list)
+
+
+if psycopg2_connection is not None:
+    class InstrumentedCursor(InstrumentedCursorMixin, psycopg2_cursor):
+        pass
+
+    _instrumented_factories = {}
+
+    def _instrumented(factory):
+        cls = _instrumented_factories.get(factory)
+        if cls is None:
+            cls = _instrumented_factories[factory] = type(
+                f"Instrumented{factory.__name__}", (InstrumentedCursorMixin, factory), {})
+        return cls
+
+    class InstrumentedConnection(psycopg2_connection):
+        """connection_factory для psycopg2.connect: все курсоры — с замером.
+
+        Явно заданный cursor_factory (DictCursor и т.п.) тоже оборачивается.
+        """
+
+        def cursor(self, *args, **kwargs):
+            factory = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2_cursor
+            if not issubclass(factory, InstrumentedCursorMixin):
+                kwargs["cursor_factory"] = _instrumented(factory)
+            return super().cursor(*args, **kwargs)
+
+
+# ================= ОТЧЁТ =================
+def format_report(snapshot, top=20):
+    """Текстовый отчёт: самые затратные запросы и последние медленные"""
+    queries = snapshot["queries"][:top]
+    since = time.strftime("%d.%m %H:%M", time.localtime(snapshot["since"]))
+    lines = [f"📊 SQL с {since}: форм запросов {len(snapshot['queries'])}"]
+    for q in queries:
+        lines.append(
+            f"• {q['site']} — {q['count']}× avg {q['avg_ms']} мс, p95 ≤{q['p95_ms']} мс, "
+            f"max {q['max_ms']} мс, всего {q['total_ms'] / 1000:.1f} с"
+            + (f", ошибок {q['errors']}" if q["errors"] else "")
+        )
+        lines.append(f"    {q['shape'][:160]}")
+    if snapshot["slow"]:
+        lines.append(f"\n🐢 Медленные (≥ {SLOW_QUERY_MS:.0f} мс), последние:")
+        for entry in snapshot["slow"][-5:]:
+            at = time.strftime("%H:%M:%S", time.localtime(entry["at"]))
+            lines.append(f"• {at} {entry['site']} {entry['ms']} мс: {entry['shape'][:120]}")
+    return "\n".join(lines)
+
+
+def report(top=20):
+    return format_report(STATS.snapshot(), top)
+
+
+def main():
+    import argparse
+    import json
+    from urllib.request import urlopen
+
+    parser = argparse.ArgumentParser(description="Статистика SQL-запросов работающего приложения")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="адрес монитора активности")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--plans", action="store_true", help="показать планы медленных запросов")
+    args = parser.parse_args()
+
+    with urlopen(f"{args.url}/query_stats", timeout=10) as response:
+        snapshot = json.loads(response.read())
+    print(format_report(snapshot, args.top))
+    if args.plans:
+        for entry in snapshot["slow"]:
+            if entry.get("plan"):
+                print(f"\n{entry['site']} ({entry['ms']} мс)\n{entry['plan']}")
+
+
+if __name__ == "__main__":
+    main()
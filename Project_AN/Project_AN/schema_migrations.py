@@ -0,0 +1,599 @@
+# schema_migrations.py
+import hashlib
+import re
+import sys
+import time
+
+import psycopg2
+from psycopg2 import errors as pg_errors
+
+# ================= НАСТРОЙКИ МИГРАЦИЙ =================
+ADVISORY_LOCK_KEY = 7_302_215     # pg_advisory_lock: миграции применяет один процесс
+LOCK_TIMEOUT = "5s"               # обычная миграция не ждёт блокировку таблицы дольше
+
+_CONCURRENT_INDEX_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE)
+
+
+class MigrationError(Exception):
+    """Схема БД не совпадает с описанными миграциями"""
+
+
+class Migration:
+    """Одна версия схемы: упорядоченный набор SQL-выражений.
+
+    Обычная миграция выполняется одной транзакцией вместе с записью в
+    schema_version. concurrent=True — для CREATE/DROP INDEX CONCURRENTLY на
+    больших таблицах (activity_monitoring): такие выражения нельзя выполнять
+    в транзакции, поэтому каждое идёт отдельно в autocommit, а версия
+    записывается после последнего.
+
+    Уже применённую миграцию менять нельзя — контрольная сумма в
+    schema_version перестанет совпадать. Изменения схемы — новой миграцией.
+    """
+
+    def __init__(self, version, name, statements, concurrent=False):
+        self.version = version
+        self.name = name
+        self.statements = [s.strip() for s in statements]
+        self.concurrent = concurrent
+
+    @property
+    def checksum(self):
+        # Пробелы и переносы не влияют: переформатирование SQL — не изменение схемы
+        normalized = ";\n".join(" ".join(s.split()) for s in self.statements)
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+# ================= МИГРАЦИИ =================
+# Порядок версий — порядок применения. Только добавлять в конец.
+MIGRATIONS = [
+    Migration(1, "baseline", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id_user SERIAL PRIMARY KEY,
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS activity_monitoring (
+            id SERIAL PRIMARY KEY,
+            user_id INT NOT NULL
+                REFERENCES users(id_user)
+                ON DELETE CASCADE,
+            app_name TEXT NOT NULL,
+            total_seconds INT NOT NULL DEFAULT 0,
+            activity_date DATE NOT NULL,
+            UNIQUE (user_id, app_name, activity_date)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS users_tg (
+            user_id INTEGER PRIMARY KEY,
+            tg_id BIGINT NOT NULL UNIQUE,
+            email TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            CONSTRAINT fk_users_tg_user
+                FOREIGN KEY (user_id)
+                REFERENCES users(id_user)
+                ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS schedule_days (
+            id_day SERIAL PRIMARY KEY,
+            user_id INT NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            day_of_week INT NOT NULL,
+            UNIQUE(user_id, day_of_week)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS schedule_tasks (
+            id_task SERIAL PRIMARY KEY,
+            day_id INT NOT NULL REFERENCES schedule_days(id_day) ON DELETE CASCADE,
+            description TEXT NOT NULL,
+            start_time TIME(0) NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ai_generated_schedules (
+            id SERIAL PRIMARY KEY,
+            user_id INT NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            day_of_week INT NOT NULL,
+            data JSONB NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_schedule_days_user_day ON schedule_days(user_id, day_of_week)",
+        "CREATE INDEX IF NOT EXISTS idx_schedule_tasks_day ON schedule_tasks(day_id)",
+        "CREATE INDEX IF NOT EXISTS idx_schedule_tasks_day_time ON schedule_tasks(day_id, start_time)",
+        "CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)",
+        "CREATE INDEX IF NOT EXISTS idx_ai_schedules_user_day ON ai_generated_schedules(user_id, day_of_week)",
+        "CREATE INDEX IF NOT EXISTS idx_users_tg_tg_id ON users_tg(tg_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_tg_user_id ON users_tg(user_id)",
+    ]),
+
+    # Индексы самой большой таблицы строятся без блокировки записи
+    Migration(2, "activity_monitoring_indexes", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_activity_user_date "
+        "ON activity_monitoring(user_id, activity_date)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_activity_user_app "
+        "ON activity_monitoring(user_id, app_name)",
+    ], concurrent=True),
+
+    # Контрольные точки локального журнала активности (activity_journal.py)
+    Migration(3, "activity_journal_checkpoint", [
+        """
+        CREATE TABLE IF NOT EXISTS activity_journal_checkpoint (
+            journal_name TEXT PRIMARY KEY,
+            last_seq BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """,
+    ]),
+
+    # Точные интервалы фокуса окна (focus_tracker.py)
+    Migration(4, "focus_intervals", [
+        """
+        CREATE TABLE IF NOT EXISTS focus_intervals (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INT NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            app_name TEXT NOT NULL,
+            started_at TIMESTAMPTZ NOT NULL,
+            ended_at TIMESTAMPTZ NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_focus_intervals_user_started ON focus_intervals(user_id, started_at)",
+    ]),
+
+    # Токены клиентов мониторинга (client_tokens.py); хранится только хеш
+    Migration(5, "client_tokens", [
+        """
+        CREATE TABLE IF NOT EXISTS client_tokens (
+            token_hash TEXT PRIMARY KEY,
+            user_id INT NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            client TEXT NOT NULL DEFAULT 'desktop',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            last_used_at TIMESTAMPTZ,
+            expires_at TIMESTAMPTZ NOT NULL
+        )
+        """,
+    ]),
+
+    # Ключи идемпотентности пакетов от клиентов (повторная доставка не удваивает время)
+    Migration(6, "ingest_batches", [
+        """
+        CREATE TABLE IF NOT EXISTS ingest_batches (
+            user_id INT NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            batch_id TEXT NOT NULL,
+            received_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (user_id, batch_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ingest_batches_received ON ingest_batches(received_at)",
+    ]),
+
+    # Чистка по отчёту index_advisor.py: лишние индексы удорожают каждый upsert
+    # активности. Покрывающий индекс создаётся раньше, чем удаляется старый.
+    Migration(7, "index_cleanup", [
+        # агрегаты детализации читаются index-only scan
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_activity_user_date_cover "
+        "ON activity_monitoring(user_id, activity_date) INCLUDE (app_name, total_seconds)",
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_activity_user_date",
+        # префикс UNIQUE (user_id, app_name, activity_date)
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_activity_user_app",
+        # повторяют UNIQUE/PRIMARY KEY
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_users_email",
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_users_tg_tg_id",
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_users_tg_user_id",
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_schedule_days_user_day",
+        # префикс idx_schedule_tasks_day_time
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_schedule_tasks_day",
+    ], concurrent=True),
+
+    # activity_monitoring по месяцам (activity_partitions.py): срок хранения —
+    # удалением целых секций. Первичный ключ секционированной таблицы обязан
+    # включать activity_date, поэтому им становится прежний UNIQUE, а
+    # неиспользуемый суррогатный id убран. Данные переносятся одной транзакцией.
+    Migration(8, "activity_monitoring_partitioned", [
+        "ALTER TABLE activity_monitoring RENAME TO activity_monitoring_legacy",
+        "ALTER INDEX IF EXISTS activity_monitoring_pkey RENAME TO activity_monitoring_legacy_pkey",
+        "ALTER INDEX IF EXISTS activity_monitoring_user_id_app_name_activity_date_key "
+        "RENAME TO activity_monitoring_legacy_key",
+        "ALTER INDEX IF EXISTS idx_activity_user_date_cover RENAME TO idx_activity_legacy_user_date_cover",
+        """
+        CREATE TABLE activity_monitoring (
+            user_id INT NOT NULL
+                REFERENCES users(id_user)
+                ON DELETE CASCADE,
+            app_name TEXT NOT NULL,
+            total_seconds INT NOT NULL DEFAULT 0,
+            activity_date DATE NOT NULL,
+            PRIMARY KEY (user_id, app_name, activity_date)
+        ) PARTITION BY RANGE (activity_date)
+        """,
+        "CREATE TABLE activity_monitoring_default PARTITION OF activity_monitoring DEFAULT",
+        "CREATE INDEX idx_activity_user_date_cover "
+        "ON activity_monitoring(user_id, activity_date) INCLUDE (app_name, total_seconds)",
+        # Секции под имеющиеся данные и два месяца вперёд; дальше их ведёт activity_partitions.py
+        """
+        DO $$
+        DECLARE
+            month DATE;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', COALESCE((SELECT MIN(activity_date) FROM activity_monitoring_legacy),
+                                                 CURRENT_DATE)),
+                    date_trunc('month', CURRENT_DATE) + INTERVAL '2 months',
+                    INTERVAL '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF activity_monitoring FOR VALUES FROM (%L) TO (%L)',
+                    'activity_monitoring_' || to_char(month, 'YYYY_MM'), month, (month + INTERVAL '1 month')::date
+                );
+            END LOOP;
+        END $$
+        """,
+        """
+        INSERT INTO activity_monitoring (user_id, app_name, total_seconds, activity_date)
+        SELECT user_id, app_name, total_seconds, activity_date FROM activity_monitoring_legacy
+        """,
+        "DROP TABLE activity_monitoring_legacy",
+    ]),
+
+    # Свёртки активности (activity_ingest.upsert_rollups): итоги по дням и по
+    # приложениям за неделю и месяц обновляются в транзакции приёма, дашборд
+    # и контекст AI читают их вместо сырых строк
+    Migration(9, "activity_rollups", [
+        # Приём ждёт окончания заполнения: иначе его строки не попадут в свёртки
+        "LOCK TABLE activity_monitoring IN SHARE MODE",
+        """
+        CREATE TABLE IF NOT EXISTS activity_daily_totals (
+            user_id INT NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            activity_date DATE NOT NULL,
+            total_seconds BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, activity_date)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS activity_weekly (
+            user_id INT NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            week_start DATE NOT NULL,
+            app_name TEXT NOT NULL,
+            total_seconds BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, week_start, app_name)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS activity_monthly (
+            user_id INT NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            month_start DATE NOT NULL,
+            app_name TEXT NOT NULL,
+            total_seconds BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month_start, app_name)
+        )
+        """,
+        """
+        INSERT INTO activity_daily_totals (user_id, activity_date, total_seconds)
+        SELECT user_id, activity_date, SUM(total_seconds)
+        FROM activity_monitoring
+        GROUP BY user_id, activity_date
+        """,
+        """
+        INSERT INTO activity_weekly (user_id, week_start, app_name, total_seconds)
+        SELECT user_id, date_trunc('week', activity_date)::date, app_name, SUM(total_seconds)
+        FROM activity_monitoring
+        GROUP BY 1, 2, 3
+        """,
+        """
+        INSERT INTO activity_monthly (user_id, month_start, app_name, total_seconds)
+        SELECT user_id, date_trunc('month', activity_date)::date, app_name, SUM(total_seconds)
+        FROM activity_monitoring
+        GROUP BY 1, 2, 3
+        """,
+    ]),
+
+    # Словарь приложений: activity_monitoring и свёртки хранят app_id вместо
+    # полного заголовка окна в каждой строке и в каждом индексе. Имена
+    # интернирует приём (activity_ingest.intern_apps). Таблицы пересоздаются
+    # с переносом данных одной транзакцией, как в миграции 8.
+    Migration(10, "apps_dictionary", [
+        """
+        CREATE TABLE apps (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+        """,
+        # Старое дерево секций переименовывается целиком (таблицы и индексы),
+        # чтобы имена освободились для новых секций
+        "ALTER TABLE activity_monitoring RENAME TO activity_monitoring_legacy",
+        """
+        DO $$
+        DECLARE
+            rel RECORD;
+        BEGIN
+            FOR rel IN
+                SELECT c.oid, c.relkind
+                FROM pg_partition_tree('activity_monitoring_legacy') t
+                JOIN pg_class c ON c.oid = t.relid
+                WHERE t.level > 0
+                UNION ALL
+                SELECT c.oid, c.relkind
+                FROM pg_partition_tree('activity_monitoring_legacy') t
+                JOIN pg_index i ON i.indrelid = t.relid
+                JOIN pg_class c ON c.oid = i.indexrelid
+                ORDER BY relkind
+            LOOP
+                IF rel.relkind IN ('i', 'I') THEN
+                    EXECUTE format('ALTER INDEX %s RENAME TO %I', rel.oid::regclass, 'am_legacy_' || rel.oid);
+                ELSE
+                    EXECUTE format('ALTER TABLE %s RENAME TO %I', rel.oid::regclass, 'am_legacy_' || rel.oid);
+                END IF;
+            END LOOP;
+        END $$
+        """,
+        "ALTER TABLE activity_weekly RENAME TO activity_weekly_legacy",
+        "ALTER INDEX activity_weekly_pkey RENAME TO activity_weekly_legacy_pkey",
+        "ALTER TABLE activity_monthly RENAME TO activity_monthly_legacy",
+        "ALTER INDEX activity_monthly_pkey RENAME TO activity_monthly_legacy_pkey",
+        """
+        INSERT INTO apps (name)
+        SELECT app_name FROM activity_monitoring_legacy
+        UNION
+        SELECT app_name FROM activity_weekly_legacy
+        UNION
+        SELECT app_name FROM activity_monthly_legacy
+        ORDER BY 1
+        """,
+        """
+        CREATE TABLE activity_monitoring (
+            user_id INT NOT NULL
+                REFERENCES users(id_user)
+                ON DELETE CASCADE,
+            app_id INT NOT NULL REFERENCES apps(id),
+            total_seconds INT NOT NULL DEFAULT 0,
+            activity_date DATE NOT NULL,
+            PRIMARY KEY (user_id, app_id, activity_date)
+        ) PARTITION BY RANGE (activity_date)
+        """,
+        "CREATE TABLE activity_monitoring_default PARTITION OF activity_monitoring DEFAULT",
+        "CREATE INDEX idx_activity_user_date_cover "
+        "ON activity_monitoring(user_id, activity_date) INCLUDE (app_id, total_seconds)",
+        """
+        DO $$
+        DECLARE
+            month DATE;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', COALESCE((SELECT MIN(activity_date) FROM activity_monitoring_legacy),
+                                                 CURRENT_DATE)),
+                    date_trunc('month', CURRENT_DATE) + INTERVAL '2 months',
+                    INTERVAL '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF activity_monitoring FOR VALUES FROM (%L) TO (%L)',
+                    'activity_monitoring_' || to_char(month, 'YYYY_MM'), month, (month + INTERVAL '1 month')::date
+                );
+            END LOOP;
+        END $$
+        """,
+        """
+        INSERT INTO activity_monitoring (user_id, app_id, total_seconds, activity_date)
+        SELECT l.user_id, a.id, l.total_seconds, l.activity_date
+        FROM activity_monitoring_legacy l
+        JOIN apps a ON a.name = l.app_name
+        """,
+        "DROP TABLE activity_monitoring_legacy",
+        """
+        CREATE TABLE activity_weekly (
+            user_id INT NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            week_start DATE NOT NULL,
+            app_id INT NOT NULL REFERENCES apps(id),
+            total_seconds BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, week_start, app_id)
+        )
+        """,
+        """
+        CREATE TABLE activity_monthly (
+            user_id INT NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            month_start DATE NOT NULL,
+            app_id INT NOT NULL REFERENCES apps(id),
+            total_seconds BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month_start, app_id)
+        )
+        """,
+        """
+        INSERT INTO activity_weekly (user_id, week_start, app_id, total_seconds)
+        SELECT l.user_id, l.week_start, a.id, l.total_seconds
+        FROM activity_weekly_legacy l
+        JOIN apps a ON a.name = l.app_name
+        """,
+        """
+        INSERT INTO activity_monthly (user_id, month_start, app_id, total_seconds)
+        SELECT l.user_id, l.month_start, a.id, l.total_seconds
+        FROM activity_monthly_legacy l
+        JOIN apps a ON a.name = l.app_name
+        """,
+        "DROP TABLE activity_weekly_legacy",
+        "DROP TABLE activity_monthly_legacy",
+    ]),
+
+    # Правила категорий, заданные пользователем (app_categories.py): ключевое
+    # слово в имени приложения -> категория, важнее встроенных
+    Migration(11, "app_category_rules", [
+        """
+        CREATE TABLE IF NOT EXISTS app_category_rules (
+            user_id INT NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            keyword TEXT NOT NULL,
+            category TEXT NOT NULL,
+            PRIMARY KEY (user_id, keyword)
+        )
+        """,
+    ]),
+
+    # Своя категория — для приложения целиком: точное имя вместо подстроки,
+    # иначе выбор для «Word» перекрашивал и всё, что содержит «word»
+    Migration(12, "app_category_rules_exact", [
+        "ALTER TABLE app_category_rules RENAME COLUMN keyword TO app_name",
+    ]),
+]
+
+
+# ================= ПРИМЕНЕНИЕ =================
+def _check_order(migrations):
+    versions = [m.version for m in migrations]
+    if versions != sorted(set(versions)):
+        raise MigrationError(f"Версии миграций должны строго возрастать: {versions}")
+
+
+def _applied_versions(cur):
+    """{версия: checksum}; None — таблицы schema_version ещё нет"""
+    try:
+        cur.execute("SELECT version, checksum FROM schema_version")
+    except pg_errors.UndefinedTable:
+        cur.connection.rollback()
+        return None
+    return dict(cur.fetchall())
+
+
+def _pending(applied, migrations):
+    """Миграции, которые осталось применить; проверяет суммы уже применённых"""
+    known = {m.version: m for m in migrations}
+    for version, checksum in applied.items():
+        migration = known.get(version)
+        if migration is None:
+            raise MigrationError(f"В БД применена неизвестная миграция {version} — код старее схемы")
+        if migration.checksum != checksum:
+            raise MigrationError(
+                f"Миграция {version} ({migration.name}) изменена после применения: "
+                f"контрольная сумма не совпадает"
+            )
+    return [m for m in migrations if m.version not in applied]
+
+
+def _drop_invalid_indexes(cur, migration):
+    """Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс —
+    IF NOT EXISTS его пропустил бы, поэтому удаляем и строим заново"""
+    names = [m.group(1) for s in migration.statements for m in [_CONCURRENT_INDEX_RE.search(s)] if m]
+    if not names:
+        return
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE NOT i.indisvalid AND c.relname = ANY(%s)
+    """, (names,))
+    for (name,) in cur.fetchall():
+        print(f"⚠️ Удаляю недостроенный индекс {name}")
+        cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+def _record(cur, migration, started):
+    cur.execute(
+        "INSERT INTO schema_version (version, name, checksum, duration_ms) VALUES (%s, %s, %s, %s)",
+        (migration.version, migration.name, migration.checksum, int((time.perf_counter() - started) * 1000))
+    )
+
+
+def _apply(conn, migration):
+    started = time.perf_counter()
+    cur = conn.cursor()
+    try:
+        if migration.concurrent:
+            conn.autocommit = True
+            _drop_invalid_indexes(cur, migration)
+            for statement in migration.statements:
+                cur.execute(statement)
+            _record(cur, migration, started)
+        else:
+            conn.autocommit = False
+            cur.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+            for statement in migration.statements:
+                cur.execute(statement)
+            _record(cur, migration, started)
+            conn.commit()
+    except Exception:
+        if not conn.autocommit:
+            conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+        cur.close()
+    print(f"  • {migration.version:>3} {migration.name} ({time.perf_counter() - started:.2f} сек)")
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Доводит схему до последней версии. Возвращает число применённых миграций.
+
+    Если схема актуальна — это один SELECT по schema_version. Иначе берётся
+    advisory-блокировка (второй процесс дождётся и ничего не повторит),
+    применённые версии перечитываются и недостающие применяются по порядку.
+    """
+    _check_order(migrations)
+    cur = conn.cursor()
+    applied = _applied_versions(cur)
+    if applied is not None and not _pending(applied, migrations):
+        conn.rollback()
+        cur.close()
+        return 0
+
+    conn.rollback()
+    conn.autocommit = True
+    try:
+        cur.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                name TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                duration_ms INT NOT NULL DEFAULT 0
+            )
+        """)
+        pending = _pending(_applied_versions(cur), migrations)
+        if pending:
+            print(f"Применяю миграции схемы ({len(pending)}):")
+        for migration in pending:
+            _apply(conn, migration)
+        return len(pending)
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_KEY,))
+        conn.autocommit = False
+        cur.close()
+
+
+def status(conn, migrations=MIGRATIONS):
+    """[(версия, имя, применена ли, дата применения)] для вывода в консоль"""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT version, applied_at FROM schema_version")
+        applied = dict(cur.fetchall())
+    except pg_errors.UndefinedTable:
+        applied = {}
+    conn.rollback()
+    cur.close()
+    return [(m.version, m.name, m.version in applied, applied.get(m.version)) for m in migrations]
+
+
+# ================= ЗАПУСК ИЗ КОНСОЛИ =================
+# python schema_migrations.py [status] [имя_бд]
+if __name__ == "__main__":
+    from db import connect
+
+    args = sys.argv[1:]
+    command = args.pop(0) if args and args[0] in ("status", "migrate") else "migrate"
+    connection = connect(*args)
+    try:
+        if command == "status":
+            for version, name, done, applied_at in status(connection):
+                mark = "✅" if done else "⏳"
+                print(f"{mark} {version:>3} {name:<32} {applied_at or ''}")
+        else:
+            count = migrate(connection)
+            print(f"✅ Схема актуальна, применено миграций: {count}")
+    finally:
+        connection.close()
@@ -7,6 +7,17 @@ let activeStart = Date.now();
 let siteTimes = {};
 let serverAvailable = false;
 let currentUserId = null; // Будем хранить user_id из Flask
+let authToken = null; // Токен клиента: по нему сервер определяет пользователя
+let retryAfterUntil = 0; // Сервер попросил подождать (429/503) до этого момента
+
+// ========== ПАКЕТНЫЙ РЕЖИМ ==========
+// Время копится интервалами по 30 сек (bucket), а отправляется одним сжатым
+// gzip-пакетом раз в BATCH_SEND_INTERVAL — меньше запросов и байт в сети
+const BATCH_MODE = true;
+const BATCH_SEND_INTERVAL = 5 * 60 * 1000;
+const MAX_BATCH_ENTRIES = 500; // сервер принимает до 1000 интервалов в пакете
+let bucketStart = Date.now();
+let pendingEntries = []; // [{bucket_start: unix-сек, site_times: {...}}]
 
 // Получаем домен
 function getDomain(url) {
@@ -25,21 +36,103 @@ function saveTime() {
 
         if (seconds > 0) {
             siteTimes[activeDomain] = (siteTimes[activeDomain] || 0) + seconds;
+            // Дробный остаток не теряем: начало сдвигается ровно на учтённые секунды
+            activeStart += seconds * 1000;
         }
+    }
+}
+
+// ========== АКТИВНОСТЬ ПОЛЬЗОВАТЕЛЯ ==========
+// Время идёт только пока пользователь за компьютером: системное состояние
+// chrome.idle и сигналы content.js (ввод на странице, играющее видео/аудио).
+// Пока учёт на паузе, activeStart = null: saveTime ничего не добавляет,
+// интервалы остаются пустыми и пакеты не отправляются.
+const IDLE_DETECTION_SECONDS = 60;
+let systemState = 'active';  // active | idle | locked (chrome.idle)
+let tabStates = {};          // tabId -> active | inactive | media (из content.js)
+let accounting = false;      // идёт ли сейчас учёт времени
+
+// Вкладки без content.js (chrome://, магазин расширений) считаем активными
+function tabState(tabId) {
+    return tabStates[tabId] || 'active';
+}
 
-        activeStart = now;
+function shouldAccount() {
+    if (!activeDomain || systemState === 'locked') {
+        return false;
     }
+    const state = tabState(activeTabId);
+    // Видео/аудио засчитываем и без ввода: пользователь смотрит, а не ушёл
+    if (state === 'media') {
+        return true;
+    }
+    return systemState === 'active' && state === 'active';
 }
 
-// Смена вкладки
-chrome.tabs.onActivated.addListener(async (activeInfo) => {
+// Пересчитываем состояние; повторные сигналы без изменений ничего не делают
+function updateAccounting(reason) {
+    const next = shouldAccount();
+    if (next === accounting) {
+        return;
+    }
+    if (accounting) {
+        saveTime();
+    }
+    accounting = next;
+    activeStart = next ? Date.now() : null;
+    console.log(next ? `▶️ Учёт возобновлён (${reason})` : `⏸️ Учёт на паузе (${reason})`);
+}
+
+// Переключение на другую вкладку/страницу: учёт начинается с текущего момента
+function switchDomain(domain) {
     saveTime();
+    activeDomain = domain;
+    accounting = shouldAccount();
+    activeStart = accounting ? Date.now() : null;
+}
 
+const MESSAGE_STATES = {
+    USER_ACTIVE: 'active',
+    USER_INACTIVE: 'inactive',
+    MEDIA_PLAYING: 'media'
+};
+
+chrome.runtime.onMessage.addListener((message, sender) => {
+    const state = MESSAGE_STATES[message && message.type];
+    const tabId = sender.tab && sender.tab.id;
+    if (!state || tabId === undefined || tabStates[tabId] === state) {
+        return;
+    }
+    tabStates[tabId] = state;
+    if (tabId === activeTabId) {
+        updateAccounting(message.type);
+    }
+});
+
+chrome.idle.setDetectionInterval(IDLE_DETECTION_SECONDS);
+chrome.idle.onStateChanged.addListener((state) => {
+    systemState = state;
+    if (state === 'active') {
+        // Пользователь вернулся — ввод был, значит и вкладка активна
+        delete tabStates[activeTabId];
+    }
+    updateAccounting(`idle: ${state}`);
+});
+chrome.idle.queryState(IDLE_DETECTION_SECONDS).then((state) => {
+    systemState = state;
+    updateAccounting(`idle: ${state}`);
+});
+
+chrome.tabs.onRemoved.addListener((tabId) => {
+    delete tabStates[tabId];
+});
+
+// Смена вкладки
+chrome.tabs.onActivated.addListener(async (activeInfo) => {
     try {
         const tab = await chrome.tabs.get(activeInfo.tabId);
         activeTabId = activeInfo.tabId;
-        activeDomain = getDomain(tab.url);
-        activeStart = Date.now();
+        switchDomain(getDomain(tab.url));
     } catch (error) {
         console.error('❌ Ошибка:', error);
     }
@@ -47,34 +140,48 @@ chrome.tabs.onActivated.addListener(async (activeInfo) => {
 
 // Обновление URL
 chrome.tabs.onUpdated.addListener((tabId, changeInfo, tab) => {
-    if (tabId === activeTabId && changeInfo.url) {
-        saveTime();
-        activeDomain = getDomain(changeInfo.url);
-        activeStart = Date.now();
+    if (changeInfo.url) {
+        // Новая страница — прежние сигналы content.js к ней не относятся
+        delete tabStates[tabId];
+        if (tabId === activeTabId) {
+            switchDomain(getDomain(changeInfo.url));
+        }
     }
 });
 
 // ========== ПРОВЕРКА USER_ID ==========
+let sessionEtag = null; // ETag последнего ответа /current_user
+const SESSION_RECONNECT_DELAY = 30 * 1000;
+
+function applySession(data) {
+    if (data.user_id && data.token) {
+        currentUserId = data.user_id;
+        authToken = data.token;
+        console.log(`✅ Авторизован пользователь ID: ${currentUserId}`);
+        return true;
+    }
+    currentUserId = null;
+    authToken = null;
+    console.log('⚠️ Пользователь не авторизован. Авторизуйтесь в Flet приложении.');
+    return false;
+}
+
+// Условный запрос: если состояние не менялось, сервер ответит 304 без тела
 async function checkUserId() {
     try {
+        const headers = sessionEtag ? { 'If-None-Match': sessionEtag } : {};
         const response = await fetch('http://127.0.0.1:5000/current_user', {
             method: 'GET',
             cache: 'no-cache',
-            timeout: 2000
+            headers
         });
 
+        if (response.status === 304) {
+            return Boolean(currentUserId && authToken);
+        }
         if (response.ok) {
-            const data = await response.json();
-
-            if (data.user_id) {
-                currentUserId = data.user_id;
-                console.log(`✅ Авторизован пользователь ID: ${currentUserId}`);
-                return true;
-            } else {
-                currentUserId = null;
-                console.log('⚠️ Пользователь не авторизован. Авторизуйтесь в Flet приложении.');
-                return false;
-            }
+            sessionEtag = response.headers.get('ETag');
+            return applySession(await response.json());
         }
     } catch (error) {
         console.log('❌ Не удалось проверить user_id:', error.message);
@@ -83,6 +190,64 @@ async function checkUserId() {
     return false;
 }
 
+// ========== УВЕДОМЛЕНИЯ О ВХОДЕ/ВЫХОДЕ ==========
+// Вместо опроса /current_user раз в минуту держим поток Server-Sent Events:
+// сервер сам присылает событие session при входе или выходе пользователя.
+// EventSource в service worker недоступен, поэтому поток читается через fetch.
+function handleSessionEvent(message) {
+    let event = 'message';
+    let data = '';
+    for (const line of message.split('\n')) {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            data += line.slice(5).trim();
+        }
+    }
+    if (event !== 'session' || !data) {
+        return; // комментарии-пинги и прочее
+    }
+
+    const previousUserId = currentUserId;
+    const hasUser = applySession(JSON.parse(data));
+    sessionEtag = null;
+    // Вошёл пользователь, чьи пакеты ждут в очереди, — отправляем их
+    if (hasUser && previousUserId !== currentUserId) {
+        drainOutbox();
+    }
+}
+
+async function subscribeSession() {
+    try {
+        const response = await fetch('http://127.0.0.1:5000/events', { cache: 'no-store' });
+        if (!response.ok || !response.body) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += value;
+            let separator;
+            while ((separator = buffer.indexOf('\n\n')) !== -1) {
+                handleSessionEvent(buffer.slice(0, separator));
+                buffer = buffer.slice(separator + 2);
+            }
+        }
+    } catch (error) {
+        console.log('⚠️ Поток /events недоступен:', error.message);
+    }
+
+    // Поток оборвался (сервер перезапущен или недоступен): переподключаемся позже
+    setTimeout(async () => {
+        await checkUserId();
+        subscribeSession();
+    }, SESSION_RECONNECT_DELAY);
+}
+
 // ========== ПРОВЕРКА СЕРВЕРА ==========
 async function checkServer() {
     try {
@@ -103,102 +268,237 @@ async function checkServer() {
             return true;
         }
     } catch (error) {
+        // Сервер недоступен — это не выход пользователя: данные копятся в очереди
         console.log('❌ Сервер недоступен');
         serverAvailable = false;
-        currentUserId = null;
     }
 
     return false;
 }
 
-// ========== ОТПРАВКА ДАННЫХ ==========
-async function sendData() {
-    // 1. Проверяем есть ли данные
-    if (Object.keys(siteTimes).length === 0) {
-        return;
+// ========== ПАКЕТЫ ==========
+// Закрываем текущий интервал: накопленное время уходит в очередь пакета
+function closeBucket() {
+    saveTime();
+    if (Object.keys(siteTimes).length > 0) {
+        pendingEntries.push({
+            bucket_start: Math.floor(bucketStart / 1000),
+            site_times: siteTimes
+        });
+        siteTimes = {};
+        persistQueue();
     }
+    bucketStart = Date.now();
+}
 
-    // 2. Проверяем доступность сервера
-    if (!serverAvailable) {
-        const isAvailable = await checkServer();
-        if (!isAvailable) {
-            console.log('⚠️ Сервер недоступен, сохраняю данные');
-            return;
-        }
+// gzip через CompressionStream; null — браузер не умеет, отправим без сжатия
+async function gzipBody(text) {
+    if (typeof CompressionStream === 'undefined') {
+        return null;
+    }
+    const stream = new Blob([text]).stream().pipeThrough(new CompressionStream('gzip'));
+    return await new Response(stream).arrayBuffer();
+}
+
+// ========== ОФЛАЙН-ОЧЕРЕДЬ ==========
+// Готовые пакеты лежат в chrome.storage.local и переживают выгрузку service
+// worker'а. У каждого пакета свой id (Idempotency-Key): повторная доставка
+// того же пакета сервером не учитывается, поэтому повторять можно смело.
+const RETRY_BASE_DELAY = 5 * 1000;
+const RETRY_MAX_DELAY = 10 * 60 * 1000;
+const DRAIN_MAX_BATCHES = 10;                     // пакетов за один заход
+const MAX_BATCH_AGE = 29 * 24 * 60 * 60 * 1000;   // сервер принимает интервалы за 30 дней
+let outbox = []; // [{id, user_id, created, entries}]
+let failedAttempts = 0;
+let nextAttemptAt = 0;
+let retryTimer = null;
+let draining = false;
+let queueRestored = false; // до восстановления нельзя перезаписывать сохранённую очередь
+
+function persistQueue() {
+    if (!queueRestored) {
+        return;
     }
+    chrome.storage.local.set({ outbox, pendingEntries }).catch((error) => {
+        console.error('❌ Не удалось сохранить очередь:', error.message);
+    });
+}
 
-    // 3. Проверяем user_id ПЕРЕД отправкой!
+async function restoreQueue() {
+    const saved = await chrome.storage.local.get(['outbox', 'pendingEntries']);
+    outbox = (saved.outbox || []).concat(outbox);
+    pendingEntries = (saved.pendingEntries || []).concat(pendingEntries);
+    queueRestored = true;
+    persistQueue();
+    console.log(`📦 Восстановлено пакетов: ${outbox.length}, интервалов: ${pendingEntries.length}`);
+}
+
+// Запечатываем накопленные интервалы в пакеты с постоянным id
+function sealBatches() {
+    if (pendingEntries.length === 0) {
+        return;
+    }
     if (!currentUserId) {
-        const hasUser = await checkUserId();
-        if (!hasUser) {
-            console.log('❌ ОТМЕНА ОТПРАВКИ: Пользователь не авторизован');
-            console.log('👉 Авторизуйтесь в Flet приложении');
-
-            // Очищаем данные, если пользователь не авторизован
-            // (чтобы не копить данные для неавторизованного пользователя)
-            siteTimes = {};
-            return;
-        }
+        // Данные неавторизованного пользователя не копим
+        pendingEntries = [];
+        persistQueue();
+        return;
     }
+    while (pendingEntries.length > 0) {
+        outbox.push({
+            id: crypto.randomUUID(),
+            user_id: currentUserId,
+            created: Date.now(),
+            entries: pendingEntries.splice(0, MAX_BATCH_ENTRIES)
+        });
+    }
+    persistQueue();
+}
 
-    console.log(`📤 Отправка данных для user ${currentUserId}:`, siteTimes);
+// Экспоненциальная пауза со случайным разбросом (50–100% от расчётной)
+function scheduleRetry(delay) {
+    if (delay === undefined) {
+        failedAttempts += 1;
+        delay = Math.min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (failedAttempts - 1));
+        delay = delay * (0.5 + Math.random() * 0.5);
+    }
+    nextAttemptAt = Date.now() + delay;
+    clearTimeout(retryTimer);
+    retryTimer = setTimeout(() => drainOutbox(), delay);
+    console.log(`⏳ Повтор отправки через ${Math.round(delay / 1000)} сек`);
+}
 
-    const dataToSend = { ...siteTimes };
+async function sendBatch(batch) {
+    const json = JSON.stringify({ entries: batch.entries });
+    const compressed = await gzipBody(json);
+    const headers = {
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+        'Authorization': `Bearer ${authToken}`,
+        'Idempotency-Key': batch.id
+    };
+    if (compressed) {
+        headers['Content-Encoding'] = 'gzip';
+    }
+    return await fetch('http://127.0.0.1:5000/log_activity', {
+        method: 'POST',
+        headers,
+        body: compressed || json
+    });
+}
 
+// Отправляем очередь ограниченными порциями, когда /ping отвечает
+async function drainOutbox() {
+    if (draining || Date.now() < nextAttemptAt) {
+        return;
+    }
+    draining = true;
     try {
-        const response = await fetch('http://127.0.0.1:5000/log_activity', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            },
-            body: JSON.stringify({
-                site_times: dataToSend,
-                timestamp: Date.now()
-            })
-        });
+        // Устаревшие пакеты сервер уже не примет
+        const now = Date.now();
+        const before = outbox.length;
+        outbox = outbox.filter((batch) => now - batch.created < MAX_BATCH_AGE);
+        if (outbox.length !== before) {
+            persistQueue();
+        }
+        if (outbox.length === 0) {
+            return;
+        }
 
-        if (response.ok) {
-            const result = await response.json();
-            console.log(`✅ Данные для user ${currentUserId} отправлены:`, result);
-            siteTimes = {}; // Очищаем только после успешной отправки
-        } else if (response.status === 403) {
-            // 403 - доступ запрещен (нет user_id)
-            const error = await response.json();
-            console.log(`❌ ОТКАЗ СЕРВЕРА: ${error.message}`);
-            currentUserId = null; // Сбрасываем user_id
-            siteTimes = {}; // Очищаем накопленные данные
-        } else {
-            console.log(`❌ Ошибка сервера: ${response.status}`);
-            serverAvailable = false;
+        if (!(await checkServer())) {
+            scheduleRetry();
+            return;
+        }
+        if ((!currentUserId || !authToken) && !(await checkUserId())) {
+            // Никто не вошёл: пакеты ждут, пока их владелец снова авторизуется
+            return;
+        }
+
+        // Пакеты другого пользователя ждут его входа
+        const batches = outbox.filter((batch) => batch.user_id === currentUserId).slice(0, DRAIN_MAX_BATCHES);
+        for (const batch of batches) {
+            const response = await sendBatch(batch);
+
+            if (response.ok || response.status === 400 || response.status === 413) {
+                // Принят (или дубль уже принятого) — убираем. 400/413 — пакет
+                // испорчен, повтор не поможет
+                if (!response.ok) {
+                    console.log(`❌ Сервер отклонил пакет ${batch.id}: ${response.status}`);
+                }
+                outbox = outbox.filter((item) => item.id !== batch.id);
+                persistQueue();
+            } else if (response.status === 401) {
+                // Токен недействителен — возьмём новый при следующей попытке
+                console.log('❌ ОТКАЗ СЕРВЕРА: токен недействителен');
+                currentUserId = null;
+                authToken = null;
+                scheduleRetry();
+                return;
+            } else if (response.status === 429 || response.status === 503) {
+                const retryAfter = parseInt(response.headers.get('Retry-After') || '30', 10);
+                retryAfterUntil = Date.now() + retryAfter * 1000;
+                scheduleRetry(retryAfter * 1000);
+                return;
+            } else {
+                console.log(`❌ Ошибка сервера: ${response.status}`);
+                serverAvailable = false;
+                scheduleRetry();
+                return;
+            }
+        }
+
+        failedAttempts = 0;
+        console.log(`✅ Отправлено пакетов: ${batches.length}, в очереди: ${outbox.length}`);
+        // Осталась ещё порция — продолжаем, не дожидаясь таймера
+        if (outbox.some((batch) => batch.user_id === currentUserId)) {
+            scheduleRetry(1000);
         }
     } catch (error) {
         console.error('❌ Ошибка отправки:', error.message);
         serverAvailable = false;
+        scheduleRetry();
+    } finally {
+        draining = false;
     }
 }
 
+function flushQueue() {
+    closeBucket();
+    sealBatches();
+    drainOutbox();
+}
+
 // ========== ТАЙМЕРЫ ==========
 // Сохраняем время каждые 5 секунд
 setInterval(() => {
     saveTime();
 }, 5000);
 
-// Отправляем данные каждые 30 секунд
+// Каждые 30 секунд закрываем интервал; без пакетного режима сразу отправляем
 setInterval(() => {
-    sendData();
+    if (BATCH_MODE) {
+        closeBucket();
+    } else {
+        flushQueue();
+    }
 }, 30000);
 
-// Проверяем сервер и user_id при запуске
+// Пакет интервалов отправляем реже, одним сжатым запросом
+if (BATCH_MODE) {
+    setInterval(() => {
+        flushQueue();
+    }, BATCH_SEND_INTERVAL);
+}
+
+// При запуске восстанавливаем очередь и дописываем то, что не ушло
 setTimeout(async () => {
+    await restoreQueue();
     await checkServer();
     await checkUserId();
+    subscribeSession(); // дальше о входе/выходе сообщит сервер
+    drainOutbox();
 }, 2000);
 
-// Проверяем user_id каждую минуту (на случай выхода/входа)
-setInterval(async () => {
-    await checkUserId();
-}, 60000);
 
 // Отладочная информация
 setInterval(() => {
@@ -206,7 +506,11 @@ setInterval(() => {
         serverAvailable,
         currentUserId,
         activeDomain,
-        siteTimesCount: Object.keys(siteTimes).length
+        accounting,
+        systemState,
+        siteTimesCount: Object.keys(siteTimes).length,
+        pendingEntries: pendingEntries.length,
+        outbox: outbox.length
     });
 }, 60000); // Каждую минуту
 
@@ -217,11 +521,17 @@ window.debugMonitor = {
         serverAvailable,
         currentUserId,
         activeDomain,
+        accounting,
+        systemState,
+        tabState: tabState(activeTabId),
         siteTimes,
         activeStart,
         dataSize: Object.keys(siteTimes).length
     }),
-    forceSend: () => sendData(),
+    forceSend: () => {
+        nextAttemptAt = 0;
+        flushQueue();
+    },
     checkUser: () => checkUserId(),
     checkServer: () => checkServer(),
     clearData: () => {
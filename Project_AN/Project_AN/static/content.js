@@ -7,6 +7,7 @@
     let activityCheckInterval = null;
     let videoPlaying = false;
     let audioPlaying = false;
+    let mediaReported = false; // background знает, что на странице играет медиа
 
     // События активности пользователя
     const activityEvents = [
@@ -19,20 +20,27 @@
     function handleUserActivity() {
         lastActivityTime = Date.now();
 
-        if (!isUserActive) {
+        // Пока медиа играет, background и так считает вкладку активной
+        if (!isUserActive || (mediaReported && !videoPlaying && !audioPlaying)) {
             isUserActive = true;
+            mediaReported = false;
             // Сообщаем background script об активности
             chrome.runtime.sendMessage({ type: 'USER_ACTIVE' });
         }
     }
 
+    function reportMedia() {
+        mediaReported = true;
+        chrome.runtime.sendMessage({ type: 'MEDIA_PLAYING' });
+    }
+
     // Отслеживание медиа элементов
     function trackMediaElements() {
         // Отслеживаем видео
         document.querySelectorAll('video').forEach(video => {
             video.addEventListener('play', () => {
                 videoPlaying = true;
-                chrome.runtime.sendMessage({ type: 'MEDIA_PLAYING' });
+                reportMedia();
             });
             video.addEventListener('pause', () => {
                 videoPlaying = false;
@@ -48,7 +56,7 @@
         document.querySelectorAll('audio').forEach(audio => {
             audio.addEventListener('play', () => {
                 audioPlaying = true;
-                chrome.runtime.sendMessage({ type: 'MEDIA_PLAYING' });
+                reportMedia();
             });
             audio.addEventListener('pause', () => {
                 audioPlaying = false;
@@ -73,8 +81,10 @@
 
         // Если неактивность более 30 секунд и нет играющего медиа
         if (inactiveTime > 30000 && !videoPlaying && !audioPlaying) {
-            if (isUserActive) {
+            // mediaReported: видео остановилось, а ввода так и не было
+            if (isUserActive || mediaReported) {
                 isUserActive = false;
+                mediaReported = false;
                 chrome.runtime.sendMessage({ type: 'USER_INACTIVE' });
             }
         }
@@ -101,12 +111,15 @@
         audioPlaying = Array.from(audios).some(a => !a.paused);
 
         if (videoPlaying || audioPlaying) {
-            chrome.runtime.sendMessage({ type: 'MEDIA_PLAYING' });
+            reportMedia();
         }
 
         // Обработка видимости страницы
         document.addEventListener('visibilitychange', () => {
             if (document.hidden) {
+                // При возврате на вкладку handleUserActivity снова сообщит USER_ACTIVE
+                isUserActive = false;
+                mediaReported = false;
                 chrome.runtime.sendMessage({ type: 'USER_INACTIVE' });
             } else {
                 handleUserActivity();
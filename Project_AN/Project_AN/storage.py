@@ -0,0 +1,1076 @@
+# storage.py
+# Хранилище данных активности и расписаний за единым интерфейсом.
+# Бэкенд выбирается переменной STORAGE_BACKEND:
+#   postgres — общий пул db_pool (по умолчанию);
+#   sqlite   — встроенная БД в одном файле SQLITE_PATH (WAL), без сервера.
+# Учётные записи и токены клиентов тоже здесь; Telegram-боты и резервная
+# копия (backUp.py) работают только с PostgreSQL и при sqlite не запускаются.
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, time as dtime
+
+import activity_ingest
+import activity_journal
+import activity_partitions
+
+# ================= НАСТРОЙКИ ХРАНИЛИЩА =================
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "postgres")
+SQLITE_PATH = os.environ.get(
+    "SQLITE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "activity.sqlite3"))
+SQLITE_BUSY_TIMEOUT_MS = 5000   # сколько писатель ждёт блокировку файла другим процессом
+
+# Кто хочет знать о записи активности в этом процессе (кэш детализации)
+_activity_listeners = []
+
+
+class UserExistsError(Exception):
+    """Пользователь с таким email уже зарегистрирован"""
+
+
+def add_activity_listener(callback):
+    """callback(user_ids) вызывается после каждой успешной записи активности"""
+    _activity_listeners.append(callback)
+
+
+def _activity_written(batches):
+    if not _activity_listeners:
+        return
+    user_ids = {row[0] for _, rows in batches for row in rows}
+    if not user_ids:
+        return
+    for callback in list(_activity_listeners):
+        try:
+            callback(user_ids)
+        except Exception as e:
+            print(f"⚠️ Ошибка обработчика записи активности: {e}")
+
+
+def _summary(rows):
+    """Строки activity_summary -> (приложения, всего секунд, первая дата, последняя дата)"""
+    if not rows:
+        return [], 0, None, None
+    apps = [(name, seconds) for name, seconds, _, _ in rows if name is not None]
+    _, _, min_date, max_date = rows[0]
+    return apps, sum(seconds for _, seconds in apps), min_date, max_date
+
+
+class StorageBackend:
+    """Операции приложения над activity_monitoring, расписаниями и AI-расписаниями.
+
+    Даты — datetime.date, время задач — datetime.time, данные AI-расписания —
+    уже разобранный JSON. Каждая запись выполняется одной транзакцией.
+    """
+
+    name = None
+
+    def ping(self):
+        raise NotImplementedError
+
+    # --- учётные записи и токены клиентов (client_tokens.py) ---
+    def find_user(self, email):
+        """(id_user, email, password_hash) или None"""
+        raise NotImplementedError
+
+    def create_user(self, email, password_hash):
+        """id_user нового пользователя; email занят — UserExistsError"""
+        raise NotImplementedError
+
+    def save_client_token(self, token_hash, user_id, client, ttl):
+        raise NotImplementedError
+
+    def use_client_token(self, token_hash):
+        """Отмечает использование действующего токена: (user_id, истекает в unix-секундах) или None"""
+        raise NotImplementedError
+
+    def delete_client_token(self, token_hash):
+        raise NotImplementedError
+
+    # --- приём активности ---
+    def write_activity(self, batches, checkpoint=None, prune_days=None):
+        """Пишет пакеты [(ключ пакета или None, rows)] (см. activity_ingest.upsert_batches).
+
+        checkpoint — (имя журнала, seq): сохраняется в той же транзакции;
+        prune_days — заодно забыть ключи пакетов старше стольких дней.
+        Возвращает (число записанных ключей, число дублей).
+        """
+        raise NotImplementedError
+
+    def journal_checkpoint(self, journal_name):
+        raise NotImplementedError
+
+    def insert_focus_intervals(self, intervals):
+        raise NotImplementedError
+
+    def maintain_activity(self, retention_days=activity_partitions.RETENTION_DAYS):
+        """Фоновое обслуживание: срок хранения активности.
+        Возвращает {"created": [...], "dropped": [...], "deleted_rows": n}."""
+        raise NotImplementedError
+
+    # --- чтение активности ---
+    def activity_totals(self, user_id, start_date, end_date):
+        """[(app_name, секунд)] за период, по убыванию времени.
+
+        Читается из свёрток по месяцам и неделям и сырых строк только за
+        оставшиеся дни (activity_ingest.rollup_segments).
+        """
+        raise NotImplementedError
+
+    def daily_totals(self, user_id, start_date, end_date):
+        """[(дата, секунд)] — итоги пользователя по дням, только дни с активностью"""
+        raise NotImplementedError
+
+    def activity_date_range(self, user_id):
+        """(первая, последняя) дата с активностью; (None, None) — данных нет"""
+        raise NotImplementedError
+
+    def activity_summary(self, user_id, start_date, end_date):
+        """activity_totals и activity_date_range одним запросом.
+
+        Возвращает ([(app_name, секунд)], всего секунд, первая дата, последняя дата).
+        """
+        raise NotImplementedError
+
+    # --- расписание ---
+    def get_week_schedule(self, user_id):
+        """[(day_of_week, start_time, description)] по дню и времени"""
+        raise NotImplementedError
+
+    def get_day_schedule(self, user_id, day_of_week):
+        """[(start_time, description)] по времени"""
+        raise NotImplementedError
+
+    def replace_day_schedule(self, user_id, day_of_week, tasks):
+        """Заменяет задачи дня на tasks [(start_time, description)]"""
+        raise NotImplementedError
+
+    def replace_week_schedule(self, user_id, days):
+        """Заменяет всё расписание на {day_of_week: [(start_time, description)]}.
+        Возвращает число сохранённых задач."""
+        raise NotImplementedError
+
+    def delete_day_schedule(self, user_id, day_of_week):
+        raise NotImplementedError
+
+    # --- AI-расписание ---
+    def get_ai_schedule(self, user_id, day_of_week):
+        raise NotImplementedError
+
+    def ai_schedule_days(self, user_id):
+        raise NotImplementedError
+
+    def save_ai_schedules(self, user_id, schedules):
+        """Сохраняет {day_of_week: данные}, пустые дни пропускает. Возвращает сохранённые дни."""
+        raise NotImplementedError
+
+    def delete_ai_schedule(self, user_id, day_of_week):
+        raise NotImplementedError
+
+    # --- категории приложений (app_categories.py) ---
+    def get_app_categories(self, user_id):
+        """[(имя приложения в нижнем регистре, категория)], выбранные пользователем"""
+        raise NotImplementedError
+
+    def set_app_category(self, user_id, app_name, category):
+        raise NotImplementedError
+
+    def delete_app_category(self, user_id, app_name):
+        raise NotImplementedError
+
+
+# ================= POSTGRESQL =================
+class PostgresBackend(StorageBackend):
+    """Хранилище в PostgreSQL через общий пул (db_pool.PoolClient)"""
+
+    name = "postgres"
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def ping(self):
+        return self.pool.ping()
+
+    def find_user(self, email):
+        rows = self._fetchall("SELECT id_user, email, password_hash FROM users WHERE email = %s", (email,))
+        return rows[0] if rows else None
+
+    def create_user(self, email, password_hash):
+        with self.pool.transaction() as cur:
+            cur.execute("""
+                INSERT INTO users (email, password_hash) VALUES (%s, %s)
+                ON CONFLICT (email) DO NOTHING
+                RETURNING id_user
+            """, (email, password_hash))
+            row = cur.fetchone()
+        if row is None:
+            raise UserExistsError(email)
+        return row[0]
+
+    def save_client_token(self, token_hash, user_id, client, ttl):
+        with self.pool.transaction() as cur:
+            cur.execute("""
+                INSERT INTO client_tokens (token_hash, user_id, client, expires_at)
+                VALUES (%s, %s, %s, NOW() + %s * INTERVAL '1 second')
+            """, (token_hash, user_id, client, ttl))
+
+    def use_client_token(self, token_hash):
+        with self.pool.transaction() as cur:
+            cur.execute("""
+                UPDATE client_tokens SET last_used_at = NOW()
+                WHERE token_hash = %s AND expires_at > NOW()
+                RETURNING user_id, EXTRACT(EPOCH FROM expires_at)
+            """, (token_hash,))
+            row = cur.fetchone()
+        return None if row is None else (row[0], float(row[1]))
+
+    def delete_client_token(self, token_hash):
+        with self.pool.transaction() as cur:
+            cur.execute("DELETE FROM client_tokens WHERE token_hash = %s", (token_hash,))
+
+    def write_activity(self, batches, checkpoint=None, prune_days=None):
+        with self.pool.transaction() as cur:
+            result = activity_ingest.upsert_batches(cur, batches)
+            if prune_days is not None:
+                activity_ingest.prune_batches(cur, prune_days)
+            if checkpoint is not None:
+                activity_journal.set_db_checkpoint(cur, *checkpoint)
+        _activity_written(batches)
+        return result
+
+    def journal_checkpoint(self, journal_name):
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            seq = activity_journal.get_db_checkpoint(cur, journal_name)
+            conn.rollback()
+            cur.close()
+        return seq
+
+    def insert_focus_intervals(self, intervals):
+        with self.pool.transaction() as cur:
+            return activity_ingest.insert_focus_intervals(cur, intervals)
+
+    def maintain_activity(self, retention_days=activity_partitions.RETENTION_DAYS):
+        # Секции: будущие создаются заранее, устаревшие удаляются целиком
+        with self.pool.connection() as conn:
+            created = activity_partitions.ensure_partitions(conn)
+            dropped, deleted = activity_partitions.drop_expired(conn, retention_days=retention_days)
+        return {"created": created, "dropped": dropped, "deleted_rows": deleted}
+
+    def _fetchall(self, query, params):
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            conn.rollback()
+            cur.close()
+        return rows
+
+    # Суммируется по app_id, имя из словаря apps — только для итоговых строк
+    APP_TOTALS_SQL = """
+        SELECT a.name, t.total_seconds
+        FROM (
+            SELECT app_id, SUM(total_seconds) AS total_seconds
+            FROM (
+                SELECT app_id, total_seconds FROM activity_monthly
+                WHERE user_id = %s AND month_start = ANY(%s::date[])
+                UNION ALL
+                SELECT app_id, total_seconds FROM activity_weekly
+                WHERE user_id = %s AND week_start = ANY(%s::date[])
+                UNION ALL
+                SELECT app_id, total_seconds FROM activity_monitoring
+                WHERE user_id = %s AND activity_date = ANY(%s::date[])
+            ) parts
+            GROUP BY app_id
+        ) t
+        JOIN apps a ON a.id = t.app_id
+    """
+
+    @staticmethod
+    def _app_totals_params(user_id, start_date, end_date):
+        months, weeks, days = activity_ingest.rollup_segments(start_date, end_date)
+        return user_id, months, user_id, weeks, user_id, days
+
+    def activity_totals(self, user_id, start_date, end_date):
+        return self._fetchall(f"{self.APP_TOTALS_SQL} ORDER BY t.total_seconds DESC",
+                              self._app_totals_params(user_id, start_date, end_date))
+
+    def activity_summary(self, user_id, start_date, end_date):
+        # Диапазон дат — всегда одна строка, итоги приложений присоединяются к ней
+        rows = self._fetchall(f"""
+            WITH totals AS ({self.APP_TOTALS_SQL}),
+            date_range AS (
+                SELECT MIN(activity_date) AS min_date, MAX(activity_date) AS max_date
+                FROM activity_daily_totals
+                WHERE user_id = %s
+            )
+            SELECT totals.name, totals.total_seconds, r.min_date, r.max_date
+            FROM date_range r
+            LEFT JOIN totals ON TRUE
+            ORDER BY totals.total_seconds DESC NULLS LAST
+        """, (*self._app_totals_params(user_id, start_date, end_date), user_id))
+        return _summary(rows)
+
+    def daily_totals(self, user_id, start_date, end_date):
+        return self._fetchall("""
+            SELECT activity_date, total_seconds
+            FROM activity_daily_totals
+            WHERE user_id = %s AND activity_date BETWEEN %s AND %s
+            ORDER BY activity_date
+        """, (user_id, start_date, end_date))
+
+    def activity_date_range(self, user_id):
+        rows = self._fetchall(
+            "SELECT MIN(activity_date), MAX(activity_date) FROM activity_daily_totals WHERE user_id = %s",
+            (user_id,))
+        return rows[0] if rows else (None, None)
+
+    def get_week_schedule(self, user_id):
+        return self._fetchall("""
+            SELECT sd.day_of_week, st.start_time, st.description
+            FROM schedule_days sd
+            JOIN schedule_tasks st ON sd.id_day = st.day_id
+            WHERE sd.user_id = %s
+            ORDER BY sd.day_of_week, st.start_time
+        """, (user_id,))
+
+    def get_day_schedule(self, user_id, day_of_week):
+        return self._fetchall("""
+            SELECT st.start_time, st.description
+            FROM schedule_days sd
+            JOIN schedule_tasks st ON sd.id_day = st.day_id
+            WHERE sd.user_id = %s AND sd.day_of_week = %s
+            ORDER BY st.start_time
+        """, (user_id, day_of_week))
+
+    @staticmethod
+    def _insert_day(cur, user_id, day_of_week, tasks):
+        cur.execute(
+            "INSERT INTO schedule_days (user_id, day_of_week) VALUES (%s, %s) RETURNING id_day",
+            (user_id, day_of_week))
+        day_id = cur.fetchone()[0]
+        if tasks:
+            cur.executemany(
+                "INSERT INTO schedule_tasks (day_id, start_time, description) VALUES (%s, %s, %s)",
+                [(day_id, start_time, description) for start_time, description in tasks])
+
+    def replace_day_schedule(self, user_id, day_of_week, tasks):
+        with self.pool.transaction() as cur:
+            cur.execute("DELETE FROM schedule_days WHERE user_id = %s AND day_of_week = %s",
+                        (user_id, day_of_week))
+            self._insert_day(cur, user_id, day_of_week, tasks)
+
+    def replace_week_schedule(self, user_id, days):
+        with self.pool.transaction() as cur:
+            cur.execute("DELETE FROM schedule_days WHERE user_id = %s", (user_id,))
+            for day_of_week in sorted(days):
+                self._insert_day(cur, user_id, day_of_week, days[day_of_week])
+        return sum(len(tasks) for tasks in days.values())
+
+    def delete_day_schedule(self, user_id, day_of_week):
+        with self.pool.transaction() as cur:
+            cur.execute("DELETE FROM schedule_days WHERE user_id = %s AND day_of_week = %s",
+                        (user_id, day_of_week))
+
+    def get_ai_schedule(self, user_id, day_of_week):
+        rows = self._fetchall(
+            "SELECT data FROM ai_generated_schedules WHERE user_id = %s AND day_of_week = %s",
+            (user_id, day_of_week))
+        return rows[0][0] if rows else None
+
+    def ai_schedule_days(self, user_id):
+        rows = self._fetchall("SELECT day_of_week FROM ai_generated_schedules WHERE user_id = %s", (user_id,))
+        return {row[0] for row in rows}
+
+    def save_ai_schedules(self, user_id, schedules):
+        saved_days = []
+        with self.pool.transaction() as cur:
+            for day_of_week, data in schedules.items():
+                if not data:
+                    continue
+                cur.execute("DELETE FROM ai_generated_schedules WHERE user_id = %s AND day_of_week = %s",
+                            (user_id, day_of_week))
+                cur.execute("INSERT INTO ai_generated_schedules (user_id, day_of_week, data) VALUES (%s, %s, %s)",
+                            (user_id, day_of_week, json.dumps(data, ensure_ascii=False)))
+                saved_days.append(day_of_week)
+        return saved_days
+
+    def delete_ai_schedule(self, user_id, day_of_week):
+        with self.pool.transaction() as cur:
+            cur.execute("DELETE FROM ai_generated_schedules WHERE user_id = %s AND day_of_week = %s",
+                        (user_id, day_of_week))
+
+    def get_app_categories(self, user_id):
+        return self._fetchall("SELECT app_name, category FROM app_category_rules WHERE user_id = %s",
+                              (user_id,))
+
+    def set_app_category(self, user_id, app_name, category):
+        with self.pool.transaction() as cur:
+            cur.execute("""
+                INSERT INTO app_category_rules (user_id, app_name, category) VALUES (%s, %s, %s)
+                ON CONFLICT (user_id, app_name) DO UPDATE SET category = EXCLUDED.category
+            """, (user_id, app_name, category))
+
+    def delete_app_category(self, user_id, app_name):
+        with self.pool.transaction() as cur:
+            cur.execute("DELETE FROM app_category_rules WHERE user_id = %s AND app_name = %s", (user_id, app_name))
+
+
+# ================= SQLITE =================
+# Та же схема, что у PostgreSQL (schema_migrations.py), в типах SQLite: даты —
+# текст ISO (сортируется как дата), время задач — 'HH:MM:SS', моменты времени —
+# unix-секунды. Таблица users появилась в версии 5, поэтому внешних ключей на
+# неё у таблиц активности и расписаний нет.
+# Версия схемы — PRAGMA user_version; новые версии только добавляются в конец.
+SQLITE_MIGRATIONS = [
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS activity_monitoring (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            app_name TEXT NOT NULL,
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            activity_date TEXT NOT NULL,
+            UNIQUE (user_id, app_name, activity_date)
+        )
+        """,
+        # INCLUDE в SQLite нет: покрывающий индекс — все читаемые столбцы в ключе
+        "CREATE INDEX IF NOT EXISTS idx_activity_user_date_cover "
+        "ON activity_monitoring(user_id, activity_date, app_name, total_seconds)",
+        """
+        CREATE TABLE IF NOT EXISTS schedule_days (
+            id_day INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            day_of_week INTEGER NOT NULL,
+            UNIQUE (user_id, day_of_week)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS schedule_tasks (
+            id_task INTEGER PRIMARY KEY,
+            day_id INTEGER NOT NULL REFERENCES schedule_days(id_day) ON DELETE CASCADE,
+            description TEXT NOT NULL,
+            start_time TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_schedule_tasks_day_time ON schedule_tasks(day_id, start_time)",
+        """
+        CREATE TABLE IF NOT EXISTS ai_generated_schedules (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            day_of_week INTEGER NOT NULL,
+            data TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ai_schedules_user_day ON ai_generated_schedules(user_id, day_of_week)",
+        """
+        CREATE TABLE IF NOT EXISTS activity_journal_checkpoint (
+            journal_name TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS focus_intervals (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            app_name TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            ended_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_focus_intervals_user_started ON focus_intervals(user_id, started_at)",
+        """
+        CREATE TABLE IF NOT EXISTS ingest_batches (
+            user_id INTEGER NOT NULL,
+            batch_id TEXT NOT NULL,
+            received_at REAL NOT NULL,
+            PRIMARY KEY (user_id, batch_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ingest_batches_received ON ingest_batches(received_at)",
+    ]),
+    # Свёртки активности (как миграция 9 PostgreSQL)
+    (2, [
+        """
+        CREATE TABLE IF NOT EXISTS activity_daily_totals (
+            user_id INTEGER NOT NULL,
+            activity_date TEXT NOT NULL,
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, activity_date)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS activity_weekly (
+            user_id INTEGER NOT NULL,
+            week_start TEXT NOT NULL,
+            app_name TEXT NOT NULL,
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, week_start, app_name)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS activity_monthly (
+            user_id INTEGER NOT NULL,
+            month_start TEXT NOT NULL,
+            app_name TEXT NOT NULL,
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month_start, app_name)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO activity_daily_totals (user_id, activity_date, total_seconds)
+        SELECT user_id, activity_date, SUM(total_seconds)
+        FROM activity_monitoring
+        GROUP BY user_id, activity_date
+        """,
+        # 'weekday 0' — ближайшее воскресенье не раньше даты, минус 6 дней — понедельник
+        """
+        INSERT INTO activity_weekly (user_id, week_start, app_name, total_seconds)
+        SELECT user_id, date(activity_date, 'weekday 0', '-6 days'), app_name, SUM(total_seconds)
+        FROM activity_monitoring
+        GROUP BY 1, 2, 3
+        """,
+        """
+        INSERT INTO activity_monthly (user_id, month_start, app_name, total_seconds)
+        SELECT user_id, date(activity_date, 'start of month'), app_name, SUM(total_seconds)
+        FROM activity_monitoring
+        GROUP BY 1, 2, 3
+        """,
+    ]),
+    # Словарь приложений (как миграция 10 PostgreSQL): строки хранят app_id.
+    # Суррогатный id убран — ключом стал прежний UNIQUE, без отдельного индекса.
+    (3, [
+        """
+        CREATE TABLE apps (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+        """,
+        """
+        INSERT INTO apps (name)
+        SELECT app_name FROM activity_monitoring
+        UNION
+        SELECT app_name FROM activity_weekly
+        UNION
+        SELECT app_name FROM activity_monthly
+        ORDER BY 1
+        """,
+        "DROP INDEX idx_activity_user_date_cover",
+        "ALTER TABLE activity_monitoring RENAME TO activity_monitoring_legacy",
+        "ALTER TABLE activity_weekly RENAME TO activity_weekly_legacy",
+        "ALTER TABLE activity_monthly RENAME TO activity_monthly_legacy",
+        """
+        CREATE TABLE activity_monitoring (
+            user_id INTEGER NOT NULL,
+            app_id INTEGER NOT NULL REFERENCES apps(id),
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            activity_date TEXT NOT NULL,
+            PRIMARY KEY (user_id, app_id, activity_date)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE activity_weekly (
+            user_id INTEGER NOT NULL,
+            week_start TEXT NOT NULL,
+            app_id INTEGER NOT NULL REFERENCES apps(id),
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, week_start, app_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE activity_monthly (
+            user_id INTEGER NOT NULL,
+            month_start TEXT NOT NULL,
+            app_id INTEGER NOT NULL REFERENCES apps(id),
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month_start, app_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO activity_monitoring (user_id, app_id, total_seconds, activity_date)
+        SELECT l.user_id, a.id, l.total_seconds, l.activity_date
+        FROM activity_monitoring_legacy l
+        JOIN apps a ON a.name = l.app_name
+        """,
+        """
+        INSERT INTO activity_weekly (user_id, week_start, app_id, total_seconds)
+        SELECT l.user_id, l.week_start, a.id, l.total_seconds
+        FROM activity_weekly_legacy l
+        JOIN apps a ON a.name = l.app_name
+        """,
+        """
+        INSERT INTO activity_monthly (user_id, month_start, app_id, total_seconds)
+        SELECT l.user_id, l.month_start, a.id, l.total_seconds
+        FROM activity_monthly_legacy l
+        JOIN apps a ON a.name = l.app_name
+        """,
+        "DROP TABLE activity_monitoring_legacy",
+        "DROP TABLE activity_weekly_legacy",
+        "DROP TABLE activity_monthly_legacy",
+        "CREATE INDEX idx_activity_user_date_cover "
+        "ON activity_monitoring(user_id, activity_date, app_id, total_seconds)",
+    ]),
+    # Свои правила категорий приложений (как миграция 11 PostgreSQL)
+    (4, [
+        """
+        CREATE TABLE IF NOT EXISTS app_category_rules (
+            user_id INTEGER NOT NULL,
+            keyword TEXT NOT NULL,
+            category TEXT NOT NULL,
+            PRIMARY KEY (user_id, keyword)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    # Учётные записи и токены клиентов: вход и приём активности без PostgreSQL
+    (5, [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id_user INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS client_tokens (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+            client TEXT NOT NULL DEFAULT 'desktop',
+            created_at REAL NOT NULL,
+            last_used_at REAL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+    ]),
+    # Категория выбирается для приложения целиком, а не по подстроке (как миграция 12 PostgreSQL)
+    (6, [
+        "ALTER TABLE app_category_rules RENAME COLUMN keyword TO app_name",
+    ]),
+]
+
+SQLITE_UPSERT_SQL = """
+    INSERT INTO activity_monitoring (user_id, app_id, total_seconds, activity_date)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, app_id, activity_date)
+    DO UPDATE SET total_seconds = total_seconds + excluded.total_seconds
+"""
+
+SQLITE_ROLLUP_UPSERT_SQL = """
+    INSERT INTO {table} (user_id, app_id, {period}, total_seconds)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, {period}, app_id)
+    DO UPDATE SET total_seconds = total_seconds + excluded.total_seconds
+"""
+
+SQLITE_DAILY_UPSERT_SQL = """
+    INSERT INTO activity_daily_totals (user_id, activity_date, total_seconds)
+    VALUES (?, ?, ?)
+    ON CONFLICT (user_id, activity_date)
+    DO UPDATE SET total_seconds = total_seconds + excluded.total_seconds
+"""
+
+
+def _placeholders(values):
+    # IN () в SQLite допустим и ничего не выбирает
+    return ", ".join("?" * len(values))
+
+
+def _to_date(value):
+    return date.fromisoformat(value) if value else None
+
+
+def _to_time(value):
+    return dtime.fromisoformat(value)
+
+
+def _time_text(value):
+    return value.strftime("%H:%M:%S") if isinstance(value, dtime) else str(value)
+
+
+class SqliteBackend(StorageBackend):
+    """Хранилище в одном файле SQLite.
+
+    Журнал WAL: читатели не блокируют писателя и друг друга. У каждого потока
+    своё соединение; запись — BEGIN IMMEDIATE под общим для процесса замком,
+    чтобы писатели не крутились в ожидании busy_timeout друг за другом.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_PATH, busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._apps = activity_ingest.AppDictionary()
+        self._migrate()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            # В WAL режим NORMAL не теряет согласованность, только последние
+            # транзакции при отключении питания — их восполняет журнал активности
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA foreign_keys = ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.cursor()
+            try:
+                yield cur
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+            finally:
+                cur.close()
+
+    def _fetchall(self, query, params=()):
+        cur = self._conn().execute(query, params)
+        rows = cur.fetchall()
+        cur.close()
+        return rows
+
+    def _migrate(self):
+        with self._transaction() as cur:
+            current = cur.execute("PRAGMA user_version").fetchone()[0]
+            for version, statements in SQLITE_MIGRATIONS:
+                if version <= current:
+                    continue
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(f"PRAGMA user_version = {int(version)}")
+
+    def ping(self):
+        try:
+            self._fetchall("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    # --- учётные записи и токены клиентов ---
+    def find_user(self, email):
+        rows = self._fetchall("SELECT id_user, email, password_hash FROM users WHERE email = ?", (email,))
+        return rows[0] if rows else None
+
+    def create_user(self, email, password_hash):
+        with self._transaction() as cur:
+            cur.execute("INSERT OR IGNORE INTO users (email, password_hash) VALUES (?, ?)", (email, password_hash))
+            if cur.rowcount == 0:
+                raise UserExistsError(email)
+            return cur.lastrowid
+
+    def save_client_token(self, token_hash, user_id, client, ttl):
+        now = time.time()
+        with self._transaction() as cur:
+            cur.execute("""
+                INSERT INTO client_tokens (token_hash, user_id, client, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (token_hash, user_id, client, now, now + ttl))
+
+    def use_client_token(self, token_hash):
+        now = time.time()
+        with self._transaction() as cur:
+            cur.execute("""
+                UPDATE client_tokens SET last_used_at = ?
+                WHERE token_hash = ? AND expires_at > ?
+            """, (now, token_hash, now))
+            if cur.rowcount == 0:
+                return None
+            return cur.execute("SELECT user_id, expires_at FROM client_tokens WHERE token_hash = ?",
+                               (token_hash,)).fetchone()
+
+    def delete_client_token(self, token_hash):
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM client_tokens WHERE token_hash = ?", (token_hash,))
+
+    # --- приём активности ---
+    @staticmethod
+    def _claim_batches(cur, batch_keys):
+        fresh = set()
+        received_at = time.time()
+        for user_id, batch_id in sorted(batch_keys):
+            cur.execute("INSERT OR IGNORE INTO ingest_batches (user_id, batch_id, received_at) VALUES (?, ?, ?)",
+                        (user_id, batch_id, received_at))
+            if cur.rowcount == 1:
+                fresh.add((user_id, batch_id))
+        return fresh
+
+    def _intern_apps(self, cur, names):
+        """{имя: apps.id}; как activity_ingest.intern_apps, кэшируются только закоммиченные id"""
+        found, missing = self._apps.cached(names)
+        committed = {}
+        for name in sorted(missing):
+            cur.execute("INSERT OR IGNORE INTO apps (name) VALUES (?)", (name,))
+            if cur.rowcount == 1:
+                found[name] = cur.lastrowid
+            else:
+                cur.execute("SELECT id FROM apps WHERE name = ?", (name,))
+                found[name] = committed[name] = cur.fetchone()[0]
+        self._apps.remember(committed)
+        return found
+
+    def write_activity(self, batches, checkpoint=None, prune_days=None):
+        rows = []
+        keyed = {}
+        for batch_key, batch_rows in batches:
+            if batch_key is None:
+                rows.extend(batch_rows)
+            else:
+                keyed.setdefault(tuple(batch_key), batch_rows)
+
+        with self._transaction() as cur:
+            fresh = self._claim_batches(cur, keyed)
+            for batch_key in fresh:
+                rows.extend(keyed[batch_key])
+            merged = activity_ingest.coalesce_rows(rows)
+            if merged:
+                app_ids = self._intern_apps(cur, {key[1] for key in merged})
+                merged = activity_ingest.to_app_ids(merged, app_ids)
+                cur.executemany(SQLITE_UPSERT_SQL, [
+                    (user_id, app_id, merged[(user_id, app_id, activity_date)], activity_date.isoformat())
+                    for user_id, app_id, activity_date in sorted(merged)
+                ])
+                self._upsert_rollups(cur, merged)
+            if prune_days is not None:
+                cur.execute("DELETE FROM ingest_batches WHERE received_at < ?",
+                            (time.time() - prune_days * 86400,))
+            if checkpoint is not None:
+                journal_name, seq = checkpoint
+                cur.execute("""
+                    INSERT INTO activity_journal_checkpoint (journal_name, last_seq, updated_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (journal_name)
+                    DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq),
+                                  updated_at = excluded.updated_at
+                """, (journal_name, seq, time.time()))
+        _activity_written(batches)
+        return len(merged), len(keyed) - len(fresh)
+
+    @staticmethod
+    def _upsert_rollups(cur, merged):
+        for table, column, period_start in activity_ingest.ROLLUPS:
+            deltas = activity_ingest.rollup_deltas(merged, period_start)
+            cur.executemany(SQLITE_ROLLUP_UPSERT_SQL.format(table=table, period=column), [
+                (user_id, app_id, period.isoformat(), deltas[(user_id, app_id, period)])
+                for user_id, app_id, period in sorted(deltas)
+            ])
+        deltas = activity_ingest.daily_deltas(merged)
+        cur.executemany(SQLITE_DAILY_UPSERT_SQL, [
+            (user_id, day.isoformat(), deltas[(user_id, day)]) for user_id, day in sorted(deltas)
+        ])
+
+    def journal_checkpoint(self, journal_name):
+        rows = self._fetchall("SELECT last_seq FROM activity_journal_checkpoint WHERE journal_name = ?",
+                              (journal_name,))
+        return rows[0][0] if rows else 0
+
+    def insert_focus_intervals(self, intervals):
+        if not intervals:
+            return 0
+        with self._transaction() as cur:
+            cur.executemany(
+                "INSERT INTO focus_intervals (user_id, app_name, started_at, ended_at) VALUES (?, ?, ?, ?)",
+                intervals)
+        return len(intervals)
+
+    def maintain_activity(self, retention_days=activity_partitions.RETENTION_DAYS):
+        # Секционирования в SQLite нет: удаление по дате, но в фоне, а не при открытии страницы
+        cutoff = activity_partitions.retention_cutoff(retention_days=retention_days)
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM activity_monitoring WHERE activity_date < ?", (cutoff.isoformat(),))
+            deleted = cur.rowcount
+            # Свёртки — за периоды, целиком старше срока хранения (то же правило, что в PostgreSQL)
+            for table, column, keep_from in activity_ingest.rollup_retention(cutoff):
+                cur.execute(f"DELETE FROM {table} WHERE {column} < ?", (keep_from.isoformat(),))
+        return {"created": [], "dropped": [], "deleted_rows": deleted}
+
+    # --- чтение активности ---
+    @staticmethod
+    def _app_totals_query(user_id, start_date, end_date):
+        """SQL и параметры итогов по приложениям (без ORDER BY): число дней меняется"""
+        months, weeks, days = (
+            [day.isoformat() for day in segment]
+            for segment in activity_ingest.rollup_segments(start_date, end_date)
+        )
+        return f"""
+            SELECT a.name, t.total_seconds
+            FROM (
+                SELECT app_id, SUM(total_seconds) AS total_seconds
+                FROM (
+                    SELECT app_id, total_seconds FROM activity_monthly
+                    WHERE user_id = ? AND month_start IN ({_placeholders(months)})
+                    UNION ALL
+                    SELECT app_id, total_seconds FROM activity_weekly
+                    WHERE user_id = ? AND week_start IN ({_placeholders(weeks)})
+                    UNION ALL
+                    SELECT app_id, total_seconds FROM activity_monitoring
+                    WHERE user_id = ? AND activity_date IN ({_placeholders(days)})
+                )
+                GROUP BY app_id
+            ) t
+            JOIN apps a ON a.id = t.app_id
+        """, (user_id, *months, user_id, *weeks, user_id, *days)
+
+    def activity_totals(self, user_id, start_date, end_date):
+        sql, params = self._app_totals_query(user_id, start_date, end_date)
+        return self._fetchall(f"{sql} ORDER BY t.total_seconds DESC", params)
+
+    def activity_summary(self, user_id, start_date, end_date):
+        sql, params = self._app_totals_query(user_id, start_date, end_date)
+        # NULL при DESC в SQLite и так последний: строка без приложений в конце
+        rows = self._fetchall(f"""
+            WITH totals AS ({sql}),
+            date_range AS (
+                SELECT MIN(activity_date) AS min_date, MAX(activity_date) AS max_date
+                FROM activity_daily_totals
+                WHERE user_id = ?
+            )
+            SELECT totals.name, totals.total_seconds, r.min_date, r.max_date
+            FROM date_range r
+            LEFT JOIN totals ON 1
+            ORDER BY totals.total_seconds DESC
+        """, (*params, user_id))
+        apps, total_seconds, min_date, max_date = _summary(rows)
+        return apps, total_seconds, _to_date(min_date), _to_date(max_date)
+
+    def daily_totals(self, user_id, start_date, end_date):
+        rows = self._fetchall("""
+            SELECT activity_date, total_seconds
+            FROM activity_daily_totals
+            WHERE user_id = ? AND activity_date BETWEEN ? AND ?
+            ORDER BY activity_date
+        """, (user_id, start_date.isoformat(), end_date.isoformat()))
+        return [(_to_date(day), seconds) for day, seconds in rows]
+
+    def activity_date_range(self, user_id):
+        min_date, max_date = self._fetchall(
+            "SELECT MIN(activity_date), MAX(activity_date) FROM activity_daily_totals WHERE user_id = ?",
+            (user_id,))[0]
+        return _to_date(min_date), _to_date(max_date)
+
+    # --- расписание ---
+    def get_week_schedule(self, user_id):
+        rows = self._fetchall("""
+            SELECT sd.day_of_week, st.start_time, st.description
+            FROM schedule_days sd
+            JOIN schedule_tasks st ON sd.id_day = st.day_id
+            WHERE sd.user_id = ?
+            ORDER BY sd.day_of_week, st.start_time
+        """, (user_id,))
+        return [(day, _to_time(start_time), description) for day, start_time, description in rows]
+
+    def get_day_schedule(self, user_id, day_of_week):
+        rows = self._fetchall("""
+            SELECT st.start_time, st.description
+            FROM schedule_days sd
+            JOIN schedule_tasks st ON sd.id_day = st.day_id
+            WHERE sd.user_id = ? AND sd.day_of_week = ?
+            ORDER BY st.start_time
+        """, (user_id, day_of_week))
+        return [(_to_time(start_time), description) for start_time, description in rows]
+
+    @staticmethod
+    def _insert_day(cur, user_id, day_of_week, tasks):
+        cur.execute("INSERT INTO schedule_days (user_id, day_of_week) VALUES (?, ?)", (user_id, day_of_week))
+        day_id = cur.lastrowid
+        if tasks:
+            cur.executemany(
+                "INSERT INTO schedule_tasks (day_id, start_time, description) VALUES (?, ?, ?)",
+                [(day_id, _time_text(start_time), description) for start_time, description in tasks])
+
+    def replace_day_schedule(self, user_id, day_of_week, tasks):
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM schedule_days WHERE user_id = ? AND day_of_week = ?", (user_id, day_of_week))
+            self._insert_day(cur, user_id, day_of_week, tasks)
+
+    def replace_week_schedule(self, user_id, days):
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM schedule_days WHERE user_id = ?", (user_id,))
+            for day_of_week in sorted(days):
+                self._insert_day(cur, user_id, day_of_week, days[day_of_week])
+        return sum(len(tasks) for tasks in days.values())
+
+    def delete_day_schedule(self, user_id, day_of_week):
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM schedule_days WHERE user_id = ? AND day_of_week = ?", (user_id, day_of_week))
+
+    # --- AI-расписание ---
+    def get_ai_schedule(self, user_id, day_of_week):
+        rows = self._fetchall(
+            "SELECT data FROM ai_generated_schedules WHERE user_id = ? AND day_of_week = ?",
+            (user_id, day_of_week))
+        return json.loads(rows[0][0]) if rows else None
+
+    def ai_schedule_days(self, user_id):
+        rows = self._fetchall("SELECT day_of_week FROM ai_generated_schedules WHERE user_id = ?", (user_id,))
+        return {row[0] for row in rows}
+
+    def save_ai_schedules(self, user_id, schedules):
+        saved_days = []
+        with self._transaction() as cur:
+            for day_of_week, data in schedules.items():
+                if not data:
+                    continue
+                cur.execute("DELETE FROM ai_generated_schedules WHERE user_id = ? AND day_of_week = ?",
+                            (user_id, day_of_week))
+                cur.execute("INSERT INTO ai_generated_schedules (user_id, day_of_week, data) VALUES (?, ?, ?)",
+                            (user_id, day_of_week, json.dumps(data, ensure_ascii=False)))
+                saved_days.append(day_of_week)
+        return saved_days
+
+    def delete_ai_schedule(self, user_id, day_of_week):
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM ai_generated_schedules WHERE user_id = ? AND day_of_week = ?",
+                        (user_id, day_of_week))
+
+    def get_app_categories(self, user_id):
+        return self._fetchall("SELECT app_name, category FROM app_category_rules WHERE user_id = ?", (user_id,))
+
+    def set_app_category(self, user_id, app_name, category):
+        with self._transaction() as cur:
+            cur.execute("""
+                INSERT INTO app_category_rules (user_id, app_name, category) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, app_name) DO UPDATE SET category = excluded.category
+            """, (user_id, app_name, category))
+
+    def delete_app_category(self, user_id, app_name):
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM app_category_rules WHERE user_id = ? AND app_name = ?", (user_id, app_name))
+
+
+# ================= ВЫБОР БЭКЕНДА =================
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_storage(caller=None, backend=None):
+    """Хранилище процесса по настройке STORAGE_BACKEND.
+
+    caller — подсистема для учёта соединений пула PostgreSQL (см. db_pool);
+    файл SQLite у всех подсистем общий.
+    """
+    backend = backend or STORAGE_BACKEND
+    key = (backend, caller if backend == "postgres" else None)
+    with _backends_lock:
+        storage = _backends.get(key)
+        if storage is None:
+            if backend == "postgres":
+                import db_pool
+                storage = PostgresBackend(db_pool.get_pool(caller=caller or db_pool.DEFAULT_CALLER))
+            elif backend == "sqlite":
+                storage = SqliteBackend()
+            else:
+                raise ValueError(f"Неизвестный STORAGE_BACKEND: {backend} (postgres | sqlite)")
+            _backends[key] = storage
+        return storage
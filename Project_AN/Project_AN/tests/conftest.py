@@ -0,0 +1,7 @@
+# tests/conftest.py
+# Модули проекта импортируются по имени (import storage), как из main.py:
+# тесты запускаются из папки проекта  python -m pytest -q tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
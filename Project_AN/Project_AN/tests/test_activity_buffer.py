@@ -0,0 +1,83 @@
+# tests/test_activity_buffer.py
+import threading
+from datetime import date
+
+from activity_buffer import ActivityBuffer
+
+DAY = date(2026, 1, 15)
+
+
+def test_flush_returns_rows_and_empties_buffer():
+    buffer = ActivityBuffer()
+    buffer.add((1, "Telegram", DAY), 5)
+    buffer.add((1, "Telegram", DAY), 3)
+    buffer.add((2, "Word", DAY), 7)
+    written = []
+
+    assert buffer.flush(lambda rows, seq: written.extend(rows)) == 2
+    assert sorted(written) == [(1, "Telegram", DAY, 8), (2, "Word", DAY, 7)]
+    assert len(buffer) == 0
+    assert buffer.flush(lambda rows, seq: written.extend(rows)) == 0
+
+
+def test_failed_write_restores_snapshot_and_keeps_new_seconds():
+    buffer = ActivityBuffer()
+    buffer.add((1, "Telegram", DAY), 5)
+
+    def failing_write(rows, seq):
+        buffer.add((1, "Telegram", DAY), 2)  # замер во время записи
+        raise RuntimeError("БД недоступна")
+
+    try:
+        buffer.flush(failing_write)
+    except RuntimeError:
+        pass
+    assert buffer.total_seconds() == 7
+
+
+def test_no_loss_under_concurrent_add_and_flush():
+    buffer = ActivityBuffer()
+    writers, adds_per_writer = 8, 5000
+    stored = {}
+    stored_lock = threading.Lock()
+    attempts = [0]
+
+    def write(rows, seq):
+        attempts[0] += 1
+        if attempts[0] % 5 == 0:
+            raise RuntimeError("сбой записи")  # каждая пятая запись — с откатом в буфер
+        with stored_lock:
+            for user_id, app, day, seconds in rows:
+                stored[(user_id, app, day)] = stored.get((user_id, app, day), 0) + seconds
+
+    def writer(user_id):
+        for i in range(adds_per_writer):
+            buffer.add((user_id, f"app_{i % 7}", DAY), 1)
+
+    done = threading.Event()
+
+    def flusher():
+        while not done.is_set():
+            try:
+                buffer.flush(write)
+            except RuntimeError:
+                pass
+
+    flush_thread = threading.Thread(target=flusher)
+    flush_thread.start()
+    threads = [threading.Thread(target=writer, args=(user_id,)) for user_id in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    flush_thread.join()
+    while len(buffer):
+        try:
+            buffer.flush(write)
+        except RuntimeError:
+            pass
+
+    assert sum(stored.values()) == writers * adds_per_writer
+    for user_id in range(writers):
+        assert sum(s for (u, _, _), s in stored.items() if u == user_id) == adds_per_writer
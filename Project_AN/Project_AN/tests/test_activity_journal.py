@@ -0,0 +1,83 @@
+# tests/test_activity_journal.py
+from datetime import date
+
+import pytest
+
+import activity_journal
+import storage
+from activity_journal import ActivityJournal
+
+DAY = date(2026, 1, 15)
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = ActivityJournal("test", directory=str(tmp_path / "journal"), segment_max_bytes=256)
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return storage.SqliteBackend(str(tmp_path / "activity.sqlite3"))
+
+
+def totals(backend, user_id=1):
+    return dict(backend.activity_totals(user_id, DAY, DAY))
+
+
+def test_read_since_survives_reopen_and_rotation(tmp_path, journal):
+    for i in range(20):
+        journal.append([(1, f"app_{i % 3}", DAY, 10)])
+    journal.close()
+
+    reopened = ActivityJournal("test", directory=str(tmp_path / "journal"), segment_max_bytes=256)
+    try:
+        assert reopened.last_seq == 20
+        rows, max_seq = reopened.read_since(15)
+        assert max_seq == 20
+        assert [a for _, a, _, _ in rows] == [f"app_{i % 3}" for i in range(15, 20)]
+    finally:
+        reopened.close()
+
+
+def test_replay_writes_pending_rows_once(backend, journal):
+    journal.append([(1, "Telegram", DAY, 10)])
+    journal.append([(1, "Word", DAY, 20)])
+
+    assert activity_journal.replay(backend, journal, journal.last_seq) == 2
+    assert totals(backend) == {"Telegram": 10, "Word": 20}
+    assert backend.journal_checkpoint(journal.name) == 2
+
+    # Повтор после контрольной точки ничего не удваивает
+    assert activity_journal.replay(backend, journal, journal.last_seq) == 0
+    assert totals(backend) == {"Telegram": 10, "Word": 20}
+
+
+def test_replay_is_idempotent_when_journal_checkpoint_was_lost(backend, journal):
+    journal.append([(1, "Telegram", DAY, 10)])
+    seq = journal.append([(1, "Word", DAY, 20)])
+    # Запись в БД с контрольной точкой прошла, а журнал не успел компактироваться (сбой)
+    batches, _ = journal.read_batches_since(0)
+    backend.write_activity(batches, checkpoint=(journal.name, seq))
+
+    assert activity_journal.replay(backend, journal, journal.last_seq) == 0
+    assert totals(backend) == {"Telegram": 10, "Word": 20}
+
+
+def test_replay_stops_at_upto(backend, journal):
+    journal.append([(1, "Telegram", DAY, 10)])
+    upto = journal.last_seq
+    journal.append([(1, "Word", DAY, 20)])  # ещё в памяти, запишется обычным сбросом
+
+    activity_journal.replay(backend, journal, upto)
+    assert totals(backend) == {"Telegram": 10}
+    assert backend.journal_checkpoint(journal.name) == upto
+
+
+def test_batches_with_same_key_are_written_once(backend, journal):
+    journal.append([(1, "youtube.com", DAY, 30)], batch=(1, "batch-1"))
+    journal.append([(1, "youtube.com", DAY, 30)], batch=(1, "batch-1"))  # повтор от клиента
+
+    activity_journal.replay(backend, journal, journal.last_seq)
+    assert totals(backend) == {"youtube.com": 30}
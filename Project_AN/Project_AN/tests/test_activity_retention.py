@@ -0,0 +1,31 @@
+# tests/test_activity_retention.py
+from datetime import date, timedelta
+
+import activity_ingest
+import activity_partitions
+import storage
+
+
+def test_rollup_periods_are_dropped_only_when_wholly_expired():
+    cutoff = date(2024, 3, 14)  # четверг
+    assert activity_ingest.rollup_retention(cutoff) == [
+        ("activity_daily_totals", "activity_date", date(2024, 3, 14)),
+        ("activity_weekly", "week_start", date(2024, 3, 11)),
+        ("activity_monthly", "month_start", date(2024, 3, 1)),
+    ]
+
+
+def test_sqlite_maintenance_applies_the_shared_cutoffs(tmp_path):
+    backend = storage.SqliteBackend(str(tmp_path / "activity.db"))
+    user_id = backend.create_user("a@example.com", "hash")
+    cutoff = activity_partitions.retention_cutoff(retention_days=activity_partitions.RETENTION_DAYS)
+    days = [cutoff - timedelta(days=40), cutoff - timedelta(days=1), cutoff]
+    backend.write_activity([(None, [(user_id, "code", day, 60) for day in days])])
+
+    result = backend.maintain_activity()
+
+    assert result["deleted_rows"] == 2
+    conn = backend._conn()
+    for table, column, keep_from in activity_ingest.rollup_retention(cutoff):
+        kept = [date.fromisoformat(value) for (value,) in conn.execute(f"SELECT {column} FROM {table}")]
+        assert kept and min(kept) >= keep_from
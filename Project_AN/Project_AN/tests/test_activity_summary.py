@@ -0,0 +1,122 @@
+# tests/test_activity_summary.py
+from datetime import date, timedelta
+
+import pytest
+
+import activity_summary
+import storage
+
+TODAY = date.today()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def listeners(monkeypatch):
+    monkeypatch.setattr(storage, "_activity_listeners", [])
+
+
+@pytest.fixture
+def backend(tmp_path, listeners):
+    return storage.SqliteBackend(str(tmp_path / "activity.sqlite3"))
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def service(backend, clock):
+    service = activity_summary.SummaryService(backend, ttl=30, clock=clock)
+    storage.add_activity_listener(service.invalidate)
+    return service
+
+
+def write(backend, *rows):
+    backend.write_activity([(None, list(rows))])
+
+
+def test_summary_matches_totals_and_date_range(backend):
+    write(backend, (1, "Word", TODAY, 10), (1, "Steam", TODAY - timedelta(days=3), 50),
+          (1, "Word", TODAY - timedelta(days=20), 5), (2, "Telegram", TODAY, 7))
+    for days in (0, 6, 29):
+        start = TODAY - timedelta(days=days)
+        apps, total, min_date, max_date = backend.activity_summary(1, start, TODAY)
+        assert apps == backend.activity_totals(1, start, TODAY)
+        assert total == sum(seconds for _, seconds in apps)
+        assert (min_date, max_date) == backend.activity_date_range(1)
+
+
+def test_summary_without_data(backend):
+    assert backend.activity_summary(1, TODAY, TODAY) == ([], 0, None, None)
+
+
+def test_period_switches_are_served_from_memory(backend, service):
+    write(backend, (1, "Word", TODAY, 10), (1, "Steam", TODAY - timedelta(days=3), 50))
+    for period in ("today", "week", "month", "today", "week", "month"):
+        service.get(1, period)
+    assert (service.hits, service.misses) == (3, 3)
+
+    week = service.get(1, "week")
+    assert week.apps == [("Steam", 50), ("Word", 10)]
+    assert week.total_seconds == 60
+    assert (week.start_date, week.end_date) == (TODAY - timedelta(days=6), TODAY)
+    assert week.period_text == activity_summary.PERIODS["week"][1]
+
+
+def test_ingest_invalidates_only_that_user(backend, service):
+    write(backend, (1, "Word", TODAY, 10), (2, "Word", TODAY, 10))
+    service.get(1, "today")
+    service.get(2, "today")
+
+    write(backend, (1, "Steam", TODAY, 100))
+    assert service.get(1, "today").apps == [("Steam", 100), ("Word", 10)]
+    misses = service.misses
+    service.get(2, "today")
+    assert service.misses == misses
+
+
+def test_entries_expire_after_ttl(backend, service, clock):
+    service.get(1, "today")
+    clock.now += 29
+    service.get(1, "today")
+    assert service.misses == 1
+    clock.now += 2
+    service.get(1, "today")
+    assert service.misses == 2
+
+
+def test_refresh_bypasses_cache(service):
+    service.get(1, "month")
+    service.get(1, "month", refresh=True)
+    assert (service.hits, service.misses) == (0, 2)
+
+
+def test_result_read_during_ingest_is_not_cached(backend, clock):
+    write(backend, (1, "Word", TODAY, 10))
+    service = activity_summary.SummaryService(backend, ttl=30, clock=clock)
+
+    class RacingStorage:
+        """Запись активности завершается, пока сводка ещё читается"""
+
+        def activity_summary(self, *args):
+            result = backend.activity_summary(*args)
+            service.invalidate({1})
+            return result
+
+    service.storage = RacingStorage()
+    assert service.get(1, "today").total_seconds == 10
+    service.storage = backend
+    write(backend, (1, "Word", TODAY, 5))
+    assert service.get(1, "today").total_seconds == 15
+
+
+def test_unknown_period_falls_back_to_default(service):
+    assert service.get(1, "year").period_text == activity_summary.PERIODS[activity_summary.DEFAULT_PERIOD][1]
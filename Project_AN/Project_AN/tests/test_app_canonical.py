@@ -0,0 +1,60 @@
+# tests/test_app_canonical.py
+import pytest
+
+import app_canonical
+from window_probe import WindowInfo
+
+
+@pytest.fixture
+def canonicalizer():
+    return app_canonical.Canonicalizer()
+
+
+@pytest.mark.parametrize("process, title, expected", [
+    ("code", "main.py - Anti-Procrastinator - Visual Studio Code", "Visual Studio Code"),
+    ("WINWORD.EXE", "отчёт_3.docx - Word", "Microsoft Word"),
+    ("javaw", "Minecraft 1.20.4 - Multiplayer (3rd-party Server)", "Minecraft"),
+    ("applicationframehost", "фото_1.jpg - Фотографии", "Фотографии"),
+    ("someeditor", "notes [site] - Some Editor", "Someeditor"),
+    ("", "utils.py - bot - Visual Studio Code", "Visual Studio Code"),
+    ("", "Telegram (12)", "Telegram"),
+    ("", "(3) Входящие - Почта", "Почта"),
+])
+def test_window_titles_collapse_to_app(canonicalizer, process, title, expected):
+    info = WindowInfo(app_canonical.window_probe.normalize_process_name(process), title, None)
+    assert canonicalizer.from_window(info) == (expected, False)
+
+
+def test_browser_and_missing_window(canonicalizer):
+    assert canonicalizer.from_window(WindowInfo("firefox", "YouTube — Mozilla Firefox", 1)) == ("Browser", True)
+    assert canonicalizer.from_window(None) == (None, False)
+
+
+@pytest.mark.parametrize("site, expected", [
+    ("youtube.com", "youtube.com"),
+    ("WWW.YouTube.com", "youtube.com"),
+    ("https://m.vk.com/feed", "vk.com"),
+    ("youtu.be", "youtube.com"),
+    ("habr.com.", "habr.com"),
+    ("localhost:8080", "localhost"),
+    ("m.ru", "m.ru"),
+])
+def test_domains(canonicalizer, site, expected):
+    assert canonicalizer.domain(site) == expected
+
+
+def test_user_rules_take_priority():
+    canonicalizer = app_canonical.Canonicalizer({
+        "processes": {"winword": "Word"},
+        "rules": [{"process": ["code"], "title": r"^(\w+)\.ipynb", "app": r"Jupyter \1"}],
+        "domain_aliases": {"vk.ru": "vk.ru"},
+    })
+    assert canonicalizer.app_name("winword", "a.docx - Word") == "Word"
+    assert canonicalizer.app_name("code", "lab.ipynb - Visual Studio Code") == "Jupyter lab"
+    assert canonicalizer.app_name("code", "lab.py - Visual Studio Code") == "Visual Studio Code"
+    assert canonicalizer.domain("www.vk.ru") == "vk.ru"
+
+
+def test_broken_user_rule_is_skipped():
+    canonicalizer = app_canonical.Canonicalizer({"rules": [{"title": "("}, {"app": "x"}]})
+    assert canonicalizer.app_name("code", "a.py - Visual Studio Code") == "Visual Studio Code"
@@ -0,0 +1,111 @@
+# tests/test_app_categories.py
+import random
+
+import pytest
+
+import app_categories
+from app_categories import DEFAULT_RULES, OTHER, CategoryMatcher
+
+
+def brute_force(rules, app_name):
+    """Эталон: первое по порядку правило, чьё слово есть в имени"""
+    name = app_name.lower()
+    for keyword, category in rules:
+        if keyword in name:
+            return category
+    return OTHER
+
+
+@pytest.mark.parametrize("app_name, expected", [
+    ("Steam", "gaming"),
+    ("Telegram", "social"),
+    ("YouTube — Mozilla Firefox", "browser"),
+    ("Microsoft Edge", "browser"),
+    ("Yandex", "browser"),
+    ("TikTok", "social"),
+    ("Microsoft Word", "productivity"),
+    ("Google Chrome", "browser"),
+    ("Калькулятор", OTHER),
+    ("", OTHER),
+    (None, OTHER),
+])
+def test_default_categories(app_name, expected):
+    assert app_categories.DEFAULT_MATCHER.category(app_name) == expected
+
+
+def test_category_priority_follows_rule_order():
+    # «discord» (social) и «game» (gaming) в одном имени: gaming раньше в CATEGORIES
+    assert app_categories.DEFAULT_MATCHER.category("Discord Game Overlay") == "gaming"
+    # Браузер важнее всего, как в прежней детализации
+    assert app_categories.DEFAULT_MATCHER.category("Steam Community — Google Chrome") == "browser"
+    assert app_categories.DEFAULT_MATCHER.category("Telegram Web — Opera") == "browser"
+
+
+def test_matches_brute_force_on_random_names():
+    rng = random.Random(3)
+    keywords = [keyword for keyword, _ in DEFAULT_RULES]
+    fillers = ["", " ", "-", "x", "pro", "ms", "ord", "zo"]
+    matcher = CategoryMatcher(DEFAULT_RULES, cache_size=0)
+    for _ in range(3000):
+        parts = [rng.choice(keywords + fillers) for _ in range(rng.randint(1, 4))]
+        name = "".join(part.upper() if rng.random() < 0.3 else part for part in parts)
+        assert matcher.category(name) == brute_force(DEFAULT_RULES, name), name
+
+
+def test_prefix_keyword_with_better_rank_wins():
+    # Длинное слово совпадает первым, но его префикс стоит раньше в правилах
+    rules = [("team", "social"), ("teams", "productivity")]
+    assert CategoryMatcher(rules).category("Microsoft Teams") == "social"
+
+
+def test_exact_user_names_do_not_leak_to_similar_apps():
+    matcher = CategoryMatcher(DEFAULT_RULES, names={"word": "gaming"})
+    assert matcher.category("Word") == "gaming"
+    assert matcher.category("WORD") == "gaming"
+    assert matcher.category("Microsoft Word") == "productivity"
+    assert matcher.categorize(["Word", "WordPad"]) == {"Word": "gaming", "WordPad": "productivity"}
+
+
+class FakeRulesStorage:
+    def __init__(self):
+        self.names = {}
+        self.reads = 0
+
+    def get_app_categories(self, user_id):
+        self.reads += 1
+        return list(self.names.get(user_id, {}).items())
+
+    def set_app_category(self, user_id, app_name, category):
+        self.names.setdefault(user_id, {})[app_name] = category
+
+    def delete_app_category(self, user_id, app_name):
+        self.names.get(user_id, {}).pop(app_name, None)
+
+
+@pytest.fixture
+def rules_storage(monkeypatch):
+    fake = FakeRulesStorage()
+    monkeypatch.setattr(app_categories, "_storage", fake)
+    monkeypatch.setattr(app_categories, "_user_matchers", {})
+    return fake
+
+
+def test_user_category_is_per_user_and_reloaded_after_change(rules_storage):
+    assert app_categories.category_of("Notepad++", 1) == OTHER
+    app_categories.set_user_category(1, " Notepad++ ", "productivity")
+
+    assert app_categories.category_of("notepad++", 1) == "productivity"
+    assert app_categories.category_of("Notepad++", 2) == OTHER
+    reads = rules_storage.reads
+    app_categories.categorize(["Notepad++"], 1)
+    assert rules_storage.reads == reads  # правила пользователя в памяти
+
+    app_categories.reset_user_category(1, "Notepad++")
+    assert app_categories.category_of("Notepad++", 1) == OTHER
+
+
+def test_invalid_user_category_is_rejected(rules_storage):
+    with pytest.raises(ValueError):
+        app_categories.set_user_category(1, "Word", "sleep")
+    with pytest.raises(ValueError):
+        app_categories.set_user_category(1, "  ", "gaming")
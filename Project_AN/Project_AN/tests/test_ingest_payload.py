@@ -0,0 +1,107 @@
+# tests/test_ingest_payload.py
+import gzip
+import json
+import time
+import zlib
+from datetime import date, timedelta
+
+import pytest
+
+import ingest_payload
+from ingest_payload import PayloadError, decode_payload, payload_rows
+
+TODAY = date.today()
+
+
+def test_decode_json_plain_gzip_and_deflate():
+    data = {"site_times": {"youtube.com": 60}}
+    body = json.dumps(data).encode("utf-8")
+    assert decode_payload(body, "application/json; charset=utf-8") == data
+    assert decode_payload(gzip.compress(body), "application/json", "gzip") == data
+    assert decode_payload(zlib.compress(body), "application/json", "deflate") == data
+
+
+def test_body_over_limit_is_413():
+    body = b" " * (ingest_payload.MAX_BODY_BYTES + 1)
+    with pytest.raises(PayloadError) as error:
+        decode_payload(body, "application/json")
+    assert error.value.status == 413
+
+
+def test_gzip_bomb_is_413():
+    # Сжатое тело крошечное, распакованное — больше лимита
+    body = gzip.compress(b"0" * (ingest_payload.MAX_BODY_BYTES * 4))
+    assert len(body) < ingest_payload.MAX_BODY_BYTES
+    with pytest.raises(PayloadError) as error:
+        decode_payload(body, "application/json", "gzip")
+    assert error.value.status == 413
+
+
+@pytest.mark.parametrize("content_type, encoding, code", [
+    ("text/plain", None, "UNSUPPORTED_MEDIA_TYPE"),
+    ("application/json", "br", "UNSUPPORTED_ENCODING"),
+])
+def test_unsupported_type_or_encoding_is_415(content_type, encoding, code):
+    with pytest.raises(PayloadError) as error:
+        decode_payload(b"{}", content_type, encoding)
+    assert error.value.status == 415
+    assert error.value.code == code
+
+
+def test_broken_json_is_400():
+    with pytest.raises(PayloadError) as error:
+        decode_payload(b"{not json", "application/json")
+    assert error.value.status == 400
+
+
+def test_site_times_are_canonicalized_and_summed():
+    rows = payload_rows({"site_times": {"www.youtube.com": 30, "youtube.com": 20, "vk.com": 0}}, 7, today=TODAY)
+    assert rows == [(7, "youtube.com", TODAY, 50)]
+
+
+def test_entries_use_bucket_date():
+    now = time.time()
+    rows = payload_rows({"entries": [
+        {"bucket_start": now - 2 * 86400, "site_times": {"github.com": 10}},
+        {"bucket_start": now, "site_times": {"github.com": 5}},
+    ]}, 1)
+    assert sorted(rows) == sorted([
+        (1, "github.com", date.fromtimestamp(now - 2 * 86400), 10),
+        (1, "github.com", date.fromtimestamp(now), 5),
+    ])
+
+
+def test_entries_older_than_30_days_are_rejected():
+    too_old = time.time() - (ingest_payload.MAX_BUCKET_AGE_DAYS + 1) * 86400
+    with pytest.raises(PayloadError):
+        payload_rows({"entries": [{"bucket_start": too_old, "site_times": {"github.com": 10}}]}, 1)
+
+    oldest = time.time() - (ingest_payload.MAX_BUCKET_AGE_DAYS * 86400 - 60)
+    rows = payload_rows({"entries": [{"bucket_start": oldest, "site_times": {"github.com": 10}}]}, 1)
+    assert rows[0][2] >= TODAY - timedelta(days=ingest_payload.MAX_BUCKET_AGE_DAYS)
+
+
+def test_too_many_entries_is_413():
+    entries = [{"bucket_start": time.time(), "site_times": {}}] * (ingest_payload.MAX_BATCH_ENTRIES + 1)
+    with pytest.raises(PayloadError) as error:
+        payload_rows({"entries": entries}, 1)
+    assert error.value.status == 413
+
+
+def test_more_than_a_day_per_site_is_rejected():
+    now = time.time()
+    entries = [{"bucket_start": now, "site_times": {"github.com": 50000}}] * 2
+    with pytest.raises(PayloadError):
+        payload_rows({"entries": entries}, 1)
+
+
+@pytest.mark.parametrize("site_times", [
+    {"github.com": -1},
+    {"github.com": True},
+    {"github.com": "10"},
+    {" ": 10},
+    ["github.com", 10],
+])
+def test_invalid_site_times_are_rejected(site_times):
+    with pytest.raises(PayloadError):
+        payload_rows({"site_times": site_times}, 1)
@@ -0,0 +1,54 @@
+# tests/test_ingest_queue.py
+import time
+from datetime import date
+
+import ingest_queue
+from ingest_queue import IngestQueue
+
+TODAY = date.today()
+
+
+class FailingStorage:
+    def __init__(self):
+        self.fail = True
+        self.written = []
+
+    def write_activity(self, batches, checkpoint=None, prune_days=None):
+        if self.fail:
+            raise ConnectionError("БД недоступна")
+        self.written.extend(batches)
+        return sum(len(rows) for _, rows in batches), 0
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_queue_fills_while_flush_fails(monkeypatch):
+    monkeypatch.setattr(ingest_queue, "RETRY_DELAY", 0.02)
+    storage = FailingStorage()
+    ingest = IngestQueue(storage, maxsize=2, flush_interval=0.01)
+    ingest.start()
+    try:
+        assert ingest.submit([(1, "code", TODAY, 60)])
+        wait_for(lambda: ingest.stats()["flush_failures"])
+
+        # Писатель не разбирает очередь, пока запись не прошла: третий пакет — отказ
+        assert ingest.submit([(1, "code", TODAY, 30)])
+        assert ingest.submit([(1, "chrome", TODAY, 30)])
+        time.sleep(0.1)
+        assert not ingest.submit([(1, "chrome", TODAY, 30)])
+        assert ingest.stats()["queue_depth"] == 2
+
+        storage.fail = False
+        wait_for(lambda: ingest.stats()["queue_depth"] == 0 and not ingest.stats()["pending_keys"])
+    finally:
+        ingest.stop()
+    totals = {}
+    for _, rows in storage.written:
+        for user_id, app_name, activity_date, seconds in rows:
+            totals[app_name] = totals.get(app_name, 0) + seconds
+    assert totals == {"code": 90, "chrome": 30}
@@ -0,0 +1,25 @@
+# tests/test_query_stats.py
+import pytest
+
+from query_stats import _is_explainable, query_shape
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT app_name, SUM(seconds) FROM activity_monitoring WHERE user_id = %s GROUP BY app_name",
+    "WITH t AS (SELECT 1 AS x FROM users) SELECT x FROM t",
+])
+def test_plain_reads_get_a_plan(sql):
+    assert _is_explainable(query_shape(sql))
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT pg_advisory_lock(%s)",
+    "SELECT pg_try_advisory_xact_lock(%s) FROM users",
+    "SELECT nextval('activity_id_seq')",
+    "SELECT 1",
+    "SELECT * FROM users WHERE id = %s FOR UPDATE",
+    "UPDATE users SET name = %s WHERE id = %s",
+    "WITH d AS (DELETE FROM tokens RETURNING id) SELECT id FROM d",
+])
+def test_side_effects_and_writes_are_skipped(sql):
+    assert not _is_explainable(query_shape(sql))
@@ -0,0 +1,16 @@
+# tests/test_window_probe.py
+import pytest
+
+from window_probe import parse_xprop_string
+
+
+@pytest.mark.parametrize("value, expected", [
+    (r'"a \"b\" \\ c - Редактор"', 'a "b" \\ c - Редактор'),
+    (r'"x\ny"', "x\ny"),
+    (r'"caf\303\251"', "café"),
+    ('"first", "second"', "first"),
+    ('""', ""),
+    (" not quoted ", " not quoted "),
+])
+def test_parse_xprop_string(value, expected):
+    assert parse_xprop_string(value) == expected
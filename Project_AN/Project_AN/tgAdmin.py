@@ -1,6 +1,5 @@
 # telegram_backup_bot.py
 import telebot
-import psycopg2
 import psycopg2.extras
 from telebot import types
 import bcrypt
@@ -9,27 +8,17 @@ from datetime import datetime
 import threading
 import logging
 import time
+import db_pool
+import query_stats
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # ================= КОНФИГУРАЦИЯ БАЗ ДАННЫХ =================
-DB_CONFIG = {
-    "host": "localhost",
-    "dbname": "Your_db_name",
-    "user": "postgres",
-    "password": "Your_password",
-    "port": 5432
-}
-
-BACKUP_DB_CONFIG = {
-    "host": "localhost",
-    "dbname": "postgres_backup",  # Или другое имя для резервной БД
-    "user": "postgres",
-    "password": "Your_password",
-    "port": 5432
-}
+# Параметры подключения — в db_pool (DB_CONFIG и BACKUP_DB_CONFIG)
+DB_CONFIG = db_pool.DB_CONFIG
+BACKUP_DB_CONFIG = db_pool.BACKUP_DB_CONFIG
 
 
 class TelegramBackupBot:
@@ -41,9 +30,9 @@ class TelegramBackupBot:
         self.authorized_users = {}
         self.admin_tg_ids = set()  # Сюда будем сохранять Telegram ID админов
 
-        # Подключения к БД
-        self.conn = None
-        self.backup_conn = None
+        # Пулы соединений с основной и резервной БД
+        self.pool = None
+        self.backup_pool = None
         self.connect_databases()
 
         # Загружаем Telegram ID админов при запуске
@@ -56,50 +45,44 @@ class TelegramBackupBot:
         self.running = True
 
     def connect_databases(self):
-        """Подключение к базам данных"""
-        try:
-            self.conn = psycopg2.connect(**self.db_config)
-            self.conn.autocommit = False
+        """Получение общих пулов соединений и проверка доступности баз"""
+        self.pool = db_pool.get_pool(self.db_config, caller="admin_bot")
+        if self.pool.ping():
             logger.info("✅ Подключение к основной БД успешно")
             logger.info(f"📊 Основная БД: {self.db_config['dbname']}@{self.db_config['host']}:{self.db_config['port']}")
-        except Exception as e:
-            logger.error(f"❌ Ошибка подключения к основной БД: {e}")
-            self.conn = None
+        else:
+            logger.error("❌ Ошибка подключения к основной БД")
 
-        try:
-            self.backup_conn = psycopg2.connect(**self.backup_db_config)
-            self.backup_conn.autocommit = False
+        self.backup_pool = db_pool.get_pool(self.backup_db_config, caller="admin_bot")
+        if self.backup_pool.ping():
             logger.info("✅ Подключение к резервной БД успешно")
             logger.info(
                 f"📊 Резервная БД: {self.backup_db_config['dbname']}@{self.backup_db_config['host']}:{self.backup_db_config['port']}")
-        except Exception as e:
-            logger.error(f"❌ Ошибка подключения к резервной БД: {e}")
-            self.backup_conn = None
+        else:
+            logger.error("❌ Ошибка подключения к резервной БД")
 
     def load_admin_tg_ids(self):
         """Загружаем Telegram ID админов из основной БД"""
-        if not self.conn:
-            return
-
         try:
-            cursor = self.conn.cursor()
-
-            # Проверяем, есть ли таблица admins и поле telegram_id
-            cursor.execute("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = 'admins' AND column_name = 'telegram_id'
-            """)
-
-            if cursor.fetchone():
-                cursor.execute("SELECT telegram_id FROM admins WHERE telegram_id IS NOT NULL")
-                tg_ids = cursor.fetchall()
-                self.admin_tg_ids = {str(tg_id[0]) for tg_id in tg_ids if tg_id[0]}
-                logger.info(f"✅ Загружено {len(self.admin_tg_ids)} Telegram ID админов")
-            else:
-                logger.warning("⚠ В таблице admins нет поля telegram_id")
-
-            cursor.close()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                # Проверяем, есть ли таблица admins и поле telegram_id
+                cursor.execute("""
+                    SELECT column_name 
+                    FROM information_schema.columns 
+                    WHERE table_name = 'admins' AND column_name = 'telegram_id'
+                """)
+
+                if cursor.fetchone():
+                    cursor.execute("SELECT telegram_id FROM admins WHERE telegram_id IS NOT NULL")
+                    tg_ids = cursor.fetchall()
+                    self.admin_tg_ids = {str(tg_id[0]) for tg_id in tg_ids if tg_id[0]}
+                    logger.info(f"✅ Загружено {len(self.admin_tg_ids)} Telegram ID админов")
+                else:
+                    logger.warning("⚠ В таблице admins нет поля telegram_id")
+
+                cursor.close()
         except Exception as e:
             logger.error(f"❌ Ошибка при загрузке Telegram ID админов: {e}")
 
@@ -110,14 +93,12 @@ class TelegramBackupBot:
             return True
 
         # Дополнительная проверка в базе
-        if not self.conn:
-            return False
-
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM admins WHERE telegram_id = %s", (tg_id,))
-            result = cursor.fetchone()
-            cursor.close()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*) FROM admins WHERE telegram_id = %s", (tg_id,))
+                result = cursor.fetchone()
+                cursor.close()
             return result[0] > 0 if result else False
         except:
             return False
@@ -145,8 +126,8 @@ class TelegramBackupBot:
                 f"👑 Добро пожаловать, администратор!\n\n"
                 f"Вы можете восстановить данные из резервной копии.\n\n"
                 f"📊 Статус подключений:\n"
-                f"• Основная БД: {'✅' if self.conn else '❌'}\n"
-                f"• Резервная БД: {'✅' if self.backup_conn else '❌'}",
+                f"• Основная БД: {'✅' if self.pool.ping() else '❌'}\n"
+                f"• Резервная БД: {'✅' if self.backup_pool.ping() else '❌'}",
                 reply_markup=self.login_keyboard()
             )
         else:
@@ -156,8 +137,8 @@ class TelegramBackupBot:
                 "Этот бот предназначен только для администраторов.\n"
                 "Для получения доступа свяжитесь с администратором системы.\n\n"
                 "📊 Статус подключений:\n"
-                f"• Основная БД: {'✅' if self.conn else '❌'}\n"
-                f"• Резервная БД: {'✅' if self.backup_conn else '❌'}"
+                f"• Основная БД: {'✅' if self.pool.ping() else '❌'}\n"
+                f"• Резервная БД: {'✅' if self.backup_pool.ping() else '❌'}"
             )
             self.bot.send_message(
                 message.chat.id,
@@ -205,10 +186,6 @@ class TelegramBackupBot:
         self.bot.register_next_step_handler(message, self.get_password, user_data)
 
     def get_password(self, message, user_data):
-        if not self.backup_conn:
-            self.bot.send_message(message.chat.id, "❌ Ошибка подключения к базе данных.")
-            return
-
         password = message.text.strip()
         if len(password) < 4:
             self.bot.send_message(message.chat.id, "Пароль слишком короткий. Введите заново:")
@@ -216,13 +193,14 @@ class TelegramBackupBot:
             return
 
         try:
-            cur = self.backup_conn.cursor()
-            cur.execute("""
-                SELECT password FROM admins 
-                WHERE first_name=%s AND last_name=%s AND email=%s AND birth_date=%s 
-            """, (user_data["first_name"], user_data["last_name"], user_data["email"], user_data["birth_date"]))
-            result = cur.fetchone()
-            cur.close()
+            with self.backup_pool.connection() as backup_conn:
+                cur = backup_conn.cursor()
+                cur.execute("""
+                    SELECT password FROM admins 
+                    WHERE first_name=%s AND last_name=%s AND email=%s AND birth_date=%s 
+                """, (user_data["first_name"], user_data["last_name"], user_data["email"], user_data["birth_date"]))
+                result = cur.fetchone()
+                cur.close()
 
             if result and bcrypt.checkpw(password.encode(), result[0].encode()):
                 self.authorized_users[message.chat.id] = True
@@ -242,34 +220,33 @@ class TelegramBackupBot:
 
     def save_admin_tg_id(self, tg_id, user_data):
         """Сохраняет Telegram ID админа в основную БД"""
-        if not self.conn:
-            return
-
         try:
-            cursor = self.conn.cursor()
-
-            # Проверяем, есть ли поле telegram_id в таблице admins
-            cursor.execute("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = 'admins' AND column_name = 'telegram_id'
-            """)
-
-            if not cursor.fetchone():
-                # Добавляем поле если его нет
-                cursor.execute("ALTER TABLE admins ADD COLUMN telegram_id BIGINT")
-                self.conn.commit()
-                logger.info("✅ Добавлено поле telegram_id в таблицу admins")
-
-            # Обновляем Telegram ID для админа
-            cursor.execute("""
-                UPDATE admins 
-                SET telegram_id = %s 
-                WHERE first_name = %s AND last_name = %s AND email = %s AND birth_date = %s
-            """, (tg_id, user_data["first_name"], user_data["last_name"], user_data["email"], user_data["birth_date"]))
-
-            self.conn.commit()
-            cursor.close()
+            # При ошибке pool.connection() сам откатит транзакцию
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                # Проверяем, есть ли поле telegram_id в таблице admins
+                cursor.execute("""
+                    SELECT column_name 
+                    FROM information_schema.columns 
+                    WHERE table_name = 'admins' AND column_name = 'telegram_id'
+                """)
+
+                if not cursor.fetchone():
+                    # Добавляем поле если его нет
+                    cursor.execute("ALTER TABLE admins ADD COLUMN telegram_id BIGINT")
+                    conn.commit()
+                    logger.info("✅ Добавлено поле telegram_id в таблицу admins")
+
+                # Обновляем Telegram ID для админа
+                cursor.execute("""
+                    UPDATE admins 
+                    SET telegram_id = %s 
+                    WHERE first_name = %s AND last_name = %s AND email = %s AND birth_date = %s
+                """, (tg_id, user_data["first_name"], user_data["last_name"], user_data["email"], user_data["birth_date"]))
+
+                conn.commit()
+                cursor.close()
 
             # Обновляем кэш
             self.admin_tg_ids.add(str(tg_id))
@@ -277,8 +254,6 @@ class TelegramBackupBot:
 
         except Exception as e:
             logger.error(f"❌ Ошибка при сохранении Telegram ID: {e}")
-            if self.conn:
-                self.conn.rollback()
 
     # ================= УЛУЧШЕННАЯ ФУНКЦИЯ ВОССТАНОВЛЕНИЯ =================
     def restore_from_backup(self, chat_id):
@@ -286,15 +261,25 @@ class TelegramBackupBot:
             self.bot.send_message(chat_id, "❌ Пожалуйста, войдите в аккаунт перед восстановлением данных.")
             return
 
-        if not self.backup_conn or not self.conn:
+        try:
+            conn = self.pool.getconn()
+        except Exception as e:
+            logger.error(f"❌ Нет соединения с основной БД: {e}")
+            self.bot.send_message(chat_id, "❌ Ошибка подключения к базам данных.")
+            return
+        try:
+            backup_conn = self.backup_pool.getconn()
+        except Exception as e:
+            self.pool.putconn(conn)
+            logger.error(f"❌ Нет соединения с резервной БД: {e}")
             self.bot.send_message(chat_id, "❌ Ошибка подключения к базам данных.")
             return
 
         try:
             self.bot.send_message(chat_id, "🔄 Начинаю восстановление данных...")
 
-            cur_backup = self.backup_conn.cursor()
-            cur_main = self.conn.cursor()
+            cur_backup = backup_conn.cursor()
+            cur_main = conn.cursor()
 
             # Получаем ВСЕ таблицы из резервной БД
             cur_backup.execute("""
@@ -393,10 +378,10 @@ class TelegramBackupBot:
 
                         try:
                             cur_main.execute(create_query)
-                            self.conn.commit()
+                            conn.commit()
                             logger.info(f"✅ Создана таблица {table}")
                         except Exception as create_error:
-                            self.conn.rollback()
+                            conn.rollback()
                             logger.error(f"❌ Ошибка создания таблицы {table}: {create_error}")
                             # Пробуем создать без ограничений
                             simple_columns = []
@@ -410,7 +395,7 @@ class TelegramBackupBot:
                             simple_query = f"CREATE TABLE {table} ({', '.join(simple_columns)});"
                             try:
                                 cur_main.execute(simple_query)
-                                self.conn.commit()
+                                conn.commit()
                                 logger.info(f"✅ Создана упрощённая таблица {table}")
                             except:
                                 errors.append(f"Не удалось создать таблицу {table}")
@@ -449,11 +434,11 @@ class TelegramBackupBot:
                             try:
                                 # Используем execute_batch для эффективной вставки
                                 psycopg2.extras.execute_batch(cur_main, insert_query, rows)
-                                self.conn.commit()
+                                conn.commit()
                                 restored_tables.append((table, row_count))
                                 logger.info(f"✅ Восстановлена таблица {table} ({row_count} записей)")
                             except Exception as insert_error:
-                                self.conn.rollback()
+                                conn.rollback()
                                 logger.error(f"❌ Ошибка вставки в таблицу {table}: {insert_error}")
                                 errors.append(f"Ошибка вставки в {table}: {str(insert_error)[:100]}")
                         else:
@@ -469,7 +454,7 @@ class TelegramBackupBot:
                             if seq and seq[0]:
                                 cur_main.execute(
                                     f"SELECT setval('{seq[0]}', (SELECT COALESCE(MAX(id), 1) FROM {table}))")
-                                self.conn.commit()
+                                conn.commit()
                         except:
                             pass  # Игнорируем ошибки последовательностей
 
@@ -477,8 +462,7 @@ class TelegramBackupBot:
                     error_msg = f"❌ Ошибка при восстановлении таблицы {table}: {e}"
                     logger.error(error_msg)
                     errors.append(error_msg)
-                    if self.conn:
-                        self.conn.rollback()
+                    conn.rollback()
 
             cur_backup.close()
             cur_main.close()
@@ -525,6 +509,9 @@ class TelegramBackupBot:
         except Exception as e:
             logger.error(f"❌ Критическая ошибка восстановления: {e}")
             self.bot.send_message(chat_id, f"⚠ Критическая ошибка восстановления: {e}")
+        finally:
+            self.pool.putconn(conn)
+            self.backup_pool.putconn(backup_conn)
 
     # ================= ОБРАБОТЧИК КНОПОК =================
     def handle_buttons(self, message):
@@ -553,6 +540,20 @@ class TelegramBackupBot:
         elif message.text == "Восстановить данные":
             self.restore_from_backup(message.chat.id)
 
+        elif message.text == "Статистика запросов":
+            self.send_query_stats(message.chat.id)
+
+    # ================= СТАТИСТИКА SQL =================
+    def send_query_stats(self, chat_id):
+        """Отчёт query_stats: самые затратные запросы процесса и медленные"""
+        if not self.authorized_users.get(chat_id):
+            self.bot.send_message(chat_id, "❌ Пожалуйста, войдите в аккаунт, чтобы посмотреть статистику.")
+            return
+        text = query_stats.report(top=10)
+        # Ограничение Telegram — 4096 символов на сообщение
+        for start in range(0, len(text), 4000):
+            self.bot.send_message(chat_id, text[start:start + 4000])
+
     # ================= КНОПКИ =================
     def start_keyboard(self):
         keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
@@ -562,6 +563,7 @@ class TelegramBackupBot:
     def login_keyboard(self):
         keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
         keyboard.add(types.KeyboardButton("Восстановить данные"))
+        keyboard.add(types.KeyboardButton("Статистика запросов"))
         keyboard.add(types.KeyboardButton("Выход"))
         return keyboard
 
@@ -599,17 +601,8 @@ class TelegramBackupBot:
         logger.info("🛑 Останавливаю backup бота...")
         self.running = False
 
-        # Закрываем соединения с БД
-        if self.conn:
-            try:
-                self.conn.close()
-            except:
-                pass
-        if self.backup_conn:
-            try:
-                self.backup_conn.close()
-            except:
-                pass
+        # Соединения принадлежат общим пулам — их закрывает db_pool.close_all()
+        # при остановке приложения
 
         logger.info("✅ Backup бот остановлен")
 
@@ -620,7 +613,7 @@ class TelegramBackupBot:
             "poll_thread_alive": self.poll_thread.is_alive() if hasattr(self, 'poll_thread') else False,
             "authorized_users": len([uid for uid, auth in self.authorized_users.items() if auth]),
             "admin_tg_ids": len(self.admin_tg_ids),
-            "db_connected": self.conn is not None and self.backup_conn is not None
+            "db_connected": self.pool.ping() and self.backup_pool.ping()
         }
 
 
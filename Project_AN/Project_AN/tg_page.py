@@ -1,13 +1,12 @@
 # telegram_bot.py
 import telebot
-import psycopg2
-from psycopg2 import Error
 from telebot import types
 import bcrypt
 import threading
 import time
 from datetime import datetime
 import logging
+import db_pool
 
 # Настройка логирования
 logging.basicConfig(
@@ -17,13 +16,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ================= КОНФИГУРАЦИЯ БД =================
-DB_CONFIG = {
-    "host": "localhost",
-    "dbname": "Your_db_name",
-    "user": "postgres",
-    "password": "Your_password",
-    "port": 5432
-}
+# Параметры подключения — в db_pool.DB_CONFIG
+DB_CONFIG = db_pool.DB_CONFIG
 
 
 class TelegramBot:
@@ -33,14 +27,12 @@ class TelegramBot:
         self.db_config = db_config or DB_CONFIG
         self.on_user_authorized = on_user_authorized  # Callback при авторизации
 
-        # Подключение к БД
-        try:
-            self.conn = psycopg2.connect(**self.db_config)
-            self.conn.autocommit = True
+        # Соединения с БД берём из общего пула процесса
+        self.pool = db_pool.get_pool(self.db_config, caller="schedule_bot")
+        if self.pool.ping():
             logger.info("✅ Подключение к PostgreSQL успешно")
-        except Error as e:
-            logger.error(f"❌ Ошибка БД: {e}")
-            self.conn = None
+        else:
+            logger.error("❌ Ошибка БД: PostgreSQL недоступен")
 
         # Стейты
         self.user_states = {}
@@ -161,19 +153,18 @@ class TelegramBot:
 
         # Проверяем, есть ли уже привязанный аккаунт
         try:
-            if not self.conn:
-                self.bot.send_message(message.chat.id, "❌ Ошибка подключения к базе данных.")
-                return
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT user_id FROM users_tg WHERE tg_id = %s", (tg_id,))
+                linked = cursor.fetchone()
+                cursor.close()
 
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT user_id FROM users_tg WHERE tg_id = %s", (tg_id,))
-            if cursor.fetchone():
+            if linked:
                 self.user_states[tg_id] = "login_password"
                 self.bot.send_message(message.chat.id, "Введите пароль:")
             else:
                 self.bot.send_message(message.chat.id, "У вас нет привязанного аккаунта. Сначала зарегистрируйтесь.",
                                       reply_markup=self.main_keyboard())
-            cursor.close()
         except Exception as e:
             logger.error(f"Ошибка при проверке аккаунта: {e}")
             self.bot.send_message(message.chat.id, f"❌ Ошибка при проверке аккаунта: {str(e)}")
@@ -183,28 +174,21 @@ class TelegramBot:
         password = message.text
 
         try:
-            if not self.conn:
-                self.bot.send_message(message.chat.id, "❌ Ошибка подключения к базе данных.")
-                return
-
-            cursor = self.conn.cursor()
-            # Получаем хеш пароля из users_tg
-            cursor.execute("SELECT password_hash FROM users_tg WHERE tg_id = %s", (tg_id,))
-            row = cursor.fetchone()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                # Получаем хеш пароля, email и user_id из users_tg одним запросом
+                cursor.execute("SELECT password_hash, email, user_id FROM users_tg WHERE tg_id = %s", (tg_id,))
+                row = cursor.fetchone()
+                cursor.close()
 
             if row and bcrypt.checkpw(password.encode('utf-8'), row[0].encode('utf-8')):
                 self.authorized_users.add(tg_id)
-                cursor.execute("SELECT email FROM users_tg WHERE tg_id = %s", (tg_id,))
-                email_result = cursor.fetchone()
-                email = email_result[0] if email_result else "пользователь"
+                email = row[1] or "пользователь"
 
                 # Вызываем callback если он установлен
                 if self.on_user_authorized:
                     try:
-                        cursor.execute("SELECT user_id FROM users_tg WHERE tg_id = %s", (tg_id,))
-                        user_id_result = cursor.fetchone()
-                        if user_id_result:
-                            self.on_user_authorized(user_id_result[0])
+                        self.on_user_authorized(row[2])
                     except Exception as e:
                         logger.error(f"Ошибка в callback: {e}")
 
@@ -212,8 +196,6 @@ class TelegramBot:
                                       reply_markup=self.logout_keyboard())
             else:
                 self.bot.send_message(message.chat.id, "❌ Неверный пароль")
-
-            cursor.close()
         except Exception as e:
             logger.error(f"Ошибка при входе: {e}")
             self.bot.send_message(message.chat.id, f"❌ Произошла ошибка при входе: {str(e)}")
@@ -226,18 +208,16 @@ class TelegramBot:
 
         # Проверяем, не привязан ли уже аккаунт
         try:
-            if not self.conn:
-                self.bot.send_message(message.chat.id, "❌ Ошибка подключения к базе данных.")
-                return
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT user_id FROM users_tg WHERE tg_id = %s", (tg_id,))
+                linked = cursor.fetchone()
+                cursor.close()
 
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT user_id FROM users_tg WHERE tg_id = %s", (tg_id,))
-            if cursor.fetchone():
+            if linked:
                 self.bot.send_message(message.chat.id, "У вас уже есть привязанный аккаунт. Используйте вход.",
                                       reply_markup=self.main_keyboard())
-                cursor.close()
                 return
-            cursor.close()
         except Exception as e:
             logger.error(f"Ошибка при проверке: {e}")
             self.bot.send_message(message.chat.id, f"❌ Ошибка при проверке: {str(e)}")
@@ -252,36 +232,35 @@ class TelegramBot:
 
         # Проверяем email в основной таблице users
         try:
-            if not self.conn:
-                self.bot.send_message(message.chat.id, "❌ Ошибка подключения к базе данных.")
-                self.user_states.pop(tg_id, None)
-                return
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT id_user FROM users WHERE email = %s", (email,))
+                user_exists = cursor.fetchone()
+
+                # Проверяем, не привязан ли уже этот email к другому Telegram аккаунту
+                cursor.execute("SELECT tg_id FROM users_tg WHERE email = %s", (email,))
+                email_linked = cursor.fetchone()
+                cursor.close()
 
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT id_user FROM users WHERE email = %s", (email,))
-            if not cursor.fetchone():
+            if not user_exists:
                 self.bot.send_message(message.chat.id,
                                       "❌ Аккаунт с таким email не найден. Сначала создайте аккаунт на сайте.",
                                       reply_markup=self.main_keyboard())
                 self.user_states.pop(tg_id, None)
-                cursor.close()
                 return
 
-            # Проверяем, не привязан ли уже этот email к другому Telegram аккаунту
-            cursor.execute("SELECT tg_id FROM users_tg WHERE email = %s", (email,))
-            if cursor.fetchone():
+            if email_linked:
                 self.bot.send_message(message.chat.id, "❌ Этот email уже привязан к другому Telegram аккаунту.",
                                       reply_markup=self.main_keyboard())
                 self.user_states.pop(tg_id, None)
-                cursor.close()
                 return
 
             self.user_temp[tg_id] = {"email": email}
             self.user_states[tg_id] = "reg_password"
             self.bot.send_message(message.chat.id, "Введите пароль от вашего аккаунта:")
-            cursor.close()
         except Exception as e:
             logger.error(f"Ошибка при проверке email: {e}")
+            self.user_states.pop(tg_id, None)
             self.bot.send_message(message.chat.id, f"❌ Ошибка при проверке email: {str(e)}")
 
     def handle_register_password(self, message):
@@ -296,29 +275,28 @@ class TelegramBot:
         password = message.text
 
         try:
-            if not self.conn:
-                self.bot.send_message(message.chat.id, "❌ Ошибка подключения к базе данных.")
-                self.user_states.pop(tg_id, None)
-                self.user_temp.pop(tg_id, None)
-                return
-
-            cursor = self.conn.cursor()
-            # Получаем пользователя и проверяем пароль
-            cursor.execute("SELECT id_user, password_hash FROM users WHERE email = %s", (email,))
-            row = cursor.fetchone()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                # Получаем пользователя и проверяем пароль
+                cursor.execute("SELECT id_user, password_hash FROM users WHERE email = %s", (email,))
+                row = cursor.fetchone()
+
+                password_ok = bool(row) and bcrypt.checkpw(password.encode('utf-8'), row[1].encode('utf-8'))
+                if password_ok:
+                    # Привязываем Telegram аккаунт
+                    cursor.execute("""
+                        INSERT INTO users_tg (user_id, tg_id, email, password_hash) 
+                        VALUES (%s, %s, %s, %s)
+                        ON CONFLICT (user_id) DO UPDATE 
+                        SET tg_id = EXCLUDED.tg_id, email = EXCLUDED.email
+                    """, (row[0], tg_id, email, row[1]))
+                    conn.commit()
+                cursor.close()
 
             if not row:
                 self.bot.send_message(message.chat.id, "❌ Аккаунт не найден.",
                                       reply_markup=self.main_keyboard())
-            elif bcrypt.checkpw(password.encode('utf-8'), row[1].encode('utf-8')):
-                # Привязываем Telegram аккаунт
-                cursor.execute("""
-                    INSERT INTO users_tg (user_id, tg_id, email, password_hash) 
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (user_id) DO UPDATE 
-                    SET tg_id = EXCLUDED.tg_id, email = EXCLUDED.email
-                """, (row[0], tg_id, email, row[1]))
-
+            elif password_ok:
                 self.authorized_users.add(tg_id)
 
                 # Вызываем callback если он установлен
@@ -332,8 +310,6 @@ class TelegramBot:
                                       reply_markup=self.logout_keyboard())
             else:
                 self.bot.send_message(message.chat.id, "❌ Неверный пароль")
-
-            cursor.close()
         except Exception as e:
             logger.error(f"Ошибка при регистрации: {e}")
             self.bot.send_message(message.chat.id, f"❌ Произошла ошибка при регистрации: {str(e)}")
@@ -353,28 +329,26 @@ class TelegramBot:
         day_number = int(call.data)
 
         try:
-            if not self.conn:
-                self.bot.send_message(call.message.chat.id, "❌ Ошибка подключения к базе данных.",
-                                      reply_markup=self.main_keyboard())
-                return
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT user_id FROM users_tg WHERE tg_id = %s", (tg_id,))
+                user_row = cursor.fetchone()
+                tasks = []
+                if user_row:
+                    cursor.execute("""
+                        SELECT schedule_tasks.description, TO_CHAR(schedule_tasks.start_time, 'HH24:MI') as start_time
+                        FROM schedule_tasks
+                        INNER JOIN schedule_days ON schedule_tasks.day_id = schedule_days.id_day
+                        WHERE day_of_week = %s AND user_id = %s
+                        ORDER BY schedule_tasks.start_time
+                    """, (day_number, user_row[0]))
+                    tasks = cursor.fetchall()
+                cursor.close()
 
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT user_id FROM users_tg WHERE tg_id = %s", (tg_id,))
-            user_row = cursor.fetchone()
             if not user_row:
                 self.bot.send_message(call.message.chat.id, "❌ Не найден пользователь.",
                                       reply_markup=self.main_keyboard())
                 return
-            user_id = user_row[0]
-
-            cursor.execute("""
-                SELECT schedule_tasks.description, TO_CHAR(schedule_tasks.start_time, 'HH24:MI') as start_time
-                FROM schedule_tasks
-                INNER JOIN schedule_days ON schedule_tasks.day_id = schedule_days.id_day
-                WHERE day_of_week = %s AND user_id = %s
-                ORDER BY schedule_tasks.start_time
-            """, (day_number, user_id))
-            tasks = cursor.fetchall()
 
             if tasks:
                 # Получаем название дня недели
@@ -388,7 +362,6 @@ class TelegramBot:
                 response = f"📅 На этот день задач нет."
 
             self.bot.send_message(call.message.chat.id, response, reply_markup=self.logout_keyboard())
-            cursor.close()
         except Exception as e:
             logger.error(f"Ошибка при получении расписания: {e}")
             self.bot.send_message(call.message.chat.id, f"❌ Ошибка при получении расписания: {str(e)}",
@@ -426,10 +399,13 @@ class TelegramBot:
                 if current_time.endswith(":00") or current_time.endswith(":05") or current_time.endswith(":10"):
                     logger.info(f"🕐 Проверка времени: {current_time}, день недели: {day_number}")
 
-                if self.conn:
-                    cursor = None
-                    try:
-                        cursor = self.conn.cursor()
+                cursor = None
+                try:
+                    with self.pool.connection() as conn:
+                        # Как и раньше — каждый запрос в своей транзакции, чтобы ошибка
+                        # по одному пользователю не блокировала остальных
+                        conn.autocommit = True
+                        cursor = conn.cursor()
 
                         # Получаем всех пользователей, у которых есть привязанный Telegram ID
                         cursor.execute("""
@@ -480,7 +456,7 @@ class TelegramBot:
                                                 # Очищаем tg_id для этого пользователя
                                                 cursor.execute("UPDATE users_tg SET tg_id = NULL WHERE user_id = %s",
                                                                (user_id,))
-                                                self.conn.commit()
+                                                conn.commit()
                                                 logger.info(f"🗑️ Очищен tg_id для пользователя {user_id}")
                                             else:
                                                 logger.error(f"❌ Ошибка отправки пользователю {tg_id}: {send_error}")
@@ -489,14 +465,13 @@ class TelegramBot:
                                 logger.error(f"❌ Ошибка обработки пользователя {tg_id}: {user_error}")
                                 continue
 
-                    except Exception as query_error:
-                        logger.error(f"❌ Ошибка запроса к БД: {query_error}")
-                    finally:
-                        if cursor:
-                            cursor.close()
-                else:
-                    if current_time.endswith(":00"):
-                        logger.warning("⚠ Нет подключения к БД")
+                        cursor.close()
+                        cursor = None
+
+                except Exception as query_error:
+                    logger.error(f"❌ Ошибка запроса к БД: {query_error}")
+                    if cursor and not cursor.closed:
+                        cursor.close()
 
             except Exception as e:
                 logger.error(f"❌ Общая ошибка в schedule_checker: {e}")
@@ -513,12 +488,10 @@ class TelegramBot:
             current_time = now.strftime("%H:%M")
             day_number = now.isoweekday()
 
-            if not self.conn:
-                return "❌ Нет подключения к БД"
-
+            conn = self.pool.getconn()
             cursor = None
             try:
-                cursor = self.conn.cursor()
+                cursor = conn.cursor()
 
                 # Получаем user_id по tg_id
                 cursor.execute("SELECT user_id FROM users_tg WHERE tg_id = %s", (tg_id,))
@@ -588,7 +561,10 @@ class TelegramBot:
             finally:
                 if cursor:
                     cursor.close()
+                self.pool.putconn(conn)
 
+        except db_pool.PoolTimeout:
+            return "❌ Нет подключения к БД"
         except Exception as e:
             return f"❌ Ошибка: {str(e)}"
 
@@ -622,7 +598,7 @@ class TelegramBot:
         return {
             "running": True,
             "authorized_users": len(self.authorized_users),
-            "db_connected": self.conn is not None,
+            "db_connected": self.pool.ping(),
             "total_users": len(self.authorized_users)
         }
 
@@ -0,0 +1,286 @@
+# window_probe.py
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+# Активное окно: имя процесса (без .exe, в нижнем регистре), заголовок, pid
+WindowInfo = namedtuple("WindowInfo", ["process_name", "window_title", "pid"])
+
+BROWSER_PROCESSES = {
+    "chrome", "msedge", "firefox", "chromium", "chromium-browser", "google-chrome",
+    "brave", "opera", "yandex",
+}
+
+
+def normalize_process_name(name):
+    name = (name or "").strip().lower()
+    return name[:-4] if name.endswith(".exe") else name
+
+
+def app_name_from_window(info):
+    """Имя приложения для статистики: (app_name, это_браузер).
+
+    Браузеры сводятся к "Browser" — время по сайтам присылает расширение.
+    """
+    if info is None:
+        return None, False
+    if info.process_name in BROWSER_PROCESSES:
+        return "Browser", True
+    return info.window_title or info.process_name.title(), False
+
+
+class WindowProbe:
+    """Источник сведений об активном окне"""
+
+    name = "base"
+    notifies_changes = False  # wait_for_change просыпается при смене окна, а не только по таймауту
+
+    def active_window(self):
+        """WindowInfo активного окна или None (рабочий стол, нет окна)"""
+        raise NotImplementedError
+
+    def idle_seconds(self):
+        """Секунды с последнего ввода пользователя или None, если неизвестно"""
+        return None
+
+    def wait_for_change(self, timeout):
+        """Ждёт смены активного окна не дольше timeout. True — окно сменилось.
+
+        Без системных уведомлений просто спит: смену заметит следующий опрос.
+        """
+        time.sleep(timeout)
+        return False
+
+
+# ================= WINDOWS =================
+class Win32Probe(WindowProbe):
+    name = "win32"
+    notifies_changes = True   # SetWinEventHook(EVENT_SYSTEM_FOREGROUND)
+
+    def __init__(self):
+        # Импорт здесь: на Linux модуль должен загружаться без pywin32
+        import win32api
+        import win32gui
+        import win32process
+        import psutil
+        self._win32api = win32api
+        self._win32gui = win32gui
+        self._win32process = win32process
+        self._psutil = psutil
+        self._changed = threading.Event()
+        self._hook_thread = None
+
+    def active_window(self):
+        hwnd = self._win32gui.GetForegroundWindow()
+        if not hwnd:
+            return None
+
+        _, pid = self._win32process.GetWindowThreadProcessId(hwnd)
+        window_title = self._win32gui.GetWindowText(hwnd).strip()
+        if window_title in ("Program Manager", ""):
+            return None
+
+        process_name = normalize_process_name(self._psutil.Process(pid).name())
+        return WindowInfo(process_name, window_title, pid)
+
+    def idle_seconds(self):
+        # Счётчики тиков 32-битные и переполняются раз в ~49 дней
+        ticks = (self._win32api.GetTickCount() - self._win32api.GetLastInputInfo()) & 0xFFFFFFFF
+        return ticks / 1000.0
+
+    def wait_for_change(self, timeout):
+        if self._hook_thread is None:
+            self._hook_thread = threading.Thread(target=self._hook_loop, name="foreground_hook", daemon=True)
+            self._hook_thread.start()
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+    def _hook_loop(self):
+        """EVENT_SYSTEM_FOREGROUND через SetWinEventHook; колбэк только будит опрос"""
+        import ctypes
+        from ctypes import wintypes
+
+        EVENT_SYSTEM_FOREGROUND = 0x0003
+        WINEVENT_OUTOFCONTEXT = 0x0000
+        WinEventProc = ctypes.WINFUNCTYPE(
+            None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+            wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD
+        )
+
+        user32 = ctypes.windll.user32
+        # Ссылка на колбэк должна жить, пока установлен хук
+        self._hook_proc = WinEventProc(lambda *args: self._changed.set())
+        hook = user32.SetWinEventHook(EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_FOREGROUND, 0,
+                                      self._hook_proc, 0, 0, WINEVENT_OUTOFCONTEXT)
+        if not hook:
+            print("⚠️ Не удалось подписаться на смену окна, остаётся только опрос")
+            self.notifies_changes = False
+            return
+
+        msg = wintypes.MSG()
+        while user32.GetMessageW(ctypes.byref(msg), 0, 0, 0) > 0:
+            user32.TranslateMessage(ctypes.byref(msg))
+            user32.DispatchMessageW(ctypes.byref(msg))
+        user32.UnhookWinEvent(hook)
+
+
+# ================= LINUX (X11) =================
+_XPROP_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+
+
+def parse_xprop_string(value):
+    """Первая строка из значения xprop: '"a \\"b\\" \\\\ c"' -> 'a "b" \\ c'.
+
+    xprop экранирует кавычку и обратную косую черту, управляющие символы
+    пишет как \\n или восьмеричным \\ooo (байт UTF-8). Значение не в кавычках
+    возвращается как есть.
+    """
+    if not value.startswith('"'):
+        return value
+    out = bytearray()
+    i = 1
+    while i < len(value):
+        char = value[i]
+        if char == '"':
+            break
+        if char == "\\" and i + 1 < len(value):
+            octal = value[i + 1:i + 4]
+            if len(octal) == 3 and all(c in "01234567" for c in octal):
+                out.append(int(octal, 8) & 0xFF)
+                i += 4
+                continue
+            char = _XPROP_ESCAPES.get(value[i + 1], value[i + 1])
+            i += 1
+        out += char.encode("utf-8")
+        i += 1
+    return out.decode("utf-8", "replace")
+
+
+class LinuxX11Probe(WindowProbe):
+    """_NET_ACTIVE_WINDOW через xprop, имя процесса — из /proc/<pid>/comm"""
+
+    name = "x11"
+
+    def __init__(self):
+        if not os.environ.get("DISPLAY"):
+            raise RuntimeError("Нет X11-дисплея (переменная DISPLAY не задана)")
+        self._xprop("-root", "_NET_ACTIVE_WINDOW")  # проверяем, что xprop установлен
+
+    @staticmethod
+    def _xprop(*args):
+        result = subprocess.run(["xprop", *args], capture_output=True, text=True, timeout=2)
+        return result.stdout
+
+    def active_window(self):
+        # "_NET_ACTIVE_WINDOW(WINDOW): window id # 0x3a00007"
+        out = self._xprop("-root", "_NET_ACTIVE_WINDOW")
+        window_id = out.rsplit(" ", 1)[-1].strip()
+        if not window_id.startswith("0x") or int(window_id, 16) == 0:
+            return None
+
+        props = {}
+        for line in self._xprop("-id", window_id, "_NET_WM_PID", "_NET_WM_NAME", "WM_NAME").splitlines():
+            key, _, value = line.partition(" = ")
+            props[key.split("(")[0]] = value.strip()
+
+        # Без _NET_WM_NAME (старые приложения) — заголовок ICCCM WM_NAME
+        title = parse_xprop_string(props.get("_NET_WM_NAME") or props.get("WM_NAME", ""))
+        pid = int(props["_NET_WM_PID"]) if props.get("_NET_WM_PID", "").isdigit() else None
+        process_name = ""
+        if pid:
+            try:
+                with open(f"/proc/{pid}/comm", "r", encoding="utf-8") as f:
+                    process_name = normalize_process_name(f.read())
+            except OSError:
+                pass
+
+        if not title and not process_name:
+            return None
+        return WindowInfo(process_name, title, pid)
+
+    def idle_seconds(self):
+        # xprintidle (XScreenSaver) необязателен: без него простой не определяется
+        if not shutil.which("xprintidle"):
+            return None
+        out = subprocess.run(["xprintidle"], capture_output=True, text=True, timeout=2).stdout.strip()
+        return int(out) / 1000.0 if out.isdigit() else None
+
+
+# ================= СИМУЛЯЦИЯ =================
+DEFAULT_TRACE = [
+    # (процесс, заголовок окна, сколько секунд окно активно)
+    ("code", "mon.py - Anti-Procrastinator - Visual Studio Code", 300),
+    ("chrome", "YouTube - Google Chrome", 120),
+    ("telegram", "Telegram", 45),
+    ("winword", "Отчёт.docx - Word", 600),
+    ("", "", 30),  # рабочий стол / нет активного окна
+    ("discord", "#general | Discord", 90),
+]
+
+
+class SimulatedProbe(WindowProbe):
+    """Детерминированное воспроизведение заранее заданной трассы окон.
+
+    trace — список (process_name, window_title, seconds). Время берётся из
+    clock(): по умолчанию реальное, но для бенчмарков можно передать
+    виртуальные часы и опрашивать тысячи раз в секунду.
+    """
+
+    name = "sim"
+
+    def __init__(self, trace=None, clock=time.monotonic, loop=True):
+        self.trace = [tuple(item) for item in (trace or DEFAULT_TRACE)]
+        self.clock = clock
+        self.loop = loop
+        self._started = clock()
+        self._period = sum(item[2] for item in self.trace)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def active_window(self):
+        elapsed = self.clock() - self._started
+        if self.loop:
+            elapsed %= self._period
+        for process_name, title, seconds in self.trace:
+            if elapsed < seconds:
+                if not process_name and not title:
+                    return None
+                return WindowInfo(normalize_process_name(process_name), title, None)
+            elapsed -= seconds
+        return None
+
+
+# ================= ВЫБОР БЭКЕНДА =================
+def get_probe(name=None):
+    """Бэкенд по имени или переменной MONITOR_PROBE: win32 | x11 | sim.
+
+    По умолчанию выбирается по платформе. Если бэкенд недоступен (нет pywin32,
+    нет X11), возвращается None — мониторинг окон просто не ведётся.
+    """
+    name = name or os.environ.get("MONITOR_PROBE")
+    if not name:
+        name = "win32" if sys.platform == "win32" else "x11"
+
+    try:
+        if name == "win32":
+            return Win32Probe()
+        if name == "x11":
+            return LinuxX11Probe()
+        if name == "sim":
+            trace_path = os.environ.get("MONITOR_SIM_TRACE")
+            return SimulatedProbe.from_file(trace_path) if trace_path else SimulatedProbe()
+    except Exception as e:
+        print(f"⚠️ Бэкенд отслеживания окон '{name}' недоступен: {e}")
+        return None
+
+    print(f"⚠️ Неизвестный бэкенд отслеживания окон: {name}")
+    return None